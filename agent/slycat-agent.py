@@ -140,6 +140,35 @@ def get_file(command):
   sys.stdout.write("%s\n%s" % (json.dumps({"ok": True, "message": "File retrieved.", "path": path, "content-type": content_type, "size": len(content)}), content))
   sys.stdout.flush()
 
+# Handle the 'read-file' command, which returns one block of a file, so large files can be read incrementally.
+def read_file(command):
+  if "path" not in command:
+    raise Exception("Missing path.")
+  path = command["path"]
+  if not os.path.isabs(path):
+    raise Exception("Path must be absolute.")
+  if not os.path.exists(path):
+    raise Exception("Path not found.")
+  if os.path.isdir(path):
+    raise Exception("Directory unreadable.")
+  offset = int(command.get("offset", 0))
+  size = int(command.get("size", 0))
+  if offset < 0 or size < 0:
+    raise Exception("Offset and size must be non-negative.")
+
+  try:
+    with open(path, "rb") as file:
+      file_size = os.fstat(file.fileno()).st_size
+      file.seek(offset)
+      content = file.read(size)
+  except IOError as e:
+    if e.errno == errno.EACCES:
+      raise Exception("Access denied.")
+    raise Exception(e.strerror + ".")
+
+  sys.stdout.write("%s\n%s" % (json.dumps({"ok": True, "message": "File read.", "path": path, "offset": offset, "size": len(content), "file-size": file_size}), content))
+  sys.stdout.flush()
+
 # Handle the 'get-image' command.
 def get_image(command):
   if "path" not in command:
@@ -306,6 +335,8 @@ def main():
         browse(command)
       elif action == "get-file":
         get_file(command)
+      elif action == "read-file":
+        read_file(command)
       elif action == "get-image":
         get_image(command)
       elif action == "create-video":
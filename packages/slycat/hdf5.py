@@ -1,8 +1,11 @@
 import h5py
+import json
 import numbers
 import numpy
 import os
 import slycat.darray
+import threading
+import uuid
 
 class DArray(slycat.darray.Prototype):
   """Slycat darray implementation that stores data in an HDF5 file."""
@@ -65,63 +68,688 @@ class DArray(slycat.darray.Prototype):
     """
     return [dict(name=name, type=type) for name, type in zip(self._metadata["attribute-names"], self._metadata["attribute-types"])]
 
-  def _update_cache(self, attribute_index):
-    attribute_key = "attribute/%s" % attribute_index
+  def _fill_value(self, attribute_index):
+    """Return the value stored in attribute elements that haven't been written."""
+    attribute_dtype = numpy.dtype(dtype(self._metadata["attribute-types"][attribute_index]))
+    if attribute_dtype.char in ["O", "S", "U"]:
+      return ""
+    return numpy.asscalar(numpy.zeros(1, dtype=attribute_dtype)[0])
+
+  def _dictionary(self, attribute_index):
+    """Return the sorted dictionary for a dictionary-encoded attribute, or None."""
+    dictionary_key = "dictionary/%s" % attribute_index
+    if dictionary_key not in self._storage:
+      return None
+    return numpy.asarray(self._dataset(dictionary_key)[...], dtype=object)
+
+  def _encode(self, attribute_index, data):
+    """Convert strings to codes for a dictionary-encoded attribute, adding them to its dictionary if necessary."""
+    data = numpy.asarray(data).astype(object)
+    dictionary = self._dictionary(attribute_index)
+    values, inverse = numpy.unique(data, return_inverse=True)
+    added = values[numpy.invert(numpy.in1d(values, dictionary))]
+    if len(added):
+      # Keep the dictionary sorted, so the order of the codes matches the order of the strings.
+      merged = numpy.union1d(dictionary, added).astype(object)
+      remap = numpy.searchsorted(merged, dictionary).astype("int32")
+      codes = self._writable("attribute/%s" % attribute_index)
+      step = max(1, _compute_chunk_size // max(1, codes.size // max(1, len(codes))))
+      for begin in range(0, len(codes), step):
+        codes[begin : begin + step] = remap[codes[begin : begin + step]]
+      dictionary_key = "dictionary/%s" % attribute_index
+      del self._storage[dictionary_key]
+      self._storage.create_dataset(dictionary_key, data=merged, dtype=dtype("string"))
+      dictionary = merged
+    return numpy.searchsorted(dictionary, values).astype("int32")[inverse].reshape(data.shape)
+
+  def _decode(self, attribute_index):
+    """Replace the codes of a dictionary-encoded attribute with plain strings, and discard its dictionary."""
+    key = "attribute/%s" % attribute_index
+    codes = self._writable(key)
+    dictionary = self._dictionary(attribute_index)
+    options = dict([(name, getattr(codes, name)) for name in ["chunks", "maxshape", "compression", "compression_opts", "shuffle"]])
+    strings = self._storage.create_dataset("decoded/%s" % attribute_index, codes.shape, dtype=dtype("string"), **options)
+    if codes.ndim:
+      step = max(1, _compute_chunk_size // max(1, codes.size // max(1, len(codes))))
+      for begin in range(0, len(codes), step):
+        strings[begin : begin + step] = dictionary[codes[begin : begin + step]]
+    del self._storage[key]
+    self._storage.move("decoded/%s" % attribute_index, key)
+    del self._storage["decoded"]
+    del self._storage["dictionary/%s" % attribute_index]
+
+  def _written(self, attribute_index):
+    """Return the list of regions that have been written to an attribute since its statistics were last computed."""
+    attribute = self._dataset("attribute/%s" % attribute_index)
+    if "written" not in attribute.attrs:
+      return []
+    return [[tuple(extent) for extent in box] for box in attribute.attrs["written"].tolist()]
+
+  def _dataset(self, key):
+    """Return a dataset for reading.
+
+    Datasets shared with another arrayset (see :func:`link_arrayset`) are
+    always opened read-only.  HDF5 would otherwise open the shared file with
+    the same access mode as ours.  Each shared file is opened once, and kept
+    open until :func:`close_linked_files` is called.
+    """
+    link = self._storage.get(key, getlink=True)
+    if isinstance(link, h5py.ExternalLink) and self._storage.file.mode != "r":
+      return _linked_file(self._storage.file, link.filename)[link.path]
+    return self._storage[key]
+
+  def _writable(self, key):
+    """Return a dataset for writing, first replacing a link to a dataset shared with another arrayset by a private copy."""
+    if isinstance(self._storage.get(key, getlink=True), h5py.ExternalLink):
+      shared = self._dataset(key)
+      del self._storage[key]
+      self._storage.copy(shared, key)
+    return self._storage[key]
+
+  def _complete(self, written):
+    """Return True if a list of (non-overlapping) written regions covers the entire darray."""
+    return sum([_volume(box) for box in written]) == self.size
+
+  def _compute_statistics(self, attribute_index):
+    """Compute the min, max, and unique values of an attribute in a single pass, without modifying the file."""
+    attribute = self._dataset("attribute/%s" % attribute_index)
+
+    chunk_size = max(1, _compute_chunk_size // max(1, attribute.size // max(1, len(attribute))))
+    dictionary = self._dictionary(attribute_index)
+    if dictionary is not None:
+      # Find the codes in use, then look up their strings, which are already sorted.
+      used = numpy.zeros(len(dictionary), dtype="bool")
+      for begin in range(0, len(attribute), chunk_size):
+        used[attribute[begin : begin + chunk_size]] = True
+      attribute_unique = dictionary[used]
+      return _minimum(attribute_unique), _maximum(attribute_unique), attribute_unique
+
+    chunks = [_summarize(attribute[begin : begin + chunk_size]) for begin in range(0, len(attribute), chunk_size)]
+    if chunks:
+      attribute_unique = numpy.unique(numpy.concatenate(chunks))
+    else:
+      attribute_unique = numpy.array([], dtype=attribute.dtype)
+
+    return _minimum(attribute_unique), _maximum(attribute_unique), attribute_unique
+
+  def _store_statistics(self, attribute_index, written, attribute_unique):
+    """Persist statistics and unique values for the data in a list of written regions."""
+    attribute = self._writable("attribute/%s" % attribute_index)
     unique_key = "unique/%s" % attribute_index
 
-    attribute = self._storage[attribute_key]
-    if "min" in attribute.attrs and "max" in attribute.attrs and "unique" in attribute.attrs and unique_key in self._storage:
+    if unique_key in self._storage:
+      del self._storage[unique_key]
+    unique = self._storage.create_dataset(unique_key, (len(attribute_unique),), dtype=dtype(self._metadata["attribute-types"][attribute_index]))
+    if len(attribute_unique):
+      unique[...] = attribute_unique
+      attribute.attrs["min"] = _minimum(attribute_unique)
+      attribute.attrs["max"] = _maximum(attribute_unique)
+    else:
+      for key in ["min", "max"]:
+        if key in attribute.attrs:
+          del attribute.attrs[key]
+    attribute.attrs["unique"] = len(attribute_unique)
+
+    if written:
+      attribute.attrs["written"] = numpy.array(written, dtype="int64")
+    elif "written" in attribute.attrs:
+      del attribute.attrs["written"]
+
+  def _flush_statistics(self, attribute_index):
+    """Discard persisted statistics, so they'll be recomputed from scratch by :meth:`update_cache`."""
+    attribute = self._writable("attribute/%s" % attribute_index)
+    unique_key = "unique/%s" % attribute_index
+    if unique_key in self._storage:
+      del self._storage[unique_key]
+    for key in ["min", "max", "unique", "written"]:
+      if key in attribute.attrs:
+        del attribute.attrs[key]
+
+  def _merge_statistics(self, attribute_index, hyperslice, data):
+    """Merge the statistics for newly-written data into the persisted statistics for an attribute."""
+    box = _box(hyperslice, self.shape)
+    if box is None:
+      self._flush_statistics(attribute_index)
+      return
+    if _volume(box) == 0:
       return
 
-    attribute_min = None
-    attribute_max = None
-    attribute_unique = None
-
-    chunk_size = 1000
-    for begin in numpy.arange(0, len(attribute), chunk_size):
-      slice = attribute[begin : begin + chunk_size]
-      if attribute.dtype.char in ["O", "S", "U"]:
-        data_min = min(slice)
-        data_max = max(slice)
-        data_unique = numpy.unique(slice)
-        attribute_min = str(data_min) if attribute_min is None else str(min(data_min, attribute_min))
-        attribute_max = str(data_max) if attribute_max is None else str(max(data_max, attribute_max))
-        attribute_unique = data_unique if attribute_unique is None else numpy.unique(numpy.concatenate((data_unique, attribute_unique)))
-      else:
-        slice = slice[numpy.invert(numpy.isnan(slice))]
-        if len(slice):
-          data_min = numpy.asscalar(slice.min())
-          data_max = numpy.asscalar(slice.max())
-          data_unique = numpy.unique(slice)
-          attribute_min = data_min if attribute_min is None else min(data_min, attribute_min)
-          attribute_max = data_max if attribute_max is None else max(data_max, attribute_max)
-          attribute_unique = data_unique if attribute_unique is None else numpy.unique(numpy.concatenate((data_unique, attribute_unique)))
-
-    if attribute_min is not None:
-      attribute.attrs["min"] = attribute_min
-    if attribute_max is not None:
-      attribute.attrs["max"] = attribute_max
-    if attribute_unique is not None:
-      attribute.attrs["unique"] = len(attribute_unique)
-      self._storage.create_dataset(unique_key, data=attribute_unique, dtype=dtype(self._metadata["attribute-types"][attribute_index]))
+    # Writing the entire attribute replaces its statistics outright.
+    written = self._written(attribute_index)
+    dictionary = self._dictionary(attribute_index)
+    if dictionary is not None:
+      # Dictionary-encoded attributes are passed the codes that were stored.
+      data_unique = dictionary[numpy.unique(data)]
+    else:
+      data_unique = _summarize(numpy.asarray(data).astype(dtype(self._metadata["attribute-types"][attribute_index])))
+    if _volume(box) == self.size:
+      self._store_statistics(attribute_index, [box], data_unique)
+      return
+
+    # Otherwise, we can only merge statistics for regions that haven't been written before.
+    if any([_overlaps(box, previous) for previous in written]):
+      self._flush_statistics(attribute_index)
+      return
+    written = _coalesce(written + [box])
+    if len(written) > _written_limit:
+      self._flush_statistics(attribute_index)
+      return
+
+    self._store_statistics(attribute_index, written, _merge_unique(self._dataset("unique/%s" % attribute_index)[...], data_unique))
+
+  def update_cache(self, attribute=None):
+    """Compute and store statistics, unique values, sort indices, and bitmap indexes for darray attributes.
+
+    Statistics and unique values are normally maintained incrementally by
+    :meth:`set_data`, which falls back to discarding them when the written
+    regions overlap.  Sort indices and bitmap indexes are always discarded by
+    :meth:`set_data`, and bitmap indexes are only created for attributes
+    whose storage policy requests them.
+    Callers should update the cache once they're done writing, while the file
+    is still open for writing.  Readers can then open the file read-only:
+    :meth:`get_statistics`, :meth:`get_unique`, and :meth:`get_sort_index`
+    compute missing values on-the-fly, but never store them.
+
+    Parameters
+    ----------
+    attribute: integer, optional
+      The zero-based integer index of the attribute to be updated.  By
+      default, every attribute that isn't already cached is updated.
+    """
+    attributes = range(len(self.attributes)) if attribute is None else [attribute]
+    for attribute_index in attributes:
+      unique_key = "unique/%s" % attribute_index
+      if unique_key not in self._storage:
+        attribute_min, attribute_max, attribute_unique = self._compute_statistics(attribute_index)
+        self._store_statistics(attribute_index, [tuple([(0, extent) for extent in self.shape])], attribute_unique)
+
+      index_key = "index/%s" % attribute_index
+      ties_key = "ties/%s" % attribute_index
+      if self.ndim == 1 and (index_key not in self._storage or ties_key not in self._storage):
+        index, ties = self._compute_sort_index(attribute_index)
+        for key in [index_key, ties_key]:
+          if key in self._storage:
+            del self._storage[key]
+        self._storage[index_key] = index
+        self._storage[ties_key] = ties
+
+      bitmap_key = "bitmap/%s" % attribute_index
+      if bitmap_key in self._storage and "bitmaps" not in self._storage[bitmap_key]:
+        self._store_bitmap_index(attribute_index)
+
+  def _unique(self, attribute_index):
+    """Return the unique values for an attribute, including the fill value for any elements that haven't been written."""
+    unique_key = "unique/%s" % attribute_index
+    if unique_key not in self._storage:
+      return self._compute_statistics(attribute_index)[2]
+    attribute_unique = self._dataset(unique_key)[...]
+    if not self._complete(self._written(attribute_index)):
+      attribute_unique = _merge_unique(attribute_unique, numpy.array([self._fill_value(attribute_index)], dtype=attribute_unique.dtype))
+    return attribute_unique
 
   def get_statistics(self, attribute):
-    self._update_cache(attribute)
+    unique_key = "unique/%s" % attribute
+    if unique_key not in self._storage or not self._complete(self._written(attribute)):
+      attribute_unique = self._unique(attribute)
+      return {
+        "min": _minimum(attribute_unique),
+        "max": _maximum(attribute_unique),
+        "unique": len(attribute_unique) if len(attribute_unique) else None,
+        }
 
-    attribute = self._storage["attribute/%s" % attribute]
+    attribute = self._dataset("attribute/%s" % attribute)
     return {
       "min": attribute.attrs.get("min", None),
       "max": attribute.attrs.get("max", None),
-      "unique": attribute.attrs.get("unique", None),
+      "unique": attribute.attrs.get("unique", None) or None,
       }
 
   def get_unique(self, attribute, hyperslice):
-    self._update_cache(attribute)
+    unique_key = "unique/%s" % attribute
+    if unique_key not in self._storage or not self._complete(self._written(attribute)):
+      return {
+        "values": self._unique(attribute)[hyperslice]
+        }
 
     return {
-      "values": self._storage["unique/%s" % attribute][hyperslice]
+      "values": self._dataset(unique_key)[hyperslice]
       }
 
+  def _compute_sort_index(self, attribute_index):
+    """Compute the stable ascending sort index for an attribute, and the runs of tied values within it."""
+    encoding = self.get_encoding(attribute_index)
+    values = self.get_data(attribute_index)[...] if encoding is None else encoding[0][...]
+    index = numpy.argsort(values, kind="mergesort")
+    return index, _ties(values[index])
+
+  def get_sort_index(self, attribute, descending=False):
+    """Return the indices that would stably sort a 1D darray attribute.
+
+    Both orderings are stable: elements with equal values keep their original
+    relative order.  The ascending index and the runs of tied values within it
+    are cached by :meth:`update_cache`, so the descending index is derived
+    without sorting again.
+
+    Parameters
+    ----------
+    attribute: integer
+      The zero-based integer index of the attribute to be sorted.
+    descending: boolean, optional
+      Return indices that sort the attribute in descending order.
+
+    Returns
+    -------
+    index: numpy.ndarray
+    """
+    if self.ndim != 1:
+      raise ValueError("Sort indices are only available for 1D darrays.")
+
+    index_key = "index/%s" % attribute
+    ties_key = "ties/%s" % attribute
+    if index_key in self._storage and (not descending or ties_key in self._storage):
+      index = self._dataset(index_key)[...]
+      ties = self._dataset(ties_key)[...] if descending else None
+    else:
+      index, ties = self._compute_sort_index(attribute)
+
+    if descending:
+      index = _reverse_stable(index, ties)
+    return index
+
+  def _lod_key(self, x, y, index):
+    """Return the storage key for the level-of-detail pyramid of a pair of attributes."""
+    if len(index) != self.ndim - 1:
+      raise ValueError("Expected %s leading indices to select a 1D slice of the darray." % (self.ndim - 1))
+    for attribute in [x, y]:
+      if not (0 <= attribute and attribute < len(self.attributes)):
+        raise ValueError("Attribute index %s out-of-range." % attribute)
+      if self.attributes[attribute]["type"] == "string":
+        raise ValueError("Level-of-detail summaries require numeric attributes.")
+    return "lod/%s" % "-".join([str(int(value)) for value in (x, y) + tuple(index)])
+
+  def _lod_values(self, attribute, index):
+    """Return an array-like object that reads one 1D slice of an attribute."""
+    data = self.get_data(attribute)
+    class SliceWrapper(object):
+      def __getitem__(self, key):
+        return numpy.asarray(data[tuple(index) + (key,)], dtype="float64")
+    return SliceWrapper()
+
+  def _compute_lod(self, x, y, index):
+    """Compute the level-of-detail pyramid for a pair of attributes, without modifying the file."""
+    xs = self._lod_values(x, index)[...]
+    ys = self._lod_values(y, index)[...]
+    rows = numpy.flatnonzero(numpy.logical_and(numpy.isfinite(xs), numpy.isfinite(ys)))
+    xs = xs[rows]
+    ys = ys[rows]
+    bounds = numpy.array([xs.min(), xs.max(), ys.min(), ys.max()] if len(rows) else [0, 0, 0, 0], dtype="float64")
+
+    # Sort points by the Z-order code of their bin at the finest level, so every bin at every level is a contiguous run.
+    size = 1 << _lod_levels
+    codes = _interleave(_bins(xs, bounds[0], bounds[1], size)) | (_interleave(_bins(ys, bounds[2], bounds[3], size)) << 1)
+    order = numpy.argsort(codes, kind="mergesort")
+    codes = codes[order]
+    rows = rows[order]
+
+    pyramid = {"bounds": bounds, "rows": rows}
+    begins = numpy.flatnonzero(numpy.concatenate(([True], codes[1:] != codes[:-1]))) if len(codes) else numpy.zeros(0, dtype="int64")
+    codes = codes[begins]
+    counts = numpy.diff(numpy.concatenate((begins, [len(rows)]))).astype("int64")
+    representatives = rows[begins]
+    for level in range(_lod_levels, -1, -1):
+      pyramid["level/%s/codes" % level] = codes
+      pyramid["level/%s/counts" % level] = counts
+      pyramid["level/%s/rows" % level] = representatives
+      # Each bin's parent has the same code, less its two lowest bits.
+      parents = codes >> 2
+      begins = numpy.flatnonzero(numpy.concatenate(([True], parents[1:] != parents[:-1]))) if len(parents) else numpy.zeros(0, dtype="int64")
+      codes = parents[begins]
+      counts = numpy.add.reduceat(counts, begins) if len(begins) else counts
+      representatives = representatives[begins]
+    return pyramid
+
+  def update_lod(self, x, y, index=()):
+    """Compute and store the level-of-detail pyramid used by :meth:`get_lod` for a pair of attributes.
+
+    Pyramids are discarded by :meth:`set_data` whenever either attribute is
+    modified.  Like :meth:`update_cache`, this must be called while the file
+    is open for writing.
+
+    Parameters
+    ----------
+    x, y: integer
+      The zero-based integer indices of the numeric attributes to be plotted.
+    index: tuple of integers, optional
+      For darrays with more than one dimension, indices along the leading
+      dimensions that select the 1D slice to be plotted.
+    """
+    key = self._lod_key(x, y, index)
+    if key in self._storage:
+      del self._storage[key]
+    pyramid = self._compute_lod(x, y, index)
+    group = self._storage.create_group(key)
+    for name, values in pyramid.items():
+      group[name] = values
+
+  def has_lod(self, x, y, index=()):
+    """Return True if the level-of-detail pyramid for a pair of attributes has been stored by :meth:`update_lod`."""
+    return self._lod_key(x, y, index) in self._storage
+
+  def get_lod(self, x, y, viewport=None, resolution=(256, 256), limit=10000, index=()):
+    """Summarize the points within a viewport of a scatterplot of two attributes.
+
+    If the viewport contains no more than `limit` points, they're returned
+    as-is.  Otherwise, the viewport is covered with square bins, no smaller
+    than one pixel at the given resolution, and the number of points in each
+    non-empty bin is returned, along with one representative point per bin.
+    Bins come from a multi-resolution pyramid, so the cost depends on the
+    size of the result, not the number of points.  The pyramid is stored by
+    :meth:`update_lod`, or computed on-the-fly (but not stored) if missing.
+    Points with NaN or infinite coordinates are ignored.
+
+    Parameters
+    ----------
+    x, y: integer
+      The zero-based integer indices of the numeric attributes to be plotted.
+    viewport: sequence of four numbers, optional
+      The (xmin, xmax, ymin, ymax) region to be summarized.  Defaults to the
+      bounds of the data.
+    resolution: sequence of two integers, optional
+      The (width, height) of the viewport in pixels.
+    limit: integer, optional
+      Largest number of points that will be returned as-is.
+    index: tuple of integers, optional
+      For darrays with more than one dimension, indices along the leading
+      dimensions that select the 1D slice to be plotted.
+
+    Returns
+    -------
+    summary: dict
+      Always contains "type" ("points" or "bins") and "count", the number of
+      points in the viewport (for bins, the number of points in bins that
+      overlap the viewport).  Points are returned as "rows", "x", and "y"
+      arrays, ordered by row.  Bins are returned as "level", "bin-width",
+      "bin-height", and a "bins" dict containing "x" and "y" arrays of the
+      lower-left corner of each bin, their "counts", and the "rows",
+      "x-values", and "y-values" of their representative points.
+    """
+    key = self._lod_key(x, y, index)
+    if key in self._storage:
+      read = lambda name: self._dataset("%s/%s" % (key, name))
+    else:
+      pyramid = self._compute_lod(x, y, index)
+      read = lambda name: pyramid[name]
+    bounds = read("bounds")[...]
+
+    xmin, xmax, ymin, ymax = [float(value) for value in (bounds if viewport is None else viewport)]
+    if xmin > xmax or ymin > ymax:
+      raise ValueError("Viewport must be specified as xmin, xmax, ymin, ymax.")
+    width, height = [int(value) for value in resolution]
+    if width < 1 or height < 1:
+      raise ValueError("Resolution must be at least one pixel.")
+
+    def overlapping(level):
+      codes = read("level/%s/codes" % level)[...]
+      counts = read("level/%s/counts" % level)[...]
+      size = 1 << level
+      bx = _deinterleave(codes)
+      by = _deinterleave(codes >> 1)
+      xbegin, xend = _bin_range(bounds[0], bounds[1], xmin, xmax, size)
+      ybegin, yend = _bin_range(bounds[2], bounds[3], ymin, ymax, size)
+      mask = (bx >= xbegin) & (bx <= xend) & (by >= ybegin) & (by <= yend)
+      return mask, counts, bx[mask], by[mask]
+
+    mask, counts, bx, by = overlapping(_lod_levels)
+    count = int(counts[mask].sum())
+    if count <= limit:
+      # Find the points in the overlapping finest-level bins, then drop the ones outside the viewport.
+      offsets = (numpy.cumsum(counts) - counts)[mask]
+      counts = counts[mask]
+      positions = numpy.repeat(offsets - (numpy.cumsum(counts) - counts), counts) + numpy.arange(count)
+      rows = numpy.sort(RowGather(positions).read(read("rows")))
+      gather = RowGather(rows)
+      xs = gather.read(self._lod_values(x, index))
+      ys = gather.read(self._lod_values(y, index))
+      inside = (xs >= xmin) & (xs <= xmax) & (ys >= ymin) & (ys <= ymax)
+      return {"type": "points", "count": int(inside.sum()), "rows": rows[inside], "x": xs[inside], "y": ys[inside]}
+
+    # Use the finest level whose bins are at least one pixel in size.
+    scales = [(bounds[1] - bounds[0]) / (xmax - xmin) * width if xmax > xmin else 1, (bounds[3] - bounds[2]) / (ymax - ymin) * height if ymax > ymin else 1]
+    level = int(numpy.clip(numpy.floor(numpy.log2(max(min(scales), 1))), 0, _lod_levels))
+    mask, counts, bx, by = overlapping(level)
+    rows = read("level/%s/rows" % level)[...][mask]
+    gather = RowGather(rows)
+    bin_width = (bounds[1] - bounds[0]) / (1 << level)
+    bin_height = (bounds[3] - bounds[2]) / (1 << level)
+    return {
+      "type": "bins",
+      "count": int(counts[mask].sum()),
+      "level": level,
+      "bin-width": float(bin_width),
+      "bin-height": float(bin_height),
+      "bins": {
+        "x": bounds[0] + bx * bin_width,
+        "y": bounds[2] + by * bin_height,
+        "counts": counts[mask],
+        "rows": rows,
+        "x-values": gather.read(self._lod_values(x, index)),
+        "y-values": gather.read(self._lod_values(y, index)),
+        },
+      }
+
+  @property
+  def version(self):
+    """Return a string that changes whenever the darray is modified, for use in cache keys.
+
+    Returns
+    -------
+    version: string, or None for darrays created before versions were recorded.
+    """
+    return self._storage.attrs.get("version", None)
+
+  def _sorted_values(self, attribute):
+    """Return an array-like object that reads an attribute's values in sorted order using its cached sort index, or None."""
+    index_key = "index/%s" % attribute
+    if self.ndim != 1 or index_key not in self._storage or "dictionary/%s" % attribute in self._storage:
+      return None
+    index = self._dataset(index_key)
+    data = self._dataset("attribute/%s" % attribute)
+    class SortedValues(object):
+      def __len__(self):
+        return len(index)
+      def __getitem__(self, position):
+        return data[int(index[position])]
+    return SortedValues()
+
+  def get_histogram(self, attribute, bins=10, quantiles=False):
+    """Count the values of a numeric darray attribute that fall into each of a set of bins.
+
+    When the sort index for a 1D darray attribute has been cached by
+    :meth:`update_cache`, the counts are found by binary searches of the
+    sorted values, so the cost depends on the number of bins, not the number
+    of values.  Otherwise, the entire attribute is read.  NaNs are ignored.
+
+    Parameters
+    ----------
+    attribute: integer
+      The zero-based integer index of the attribute.
+    bins: integer or sequence of numbers, optional
+      The number of equal-width bins spanning the attribute's minimum and
+      maximum values, or a monotonically increasing sequence of bin edges.
+      Like :func:`numpy.histogram`, every bin is half-open, except the last,
+      which includes its upper edge, so a pair of edges counts the values in
+      a closed range.
+    quantiles: bool, optional
+      Choose edges so that each of the `bins` bins contains (as nearly as
+      ties allow) the same number of values.
+
+    Returns
+    -------
+    histogram: dict
+      Contains "edges" and "counts" as :class:`numpy.ndarray`.
+    """
+    if self.attributes[attribute]["type"] == "string":
+      raise ValueError("Histograms require numeric attributes.")
+    values = self._sorted_values(attribute)
+    if values is None:
+      return histogram(self.get_data(attribute)[...], bins, quantiles)
+
+    count = _search(values, numpy.inf, "right")
+    if quantiles:
+      edges = numpy.array([values[int(position)] for position in numpy.round(numpy.linspace(0, count - 1, _bin_count(bins) + 1))] if count else numpy.linspace(0, 1, _bin_count(bins) + 1), dtype="float64")
+    elif numpy.ndim(bins) == 0:
+      edges = _edges(values[0] if count else None, values[count - 1] if count else None, bins)
+    else:
+      edges = _require_edges(bins)
+
+    positions = []
+    for edge in edges[:-1]:
+      positions.append(_search(values, edge, "left", positions[-1] if positions else 0, count))
+    positions.append(_search(values, edges[-1], "right", positions[-1] if positions else 0, count))
+    return {"edges": edges, "counts": numpy.diff(positions).astype("int64")}
+
+  def _compute_bitmap_index(self, attribute_index):
+    """Compute the bitmap index for an attribute, without modifying the file.
+
+    Attributes with at most `_bitmap_cardinality` distinct values get one
+    bitmap per value, plus a bitmap of every non-NaN element.  Other numeric
+    attributes are split into (up to) `_bitmap_bins` bins containing roughly
+    equal numbers of values, and get one cumulative bitmap per bin, marking
+    the elements in that bin or any lower bin.  Their sorted values, and the
+    position of each bin within them, are stored too, so the elements in a
+    single bin can be checked without reading the attribute.  Bitmaps are
+    packed with :func:`numpy.packbits`, and NaNs don't appear in any bitmap.
+    Returns None for strings with too many distinct values.
+    """
+    # The sort index groups equal values (and the elements in each bin) into contiguous runs, with NaNs last.
+    values = self.get_data(attribute_index)[...]
+    rows = self.get_sort_index(attribute_index)
+    ordered = values[rows]
+    count = len(ordered) - numpy.count_nonzero(numpy.isnan(ordered)) if ordered.dtype.char in ["e", "f", "d", "g"] else len(ordered)
+    rows = rows[:count]
+    ordered = ordered[:count]
+    size = (len(values) + 7) // 8
+
+    changes = numpy.flatnonzero(ordered[1:] != ordered[:-1]) + 1
+    if len(changes) < _bitmap_cardinality:
+      begins = numpy.concatenate(([0], changes)).astype("int64") if count else changes
+      index = {"values": ordered[begins], "valid": _pack_rows(rows, size)}
+      boundaries = numpy.concatenate((begins, [count])).astype("int64")
+    elif self.attributes[attribute_index]["type"] == "string":
+      return None
+    else:
+      edges = numpy.unique(ordered[numpy.round(numpy.linspace(0, count - 1, _bitmap_bins + 1)).astype("int64")])
+      boundaries = numpy.concatenate((numpy.searchsorted(ordered, edges[:-1]), [count])).astype("int64")
+      index = {"edges": edges, "sorted": ordered, "boundaries": boundaries}
+
+    bitmaps = numpy.zeros((len(boundaries) - 1, size), dtype="uint8")
+    for bin, (begin, end) in enumerate(zip(boundaries[:-1], boundaries[1:])):
+      if "edges" in index and bin > 0:
+        bitmaps[bin] = bitmaps[bin - 1]
+      bitmaps[bin] |= _pack_rows(rows[begin:end], size)
+    index["bitmaps"] = bitmaps
+    return index
+
+  def _store_bitmap_index(self, attribute_index):
+    """Compute and store the bitmap index for an attribute, compressing each bitmap."""
+    group = self._storage["bitmap/%s" % attribute_index]
+    for key in group.keys():
+      del group[key]
+    index = self._compute_bitmap_index(attribute_index) if self.size else None
+    if index is None:
+      return
+    if "values" in index:
+      group.create_dataset("values", data=index["values"], dtype=dtype(self.attributes[attribute_index]["type"]))
+      group.create_dataset("valid", data=index["valid"], compression="gzip", compression_opts=4)
+    else:
+      group["edges"] = index["edges"]
+      group["sorted"] = index["sorted"]
+      group["boundaries"] = index["boundaries"]
+    bitmaps = index["bitmaps"]
+    group.create_dataset("bitmaps", data=bitmaps, chunks=(1, min(bitmaps.shape[1], _storage_chunk_size)), compression="gzip", compression_opts=4)
+
+  def _check_bitmap_bin(self, attribute, edges, operator, constant):
+    """Compare the values in the bin of a binned bitmap index that contains a constant, returning a packed bitmap of the matches.
+
+    The bin's values are a contiguous range of the sorted values, and the
+    matching elements are a contiguous range of the attribute's sort index.
+    """
+    bin = int(_bitmap_bin(edges, constant))
+    begin, end = self._dataset("bitmap/%s/boundaries" % attribute)[bin:bin + 2]
+    values = self._dataset("bitmap/%s/sorted" % attribute)[begin:end]
+    if operator in ["<", "<="]:
+      begin, end = begin, begin + numpy.searchsorted(values, constant, "left" if operator == "<" else "right")
+    elif operator in [">", ">="]:
+      begin, end = begin + numpy.searchsorted(values, constant, "right" if operator == ">" else "left"), end
+    else:
+      begin, end = begin + numpy.searchsorted(values, constant, "left"), begin + numpy.searchsorted(values, constant, "right")
+    return _pack_rows(self._dataset("index/%s" % attribute)[begin:end], (self.size + 7) // 8)
+
+  def get_bitmap(self, attribute, operator, value):
+    """Use an attribute's bitmap index to find the elements that satisfy a comparison.
+
+    Bitmap indexes are created for attributes of 1D darrays whose storage
+    policy requests them (see :class:`StoragePolicy`), and are stored by
+    :meth:`update_cache`.  With one bitmap per distinct value, a comparison
+    reads the bitmaps of the matching values.  With binned bitmaps, it reads
+    at most three bitmaps, plus the values of the elements in the bin that
+    contains the constant.  The results match comparing the attribute values
+    using numpy.
+
+    Parameters
+    ----------
+    attribute: integer
+      The zero-based integer index of the attribute.
+    operator: string
+      One of "<", ">", "<=", ">=", "==", "!=", "in", or "not in".
+    value: number, string, or list of numbers or strings
+      The constant to compare with, or a list of constants for "in" and
+      "not in".
+
+    Returns
+    -------
+    bitmap: :class:`numpy.ndarray` of uint8, or None.
+      The matching elements, packed with :func:`numpy.packbits`, or None if
+      the attribute doesn't have a bitmap index, or the comparison can't be
+      answered with it.
+    """
+    key = "bitmap/%s" % attribute
+    if self.ndim != 1 or "%s/bitmaps" % key not in self._storage or "index/%s" % attribute not in self._storage or operator not in ["<", ">", "<=", ">=", "==", "!=", "in", "not in"]:
+      return None
+    constants = value if operator in ["in", "not in"] else [value]
+    string = self.attributes[attribute]["type"] == "string"
+    if not isinstance(constants, list) or not all([isinstance(constant, basestring) if string else isinstance(constant, numbers.Real) for constant in constants]):
+      return None
+    membership = operator in ["==", "!=", "in", "not in"]
+    if string and not membership:
+      return None
+
+    bitmaps = self._dataset("%s/bitmaps" % key)
+    if "%s/values" % key in self._storage:
+      matches = _bitmap_operators["in" if membership else operator](self._dataset("%s/values" % key)[...], constants)
+      # Read whichever is smaller: the bitmaps of the matching values, or the bitmaps of the others.
+      complement = numpy.count_nonzero(matches) * 2 > len(matches)
+      result = numpy.zeros(bitmaps.shape[1], dtype="uint8")
+      for match in numpy.flatnonzero(numpy.invert(matches) if complement else matches):
+        result |= bitmaps[int(match)]
+      if complement:
+        result = self._dataset("%s/valid" % key)[...] & numpy.invert(result)
+    else:
+      edges = self._dataset("%s/edges" % key)[...]
+      if membership:
+        result = numpy.zeros(bitmaps.shape[1], dtype="uint8")
+        for constant in constants:
+          result |= self._check_bitmap_bin(attribute, edges, "==", constant)
+      else:
+        # Every element in a lower (or higher) bin than the constant matches, so only its own bin needs to be checked.
+        bin = int(_bitmap_bin(edges, constants[0]))
+        result = self._check_bitmap_bin(attribute, edges, operator, constants[0])
+        if operator in ["<", "<="] and bin > 0:
+          result |= bitmaps[bin - 1]
+        elif operator in [">", ">="]:
+          result |= bitmaps[len(edges) - 2] & numpy.invert(bitmaps[bin])
+    return numpy.invert(result) if operator in ["!=", "not in"] else result
+
   def get_data(self, attribute):
     """Return a reference to the data storage for a darray attribute.
 
@@ -145,11 +773,49 @@ class DArray(slycat.darray.Prototype):
         self._dtype = dtype
       def __getitem__(self, *args, **kwargs):
         result = self._storage.__getitem__(*args, **kwargs)
-        return result.astype(self._dtype)
+        return result.astype(self._dtype, copy=False)
+
+    class DictionaryWrapper(object):
+      """Decodes data retrieved from a dictionary-encoded attribute, converting only the dictionary to the attribute dtype."""
+      def __init__(self, storage, dictionary):
+        self._storage = storage
+        self._dictionary = dictionary
+      def __getitem__(self, *args, **kwargs):
+        return self._dictionary[self._storage.__getitem__(*args, **kwargs)]
+
+    dictionary = self._dictionary(attribute)
+    if dictionary is not None:
+      return DictionaryWrapper(self._dataset("attribute/%s" % attribute), dictionary.astype(self._metadata["attribute-types"][attribute]))
+    return StorageWrapper(self._dataset("attribute/%s" % attribute), self._metadata["attribute-types"][attribute])
 
-    return StorageWrapper(self._storage["attribute/%s" % attribute], self._metadata["attribute-types"][attribute])
+  def get_encoding(self, attribute):
+    """Return the codes and dictionary for a dictionary-encoded attribute.
 
-  def set_data(self, attribute, hyperslice, data):
+    Dictionary-encoded string attributes store an integer code for each
+    element, and a sorted dictionary of strings, so comparing codes is
+    equivalent to comparing the strings.  Callers can operate on the codes
+    (to filter or sort) and only decode the results, using
+    `dictionary[codes]`.
+
+    Parameters
+    ----------
+    attribute: integer
+      The zero-based integer index of the attribute.
+
+    Returns
+    -------
+    encoding: None, or a (codes, dictionary) tuple.
+      None if the attribute isn't dictionary-encoded.  Otherwise, `codes` is
+      a reference to the integer code storage, which isn't read until you
+      access it using the `[]` operator, and `dictionary` is a
+      :class:`numpy.ndarray` of strings.
+    """
+    dictionary = self._dictionary(attribute)
+    if dictionary is None:
+      return None
+    return self._dataset("attribute/%s" % attribute), dictionary
+
+  def set_data(self, attribute, hyperslice, data, statistics=True):
     """Overwrite the contents of a darray attribute.
 
     Parameters
@@ -160,6 +826,10 @@ class DArray(slycat.darray.Prototype):
       Defines the attribute region to be overwritten.
     data : numpy.ndarray
       Data to be written to the attribute.
+    statistics : bool, optional
+      Merge the data into the cached statistics and unique values.  Use False
+      to discard them instead, which is faster when writing an attribute in
+      many pieces, followed by a call to :meth:`update_cache`.
     """
 
     if not (0 <= attribute and attribute < len(self.attributes)):
@@ -174,26 +844,195 @@ class DArray(slycat.darray.Prototype):
       raise ValueError("Unsupported hyperslice type.")
 
     # Store the data.
-    attribute_storage = self._storage["attribute/%s" % attribute]
+    attribute_storage = self._writable("attribute/%s" % attribute)
+    if "dictionary/%s" % attribute in self._storage:
+      data = self._encode(attribute, data)
     attribute_storage[hyperslice] = data
+    _update_version(self._storage)
 
     # Flush cached sort indices.
-    index_key = "index/%s" % attribute
-    if index_key in self._storage:
-      del self._storage[index_key]
+    for key in ["index/%s" % attribute, "ties/%s" % attribute]:
+      if key in self._storage:
+        del self._storage[key]
 
-    # Flush cached unique values.
-    unique_key = "unique/%s" % attribute
-    if unique_key in self._storage:
-      del self._storage[unique_key]
+    # Flush the bitmap index, keeping its group so update_cache() recreates it.
+    if "bitmap/%s" % attribute in self._storage:
+      for key in self._storage["bitmap/%s" % attribute].keys():
+        del self._storage["bitmap/%s/%s" % (attribute, key)]
+
+    # Flush level-of-detail pyramids that plot the attribute.
+    if "lod" in self._storage:
+      for key in self._storage["lod"].keys():
+        if attribute in [int(value) for value in key.split("-")[:2]]:
+          del self._storage["lod/%s" % key]
+
+    # Update cached statistics and unique values.
+    if "unique/%s" % attribute in self._storage:
+      if statistics:
+        self._merge_statistics(attribute, hyperslice, data)
+      else:
+        self._flush_statistics(attribute)
+
+  def append(self, data):
+    """Append rows to a resizable 1D darray.
+
+    Parameters
+    ----------
+    data : list of numpy.ndarray
+      One array of new values for each darray attribute.  Every array must
+      contain the same number of values.
+
+    Every new string added to the dictionary of a dictionary-encoded
+    attribute rewrites the codes stored so far, so an attribute whose
+    dictionary would grow past `_dictionary_limit` strings is converted to
+    plain strings instead.
+    """
+    if len(data) != len(self.attributes):
+      raise ValueError("Expected data for %s attributes." % len(self.attributes))
+    count = len(data[0]) if data else 0
+    if any([len(values) != count for values in data]):
+      raise ValueError("Every attribute must have the same number of new values.")
+
+    begin = self.shape[0]
+    end = begin + count
+    self._metadata["dimension-end"][0] = end
+    for attribute_index, values in enumerate(data):
+      dictionary = self._dictionary(attribute_index)
+      if dictionary is not None and len(numpy.union1d(dictionary, numpy.asarray(values).astype(object))) > _dictionary_limit:
+        self._decode(attribute_index)
+      self._writable("attribute/%s" % attribute_index).resize((end,))
+      self.set_data(attribute_index, slice(begin, end), values)
+
+class StoragePolicy(object):
+  """Describes how the attributes of an array are laid out on disk.
+
+  The default policy stores each attribute as a single contiguous, uncompressed
+  dataset.  A chunked policy splits attributes into chunks of roughly
+  `chunk_size` bytes, which can be compressed.  Chunks are shaped by
+  repeatedly halving the largest dimension of the array, so a 1D attribute is
+  stored as runs of rows, and a 2D attribute as roughly square tiles (or as
+  whole rows, for arrays with only a few columns), giving good locality for
+  both row-range and column-slab reads.
+
+  Parameters
+  ----------
+  chunked : boolean, optional.
+    Store attributes in chunks.  Implied by `compression` and `shuffle`.
+  chunk_size : integer, optional.
+    Approximate size of each chunk, in bytes.
+  compression : "gzip", "lzf", or None, optional.
+    Compression filter to apply to each chunk.
+  compression_opts : integer, optional.
+    Compression level for gzip, from 0 to 9.
+  shuffle : boolean, optional.
+    Apply the byte shuffle filter before compression, which usually improves
+    the compression of numeric data.
+  dictionary : boolean, optional.
+    Store string attributes as integer codes plus a sorted dictionary of
+    their distinct values, which is much smaller and faster for attributes
+    with few distinct values, such as categories.  Doesn't affect other types
+    of attribute.  See :meth:`DArray.get_encoding`.
+  bitmap : boolean, optional.
+    Maintain a bitmap index for each attribute of a 1D array, which
+    :meth:`DArray.update_cache` stores, compressed, alongside the data.
+    Comparisons with the attribute can then be answered without reading
+    every value.  See :meth:`DArray.get_bitmap`.
+  """
+  def __init__(self, chunked=False, chunk_size=None, compression=None, compression_opts=None, shuffle=False, dictionary=False, bitmap=False):
+    if compression not in [None, "gzip", "lzf"]:
+      raise ValueError("Unsupported compression filter: %s" % compression)
+    if compression_opts is not None and compression != "gzip":
+      raise ValueError("Compression options are only supported for gzip.")
+    if chunk_size is not None and chunk_size < 1:
+      raise ValueError("Chunk size must be positive.")
+    self.chunked = bool(chunked or compression is not None or shuffle)
+    self.chunk_size = chunk_size
+    self.compression = compression
+    self.compression_opts = compression_opts
+    self.shuffle = bool(shuffle)
+    self.dictionary = bool(dictionary)
+    self.bitmap = bool(bitmap)
 
-    # Flush cached statistics.
-    if "min" in attribute_storage.attrs:
-      del attribute_storage.attrs["min"]
-    if "max" in attribute_storage.attrs:
-      del attribute_storage.attrs["max"]
-    if "unique" in attribute_storage.attrs:
-      del attribute_storage.attrs["unique"]
+  def __eq__(self, other):
+    return isinstance(other, StoragePolicy) and self.to_json() == other.to_json()
+
+  def __ne__(self, other):
+    return not self == other
+
+  def __repr__(self):
+    return "StoragePolicy(**%r)" % self.to_json()
+
+  def to_json(self):
+    """Return a JSON-compatible dict that can be used to recreate the policy."""
+    return {"chunked": self.chunked, "chunk_size": self.chunk_size, "compression": self.compression, "compression_opts": self.compression_opts, "shuffle": self.shuffle, "dictionary": self.dictionary, "bitmap": self.bitmap}
+
+  def chunks(self, shape, stored_type):
+    """Return the chunk shape for an attribute, or None if it should be stored contiguously.
+
+    Parameters
+    ----------
+    shape : tuple of integers, required.
+      Shape of the attribute.
+    stored_type : dtype, required.
+      Type of the attribute, as returned by :func:`dtype`.
+    """
+    if not self.chunked or not shape or 0 in shape:
+      return None
+    elements = max(1, (self.chunk_size or _storage_chunk_size) // numpy.dtype(stored_type).itemsize)
+    chunks = list(shape)
+    while numpy.prod(chunks) > elements:
+      largest = numpy.argmax(chunks)
+      chunks[largest] = (chunks[largest] + 1) // 2
+    return tuple(chunks)
+
+  def options(self, shape, stored_type, resizable=False):
+    """Return keyword arguments for :meth:`h5py.Group.create_dataset` that implement the policy.
+
+    Parameters
+    ----------
+    shape : tuple of integers, required.
+      Shape of the attribute.
+    stored_type : dtype, required.
+      Type of the attribute, as returned by :func:`dtype`.
+    resizable : boolean, optional.
+      Create a 1D attribute that can be resized with :meth:`DArray.append`.
+    """
+    options = {}
+    if resizable:
+      options["maxshape"] = (None,)
+      options["chunks"] = (max(1, (self.chunk_size or _storage_chunk_size) // numpy.dtype(stored_type).itemsize),) if self.chunked else (_append_chunk_size,)
+    else:
+      chunks = self.chunks(shape, stored_type)
+      if chunks is None:
+        return options
+      options["chunks"] = chunks
+    if self.compression is not None:
+      options["compression"] = self.compression
+      if self.compression_opts is not None:
+        options["compression_opts"] = self.compression_opts
+    if self.shuffle:
+      options["shuffle"] = True
+    return options
+
+storage_policies = {
+  "contiguous": StoragePolicy(),
+  "chunked": StoragePolicy(chunked=True),
+  "gzip": StoragePolicy(compression="gzip", compression_opts=4, shuffle=True),
+  "lzf": StoragePolicy(compression="lzf", shuffle=True),
+  "dictionary": StoragePolicy(dictionary=True),
+  "bitmap": StoragePolicy(bitmap=True),
+}
+"""Named storage policies, which can be used anywhere a :class:`StoragePolicy` is expected."""
+
+def storage_policy(storage):
+  """Return a :class:`StoragePolicy`, given a policy, a policy name from :data:`storage_policies`, or None for the default."""
+  if storage is None:
+    return storage_policies["contiguous"]
+  if isinstance(storage, StoragePolicy):
+    return storage
+  if isinstance(storage, basestring) and storage in storage_policies:
+    return storage_policies[storage]
+  raise ValueError("Unknown storage policy: %s" % (storage,))
 
 class ArraySet(object):
   """Wraps an instance of :class:`h5py.File` to implement a Slycat arrayset."""
@@ -209,11 +1048,28 @@ class ArraySet(object):
   def keys(self):
     return [int(key) for key in self._storage["array"].keys()]
 
+  @property
+  def version(self):
+    """Return a string that changes whenever any darray in the arrayset is started or modified, for use as a cache validator.
+
+    Returns
+    -------
+    version: string, or None for arraysets created before versions were recorded.
+    """
+    return self._storage["array"].attrs.get("version", None)
+
   def array_count(self):
     """Note: this assumes that array indices are contiguous, which we don't explicitly enforce."""
     return len(self._storage["array"].keys())
 
-  def start_array(self, array_index, dimensions, attributes):
+  @property
+  def storage(self):
+    """The default :class:`StoragePolicy` for arrays in the arrayset, set by :func:`start_arrayset`."""
+    if "storage-policy" not in self._storage["array"].attrs:
+      return storage_policy(None)
+    return StoragePolicy(**json.loads(self._storage["array"].attrs["storage-policy"]))
+
+  def start_array(self, array_index, dimensions, attributes, resizable=False, storage=None):
     """Add an uninitialized darray to the arrayset.
 
     An existing array with the same index will be overwritten.
@@ -226,6 +1082,14 @@ class ArraySet(object):
       Description of the new array dimensions.
     attributes : list of dicts, required.
       Description of the new array attributes.
+    resizable : boolean, optional.
+      Allow rows to be added to a 1D array with :meth:`DArray.append`.
+      Statistics aren't maintained while appending, and must be computed
+      with :meth:`DArray.update_cache` once all the rows have been added.
+    storage : :class:`StoragePolicy`, string, or dict, optional.
+      Storage policy or policy name for every attribute, or a dict mapping
+      attribute names to policies.  Attributes without a policy use the
+      arrayset's default.
 
     Returns
     -------
@@ -234,13 +1098,34 @@ class ArraySet(object):
     stub = slycat.darray.Stub(dimensions, attributes)
     shape = [dimension["end"] - dimension["begin"] for dimension in stub.dimensions]
     stored_types = [dtype(attribute["type"]) for attribute in stub.attributes]
+    if resizable and len(shape) != 1:
+      raise ValueError("Only 1D darrays can be resized.")
+
+    default = self.storage
+    if isinstance(storage, dict):
+      unknown = set(storage.keys()) - set([attribute["name"] for attribute in stub.attributes])
+      if unknown:
+        raise ValueError("Unknown attributes in storage policy: %s" % ", ".join(sorted(unknown)))
+      policies = [storage_policy(storage[attribute["name"]]) if attribute["name"] in storage else default for attribute in stub.attributes]
+    else:
+      policies = [storage_policy(storage) if storage is not None else default for attribute in stub.attributes]
 
     # Allocate space for the coming data ...
     array_key = "array/%s" % array_index
     if array_key in self._storage:
       del self._storage[array_key]
-    for attribute_index, stored_type in enumerate(stored_types):
-      self._storage.create_dataset("array/%s/attribute/%s" % (array_index, attribute_index), shape, dtype=stored_type)
+    for attribute_index, (attribute, stored_type, policy) in enumerate(zip(stub.attributes, stored_types, policies)):
+      if policy.dictionary and attribute["type"] == "string":
+        # Elements that haven't been written have code 0, which is always the empty string.
+        self._storage.create_dataset("array/%s/dictionary/%s" % (array_index, attribute_index), data=numpy.array([""], dtype=object), dtype=stored_type)
+        self._storage.create_dataset("array/%s/attribute/%s" % (array_index, attribute_index), shape, dtype="int32", **policy.options(shape, "int32", resizable))
+      else:
+        self._storage.create_dataset("array/%s/attribute/%s" % (array_index, attribute_index), shape, dtype=stored_type, **policy.options(shape, stored_type, resizable))
+      if not resizable:
+        self._storage.create_dataset("array/%s/unique/%s" % (array_index, attribute_index), (0,), dtype=stored_type)
+      if policy.bitmap and len(shape) == 1:
+        # The index is created by update_cache(), once there's data to index.
+        self._storage.create_group("array/%s/bitmap/%s" % (array_index, attribute_index))
 
     # Store array metadata ...
     array_metadata = self._storage[array_key].create_group("metadata")
@@ -250,10 +1135,11 @@ class ArraySet(object):
     array_metadata["dimension-types"] = numpy.array([dimension["type"] for dimension in stub.dimensions], dtype=h5py.special_dtype(vlen=unicode))
     array_metadata["dimension-begin"] = numpy.array([dimension["begin"] for dimension in stub.dimensions], dtype="int64")
     array_metadata["dimension-end"] = numpy.array([dimension["end"] for dimension in stub.dimensions], dtype="int64")
+    _update_version(self._storage[array_key])
 
     return DArray(self._storage[array_key])
 
-  def store_array(self, array_index, array):
+  def store_array(self, array_index, array, storage=None):
     """Store a :class:`slycat.darray.Prototype` in the arrayset.
 
     An existing array with the same index will be overwritten.
@@ -264,6 +1150,8 @@ class ArraySet(object):
       The index of the array to be created / overwritten.
     array : :class:`slycat.darray.Prototype`, required.
       Existing darray to be stored.
+    storage : :class:`StoragePolicy`, string, or dict, optional.
+      Storage policy for the new array, as for :meth:`start_array`.
 
     Returns
     -------
@@ -274,25 +1162,25 @@ class ArraySet(object):
 
     index = tuple([slice(dimension["begin"], dimension["end"]) for dimension in array.dimensions])
 
-    self.start_array(array_index, array.dimensions, array.attributes)
+    hdf5_array = self.start_array(array_index, array.dimensions, array.attributes, storage=storage)
     for attribute_index, attribute in enumerate(array.attributes):
-      stored_type = dtype(attribute["type"])
       data = array.get_data(attribute_index)
 
       # Store the data ...
-      attribute_key = "array/%s/attribute/%s" % (array_index, attribute_index)
-      hdf5_attribute = self._storage[attribute_key]
-      hdf5_attribute[index] = data
+      hdf5_array.set_data(attribute_index, index, data)
 
-    return DArray(self._storage["array/%s" % array_index])
+    hdf5_array.update_cache()
+    return hdf5_array
 
-def start_arrayset(file):
+def start_arrayset(file, storage=None):
   """Create a new array set using an open hdf5 file.
 
   Parameters
   ----------
   file : :class:`h5py.File`, required.
     An hdf5 file open for writing.
+  storage : :class:`StoragePolicy` or string, optional.
+    Default storage policy, or policy name, for arrays in the arrayset.
 
   Returns
   -------
@@ -300,9 +1188,458 @@ def start_arrayset(file):
   """
   if not isinstance(file, h5py.File):
     raise ValueError("An open h5py.File is required.")
+  policy = storage_policy(storage)
+  file.create_group("array")
+  file["array"].attrs["version"] = uuid.uuid4().hex
+  if storage is not None:
+    file["array"].attrs["storage-policy"] = json.dumps(policy.to_json())
+  return ArraySet(file)
+
+def link_arrayset(source, file):
+  """Create a new arrayset that shares its data with an existing arrayset.
+
+  Each attribute dataset in the new arrayset is an HDF5 external link to the
+  corresponding dataset in `source`, so creating it is cheap regardless of
+  the amount of data.  :class:`DArray` replaces a link with a private copy of
+  the dataset the first time it's modified, so the two arraysets only diverge
+  one dataset at a time.  Array metadata is copied outright.  Links in
+  `source` are copied as-is, so the new arrayset refers directly to the file
+  that holds the data instead of forming a chain of links.  The new arrayset
+  gets a new version, so it never shares cache validators with the source.
+
+  Links are stored relative to the new file, and the source must stay in
+  place for as long as the new arrayset exists.  Writing to the source would
+  change the new arrayset too, so callers must first give it private copies
+  of the shared datasets using :func:`unlink_arrayset`.
+
+  Parameters
+  ----------
+  source : :class:`h5py.File`, required.
+    An hdf5 file containing an arrayset.
+  file : :class:`h5py.File`, required.
+    An empty hdf5 file open for writing.
+
+  Returns
+  -------
+  arrayset : :class:`slycat.hdf5.ArraySet`
+  """
+  if not isinstance(source, h5py.File) or not isinstance(file, h5py.File):
+    raise ValueError("Open h5py.File objects are required.")
+
+  source_directory = os.path.dirname(os.path.abspath(source.filename))
+  directory = os.path.dirname(os.path.abspath(file.filename))
+
+  def link(source_group, group):
+    for name in source_group:
+      source_link = source_group.get(name, getlink=True)
+      if isinstance(source_link, h5py.ExternalLink):
+        group[name] = h5py.ExternalLink(os.path.relpath(os.path.join(source_directory, source_link.filename), directory), source_link.path)
+      elif isinstance(source_group[name], h5py.Group):
+        link(source_group[name], group.create_group(name))
+      else:
+        group[name] = h5py.ExternalLink(os.path.relpath(os.path.abspath(source.filename), directory), source_group[name].name)
+
   file.create_group("array")
+  for key, value in source["array"].attrs.items():
+    file["array"].attrs[key] = value
+  for array_key in source["array"]:
+    source_array = source["array"][array_key]
+    array = file["array"].create_group(array_key)
+    for key, value in source_array.attrs.items():
+      array.attrs[key] = value
+    for name in source_array:
+      if name == "metadata":
+        array.copy(source_array[name], name)
+      elif isinstance(source_array[name], h5py.Group):
+        link(source_array[name], array.create_group(name))
+    array.attrs["version"] = uuid.uuid4().hex
+  file["array"].attrs["version"] = uuid.uuid4().hex
   return ArraySet(file)
 
+def close_linked_files(file):
+  """Close the shared files that were opened to read an arrayset open for writing.
+
+  Call this before closing a file that may contain links created by
+  :func:`link_arrayset`, once none of its data is in use.
+
+  Parameters
+  ----------
+  file : :class:`h5py.File`, required.
+  """
+  with _linked_files_lock:
+    linked_files = _linked_files.pop(os.path.abspath(file.filename), {})
+  for linked_file in linked_files.values():
+    linked_file.close()
+
+def unlink_arrayset(source, file):
+  """Replace the links from an arrayset to the datasets in another arrayset with private copies.
+
+  Use this before modifying an arrayset that others were linked to with
+  :func:`link_arrayset`.  Links to datasets that no longer exist in `source`
+  are left alone.
+
+  Parameters
+  ----------
+  source : :class:`h5py.File`, required.
+    An hdf5 file containing an arrayset.
+  file : :class:`h5py.File`, required.
+    An hdf5 file open for writing, containing an arrayset that may be linked to `source`.
+  """
+  if not isinstance(source, h5py.File) or not isinstance(file, h5py.File):
+    raise ValueError("Open h5py.File objects are required.")
+
+  source_path = os.path.abspath(source.filename)
+  directory = os.path.dirname(os.path.abspath(file.filename))
+
+  def unlink(group):
+    for name in list(group.keys()):
+      link = group.get(name, getlink=True)
+      if isinstance(link, h5py.ExternalLink):
+        if os.path.abspath(os.path.join(directory, link.filename)) == source_path and link.path in source:
+          del group[name]
+          group.copy(source[link.path], name)
+      elif isinstance(group[name], h5py.Group):
+        unlink(group[name])
+
+  unlink(file["array"])
+
+def histogram(values, bins=10, quantiles=False):
+  """Count the values in an array that fall into each of a set of bins, ignoring NaNs.
+
+  This is the in-memory equivalent of :meth:`DArray.get_histogram`, for
+  values that have already been read or computed.
+
+  Parameters
+  ----------
+  values: numpy.ndarray
+  bins: integer or sequence of numbers, optional
+    The number of equal-width bins, or a monotonically increasing sequence of
+    bin edges.
+  quantiles: bool, optional
+    Choose edges so that each bin contains (as nearly as ties allow) the same
+    number of values.
+
+  Returns
+  -------
+  histogram: dict
+    Contains "edges" and "counts" as :class:`numpy.ndarray`.
+  """
+  values = numpy.ravel(values)
+  if values.dtype.char in ["O", "S", "U"]:
+    raise ValueError("Histograms require numeric values.")
+  if values.dtype.char in ["e", "f", "d", "g"]:
+    values = values[numpy.invert(numpy.isnan(values))]
+  values = numpy.sort(values)
+  if quantiles:
+    edges = values[numpy.round(numpy.linspace(0, len(values) - 1, _bin_count(bins) + 1)).astype("int64")].astype("float64") if len(values) else numpy.linspace(0, 1, _bin_count(bins) + 1)
+  elif numpy.ndim(bins) == 0:
+    edges = _edges(values.min() if len(values) else None, values.max() if len(values) else None, bins)
+  else:
+    edges = _require_edges(bins)
+  positions = numpy.searchsorted(values, edges)
+  positions[-1] = numpy.searchsorted(values, edges[-1], side="right")
+  return {"edges": edges, "counts": numpy.diff(positions).astype("int64")}
+
+def argsort(values, descending=False):
+  """Return the indices that would stably sort a 1D array.
+
+  Unlike reversing the results of :func:`numpy.argsort`, elements with equal
+  values keep their original relative order when sorting in descending order.
+
+  Parameters
+  ----------
+  values: numpy.ndarray
+  descending: boolean, optional
+
+  Returns
+  -------
+  index: numpy.ndarray
+  """
+  values = numpy.asarray(values)
+  index = numpy.argsort(values, kind="mergesort")
+  if descending:
+    index = _reverse_stable(index, _ties(values[index]))
+  return index
+
+class RowGather(object):
+  """Reads an arbitrary set of rows from 1D darray attributes.
+
+  Reading scattered rows with an h5py point selection is slow, so the
+  requested rows are sorted and coalesced into contiguous runs, each run is
+  read with a single hyperslab read, and the results are scattered back into
+  the requested order.  Runs separated by no more than `gap` rows are merged,
+  trading unneeded values for fewer reads, since each read has a fixed
+  overhead comparable to reading thousands of contiguous values.  If the rows
+  are so sparse that most runs would contain a single row, they're read with
+  one point selection instead.  The plan is computed once, and can be reused
+  to read any number of attributes with the same shape::
+
+    gather = slycat.hdf5.RowGather(rows)
+    for attribute in attributes:
+      values = gather.read(array.get_data(attribute))
+
+  Parameters
+  ----------
+  rows: sequence of integers
+    Row indices to read, in any order, possibly including duplicates.
+  gap: integer, optional
+    Largest number of unrequested rows that will be read to join two runs.
+  """
+  def __init__(self, rows, gap=None):
+    rows = numpy.asarray(rows, dtype="int64").ravel()
+    gap = _gather_gap if gap is None else gap
+
+    unique, inverse = numpy.unique(rows, return_inverse=True)
+    breaks = numpy.flatnonzero(numpy.diff(unique) > gap + 1) + 1
+    if len(unique) > 1 and (len(breaks) + 1) * 2 > len(unique):
+      self.rows = unique
+      self.runs = []
+      self.positions = inverse
+      return
+
+    self.rows = None
+    begins = unique[numpy.concatenate(([0], breaks)).astype("int64")] if len(unique) else unique
+    ends = unique[numpy.concatenate((breaks - 1, [-1])).astype("int64")] + 1 if len(unique) else unique
+    self.runs = zip(begins, ends)
+    offsets = numpy.cumsum(ends - begins) - (ends - begins)
+    run = numpy.searchsorted(begins, rows, side="right") - 1
+    self.positions = offsets[run] + rows - begins[run] if len(rows) else rows
+
+  def __len__(self):
+    """Return the number of reads required for each attribute."""
+    return 1 if self.rows is not None else len(self.runs)
+
+  def read(self, data):
+    """Read the requested rows from a 1D array-like object.
+
+    Parameters
+    ----------
+    data: array-like object
+      Any object that supports slicing, such as the result of :meth:`DArray.get_data`.
+
+    Returns
+    -------
+    values: numpy.ndarray
+      The values of the requested rows, in the order they were requested.
+    """
+    if self.rows is not None:
+      return numpy.asarray(data[self.rows.tolist()])[self.positions]
+    if not self.runs:
+      return numpy.asarray(data[0:0])
+    return numpy.concatenate([data[begin:end] for begin, end in self.runs])[self.positions]
+
+_append_chunk_size = 16384
+_bitmap_bins = 64
+_bitmap_cardinality = 256
+_bitmap_operators = {
+  "<": numpy.less,
+  ">": numpy.greater,
+  "<=": numpy.less_equal,
+  ">=": numpy.greater_equal,
+  "==": numpy.equal,
+  "in": numpy.in1d,
+  }
+_compute_chunk_size = 1024 * 1024
+_dictionary_limit = 1024
+_gather_gap = 4096
+_linked_files = {}
+_linked_files_lock = threading.Lock()
+_lod_levels = 10
+_storage_chunk_size = 512 * 1024
+_written_limit = 256
+
+def _summarize(data):
+  """Return the sorted unique values in an array, ignoring NaNs."""
+  data = numpy.ravel(data)
+  if data.dtype.char in ["e", "f", "d", "g"]:
+    data = data[numpy.invert(numpy.isnan(data))]
+  return numpy.unique(data)
+
+def _minimum(unique):
+  if not len(unique):
+    return None
+  return str(unique[0]) if unique.dtype.char in ["O", "S", "U"] else numpy.asscalar(unique[0])
+
+def _maximum(unique):
+  if not len(unique):
+    return None
+  return str(unique[-1]) if unique.dtype.char in ["O", "S", "U"] else numpy.asscalar(unique[-1])
+
+def _merge_unique(a, b):
+  """Merge two sorted arrays of unique values, in a single pass."""
+  if not len(a):
+    return b
+  if not len(b):
+    return a
+  positions = numpy.searchsorted(a, b)
+  missing = positions == len(a)
+  missing[numpy.invert(missing)] = a[positions[numpy.invert(missing)]] != b[numpy.invert(missing)]
+  return numpy.insert(a, positions[missing], b[missing])
+
+def _bins(values, begin, end, size):
+  """Return the index of the bin containing each value, for `size` equal bins covering [begin, end]."""
+  if end <= begin:
+    return numpy.zeros(len(values), dtype="int64")
+  return numpy.clip(numpy.floor((values - begin) / (end - begin) * size), 0, size - 1).astype("int64")
+
+def _bin_range(begin, end, low, high, size):
+  """Return the first and last of `size` equal bins covering [begin, end] that overlap [low, high], or an empty range."""
+  if high < begin or low > end:
+    return 1, 0
+  if end <= begin:
+    return 0, size - 1
+  return tuple([int(numpy.clip(numpy.floor((value - begin) / (end - begin) * size), 0, size - 1)) for value in (low, high)])
+
+def _interleave(values):
+  """Spread the bits of 32-bit integers apart, so two sets of values can be combined into Z-order codes."""
+  values = values.astype("int64")
+  for shift, mask in [(16, 0x0000FFFF0000FFFF), (8, 0x00FF00FF00FF00FF), (4, 0x0F0F0F0F0F0F0F0F), (2, 0x3333333333333333), (1, 0x5555555555555555)]:
+    values = (values | (values << shift)) & mask
+  return values
+
+def _deinterleave(codes):
+  """Extract every other bit of Z-order codes, reversing :func:`_interleave`."""
+  values = codes.astype("int64") & 0x5555555555555555
+  for shift, mask in [(1, 0x3333333333333333), (2, 0x0F0F0F0F0F0F0F0F), (4, 0x00FF00FF00FF00FF), (8, 0x0000FFFF0000FFFF), (16, 0x00000000FFFFFFFF)]:
+    values = (values | (values >> shift)) & mask
+  return values
+
+def _bitmap_bin(edges, values):
+  """Return the bin of a binned bitmap index that contains each value, clamping values outside the edges to the first or last bin."""
+  return numpy.clip(numpy.searchsorted(edges, values, side="right") - 1, 0, len(edges) - 2)
+
+def _pack_rows(rows, size):
+  """Return a bitmap of `size` bytes with the given rows set, in :func:`numpy.packbits` order."""
+  bits = numpy.zeros(size * 8, dtype="bool")
+  bits[rows] = True
+  return numpy.packbits(bits)
+
+def _bin_count(bins):
+  """Validate a number of histogram bins."""
+  if numpy.ndim(bins) != 0 or int(bins) != bins or bins < 1:
+    raise ValueError("The number of bins must be a positive integer.")
+  return int(bins)
+
+def _edges(minimum, maximum, bins):
+  """Return the edges of equal-width histogram bins spanning [minimum, maximum], using the same conventions as :func:`numpy.histogram`."""
+  if minimum is None:
+    minimum, maximum = 0.0, 1.0
+  if minimum == maximum:
+    minimum, maximum = minimum - 0.5, maximum + 0.5
+  return numpy.linspace(minimum, maximum, _bin_count(bins) + 1)
+
+def _require_edges(edges):
+  """Validate explicit histogram bin edges."""
+  edges = numpy.asarray(edges, dtype="float64")
+  if edges.ndim != 1 or len(edges) < 2 or numpy.any(numpy.isnan(edges)) or numpy.any(numpy.diff(edges) < 0):
+    raise ValueError("Bin edges must be a monotonically increasing sequence of at least two numbers.")
+  return edges
+
+def _search(values, value, side, begin=0, end=None):
+  """Binary search a sorted array-like object with any NaNs at the end, like :func:`numpy.searchsorted`."""
+  end = len(values) if end is None else end
+  while begin < end:
+    middle = (begin + end) // 2
+    item = values[middle]
+    if item < value or (side == "right" and item == value):
+      begin = middle + 1
+    else:
+      end = middle
+  return begin
+
+def _ties(values):
+  """Return the [begin, end) extents of each run of two or more equal values in a sorted array, treating NaNs as equal."""
+  if len(values) < 2:
+    return numpy.zeros((0, 2), dtype="int64")
+  equal = values[1:] == values[:-1]
+  if values.dtype.char in ["e", "f", "d", "g"]:
+    equal = numpy.logical_or(equal, numpy.logical_and(numpy.isnan(values[1:]), numpy.isnan(values[:-1])))
+  changes = numpy.flatnonzero(numpy.diff(numpy.concatenate(([0], equal.astype("int8"), [0]))))
+  return numpy.column_stack((changes[0::2], changes[1::2] + 1)).astype("int64").reshape((-1, 2))
+
+def _reverse_stable(index, ties):
+  """Reverse a stable ascending sort index, preserving the original order of tied values."""
+  result = index[::-1].copy()
+  if len(ties):
+    begins = len(index) - ties[:,1]
+    ends = len(index) - ties[:,0]
+    lengths = ends - begins
+    offsets = numpy.arange(lengths.sum()) - numpy.repeat(numpy.cumsum(lengths) - lengths, lengths)
+    result[numpy.repeat(begins, lengths) + offsets] = result[numpy.repeat(ends - 1, lengths) - offsets]
+  return result
+
+def _linked_file(file, filename):
+  """Return a read-only handle for a file linked from an arrayset open for writing, opening it only once."""
+  linked_path = os.path.abspath(os.path.join(os.path.dirname(file.filename), filename))
+  with _linked_files_lock:
+    linked_files = _linked_files.setdefault(os.path.abspath(file.filename), {})
+    if linked_path not in linked_files or not linked_files[linked_path].id.valid:
+      linked_files[linked_path] = h5py.File(linked_path, "r")
+    return linked_files[linked_path]
+
+def _update_version(storage):
+  """Record a new version for a darray's storage group, and for the arrayset that contains it."""
+  version = uuid.uuid4().hex
+  storage.attrs["version"] = version
+  storage.parent.attrs["version"] = version
+
+def _box(hyperslice, shape):
+  """Convert a hyperslice into a list of [begin, end) extents, or None if it isn't a contiguous box."""
+  if not isinstance(hyperslice, tuple):
+    hyperslice = (hyperslice,)
+  if hyperslice.count(Ellipsis) > 1:
+    return None
+  if Ellipsis in hyperslice:
+    index = hyperslice.index(Ellipsis)
+    hyperslice = hyperslice[:index] + (slice(None),) * (len(shape) - len(hyperslice) + 1) + hyperslice[index + 1:]
+  hyperslice = hyperslice + (slice(None),) * (len(shape) - len(hyperslice))
+  if len(hyperslice) != len(shape):
+    return None
+
+  box = []
+  for extent, size in zip(hyperslice, shape):
+    if isinstance(extent, numbers.Integral):
+      extent = extent + size if extent < 0 else extent
+      box.append((extent, extent + 1))
+    elif isinstance(extent, slice):
+      begin, end, step = extent.indices(size)
+      if step != 1:
+        return None
+      box.append((begin, max(begin, end)))
+    else:
+      return None
+  return tuple(box)
+
+def _volume(box):
+  return numpy.prod([end - begin for begin, end in box])
+
+def _overlaps(a, b):
+  return all([a_begin < b_end and b_begin < a_end for (a_begin, a_end), (b_begin, b_end) in zip(a, b)])
+
+def _coalesce(boxes):
+  """Merge adjacent boxes that share the same extents along every other dimension."""
+  boxes = list(boxes)
+  merged = True
+  while merged:
+    merged = False
+    for i in range(len(boxes)):
+      for j in range(i + 1, len(boxes)):
+        differences = [dimension for dimension, (a, b) in enumerate(zip(boxes[i], boxes[j])) if a != b]
+        if len(differences) != 1:
+          continue
+        dimension = differences[0]
+        (a_begin, a_end), (b_begin, b_end) = boxes[i][dimension], boxes[j][dimension]
+        if a_end == b_begin or b_end == a_begin:
+          box = list(boxes[i])
+          box[dimension] = (min(a_begin, b_begin), max(a_end, b_end))
+          boxes[i] = tuple(box)
+          del boxes[j]
+          merged = True
+          break
+      if merged:
+        break
+  return boxes
+
 ###############################################################################################################################################3
 # Legacy functionality - don't use these in new code.
 
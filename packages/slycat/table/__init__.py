@@ -4,6 +4,144 @@
 
 import numpy
 import slycat.darray
+import slycat.hdf5
+import StringIO
+
+class PromotionRequired(Exception):
+  """Raised by :class:`Reader` when a column inferred to be numeric contains a non-numeric value."""
+  def __init__(self, column):
+    Exception.__init__(self, "Column %s must be promoted to string." % column)
+    self.column = column
+
+class Reader(object):
+  """Incrementally parse a delimited text file, one block at a time.
+
+  The file format is the same as for :func:`parse`.  Delimiters are
+  identified and column types are inferred from the header and a sample of
+  rows at the beginning of the file, after which the file is read in blocks of
+  `block_size` bytes, so memory use is bounded regardless of the number of
+  rows.  Iterating over the reader yields a list of numpy arrays (one per
+  column) for each block of rows.  If a column that was inferred to be
+  numeric turns out to contain a non-numeric value, :class:`PromotionRequired`
+  is raised, and the caller can start over with the column forced to string
+  type - see :func:`store`.
+
+  Arguments
+  ---------
+  file : file-like object
+    Provides the file contents using `read(size)`.
+  block_size : integer, optional
+    Number of bytes to read at a time.
+  sample_size : integer, optional
+    Number of rows used to infer column types.  Use None to sample the entire file.
+  types : dict, optional
+    Maps column indices to types ("float64" or "string"), overriding inferred types.
+
+  Attributes
+  ----------
+  attributes : list of dicts
+    Name and type of each column.
+  categories : list of integers
+    Indices of the string columns that have few distinct values in the
+    sample, and are worth storing with dictionary encoding.
+  """
+  def __init__(self, file, block_size=None, sample_size=None, types=None):
+    self._file = file
+    self._block_size = block_size if block_size is not None else _block_size
+    self._eof = False
+
+    # Read the header and sample rows.
+    data = ""
+    while not self._eof and (sample_size is None or _count_rows(data) <= sample_size):
+      data += self._read()
+
+    # Identify a row delimiter for the file.
+    delimiter_counts = [(data.rstrip("\r").count(delimiter), delimiter) for delimiter in ["\r\n", "\r", "\n"]]
+    delimiter_counts = [(count, delimiter) for count, delimiter in delimiter_counts if count != 0]
+    if len(delimiter_counts) == 0:
+      raise ValueError("Delimited text file must contain CR, LF, or CRLF row delimiters.")
+    self._row_delimiter = delimiter_counts[0][1]
+
+    # Split data into rows
+    rows, self._remainder = self._split(data)
+    if not rows:
+      raise ValueError("Delimited text file must contain a header row.")
+
+    # Identify a column delimiter for the file.
+    delimiter_counts = [(numpy.array([len(row.split(delimiter)) for row in rows]), delimiter) for delimiter in [",", "\t"]]
+    delimiter_counts = [(counts[0], delimiter) for counts, delimiter in delimiter_counts if counts.var() == 0 and counts[0] > 1]
+    if len(delimiter_counts) == 0:
+      raise ValueError("Delimited text file must contain consistent comma or tab field delimiters.")
+    self._field_count, self._field_delimiter = sorted(delimiter_counts)[-1]
+
+    # Infer column types from the sample.
+    names = rows[0].split(self._field_delimiter)
+    self._sample = [row.split(self._field_delimiter) for row in rows[1:]]
+    columns = zip(*self._sample) if self._sample else [()] * len(names)
+    self.attributes = [{"name": name, "type": _infer_type(column)} for name, column in zip(names, columns)]
+    for column, type in (types or {}).items():
+      self.attributes[column]["type"] = type
+    self.categories = [index for index, (attribute, column) in enumerate(zip(self.attributes, columns)) if attribute["type"] == "string" and _is_category(column)]
+
+  def _read(self):
+    block = self._file.read(self._block_size)
+    if not block:
+      self._eof = True
+    return block
+
+  def _split(self, data):
+    """Split data into complete rows, plus any remaining partial row."""
+    rows = data.split(self._row_delimiter)
+    remainder = "" if self._eof else rows.pop()
+    return [row for row in rows if len(row)], remainder
+
+  def _convert(self, rows):
+    """Convert rows of fields into column arrays."""
+    for row in rows:
+      if len(row) != self._field_count:
+        raise ValueError("Delimited text file must contain consistent comma or tab field delimiters.")
+    columns = zip(*rows)
+    data = []
+    for index, (attribute, column) in enumerate(zip(self.attributes, columns)):
+      if attribute["type"] == "float64":
+        try:
+          data.append(numpy.array(column).astype("float64"))
+        except ValueError:
+          raise PromotionRequired(index)
+      else:
+        data.append(numpy.array(column))
+    return data
+
+  def __iter__(self):
+    if self._sample:
+      yield self._convert(self._sample)
+    self._sample = None
+
+    while not self._eof:
+      rows, self._remainder = self._split(self._remainder + self._read())
+      if rows:
+        yield self._convert([row.split(self._field_delimiter) for row in rows])
+
+def _count_rows(data):
+  """Return an upper bound on the number of rows in a block of data."""
+  return data.count("\n") + data.count("\r")
+
+def _infer_type(column):
+  """Return "float64" if every value in a column is numeric, otherwise "string"."""
+  try:
+    numpy.array(column).astype("float64")
+    return "float64"
+  except ValueError:
+    return "string"
+
+def _is_category(column):
+  """Return True if a sample of string values contains few enough distinct values to be treated as categories."""
+  distinct = len(set(column))
+  return distinct <= _category_limit and distinct * 2 <= len(column)
+
+_block_size = 1024 * 1024
+_category_limit = 1024
+_sample_size = 10000
 
 def parse(data):
   """Parse a delimited text file and return a 1D :py:mod:`darray<slycat.darray>` with an attribute for each table column.
@@ -17,6 +155,8 @@ def parse(data):
   * Empty fields are allowed, but columns containing empty fields cannot be converted to floating-point.
   * Numeric columns may contain "nan" fields.  Capitalization of nan fields is ignored, so "nan", "Nan", "NaN", "NAN", etc. are all allowed.
 
+  Use :func:`store` instead to parse large files without reading them into memory.
+
   Arguments
   ---------
   data : string
@@ -27,39 +167,53 @@ def parse(data):
   darray : :class:`slycat.darray.MemArray`
     In-memory representation of the table.
   """
-  # Identify a row delimiter for the file.
-  delimiter_counts = [(data.count(delimiter), delimiter) for delimiter in ["\r\n", "\r", "\n"]]
-  delimiter_counts = [(count, delimiter) for count, delimiter in delimiter_counts if count != 0]
-  if len(delimiter_counts) == 0:
-    raise ValueError("Delimited text file must contain CR, LF, or CRLF row delimiters.")
-  row_delimiter = delimiter_counts[0][1]
-
-  # Split data into rows
-  rows = [row for row in data.split(row_delimiter) if len(row)]
-
-  # Identify a column delimiter for the file.
-  delimiter_counts = [(numpy.array([len(row.split(delimiter)) for row in rows]), delimiter) for delimiter in [",", "\t"]]
-  delimiter_counts = [(counts[0], delimiter) for counts, delimiter in delimiter_counts if counts.var() == 0 and counts[0] > 1]
-  if len(delimiter_counts) == 0:
-    raise ValueError("Delimited text file must contain consistent comma or tab field delimiters.")
-  field_delimiter = sorted(delimiter_counts)[-1][1]
-
-  # Split data into fields.
-  rows = [row.split(field_delimiter) for row in rows]
-
-  # Convert to column-oriented data.
-  columns = zip(*rows)
-
-  # Generate final outputs.
-  dimensions = [{"name":"row", "type":"int64", "begin":0, "end":len(rows[1:])}]
-  attributes = []
-  data = []
-  for column in columns:
-    try:
-      data.append(numpy.array(column[1:]).astype("float64"))
-      attributes.append({"name":column[0], "type":"float64"})
-    except:
-      data.append(numpy.array(column[1:]))
-      attributes.append({"name":column[0], "type":"string"})
+  reader = Reader(StringIO.StringIO(data), block_size=max(1, len(data)), sample_size=None)
+  blocks = list(reader)
+  data = [numpy.concatenate([block[index] for block in blocks]) if blocks else numpy.array([], dtype="float64" if attribute["type"] == "float64" else "S") for index, attribute in enumerate(reader.attributes)]
+  dimensions = [{"name":"row", "type":"int64", "begin":0, "end":len(data[0]) if data else 0}]
+  return slycat.darray.MemArray(dimensions, reader.attributes, data)
+
+def store(file, arrayset, array_index=0, block_size=None, sample_size=None):
+  """Parse a delimited text file, appending its rows to a new array as they're read.
 
-  return slycat.darray.MemArray(dimensions, attributes, data)
+  Memory use is bounded by the block and sample sizes, regardless of the
+  size of the file.  See :func:`parse` for the file format.  If a column that
+  looked numeric in the sample turns out to contain strings, the file is
+  parsed again from the beginning with that column stored as strings, so
+  `file` must support `seek()`.  String columns with few distinct values
+  (see :attr:`Reader.categories`) are stored with dictionary encoding, until
+  too many distinct values appear after the sample (see
+  :meth:`slycat.hdf5.DArray.append`).
+
+  Arguments
+  ---------
+  file : file-like object
+    Provides the file contents using `read(size)` and `seek(offset)`.
+  arrayset : :class:`slycat.hdf5.ArraySet`
+    The array set where the table will be stored.
+  array_index : integer, optional
+    Index of the array to be created / overwritten.
+  block_size : integer, optional
+    Number of bytes to read at a time.
+  sample_size : integer, optional
+    Number of rows used to infer column types.
+
+  Returns
+  -------
+  array : :class:`slycat.hdf5.DArray`
+  """
+  types = {}
+  while True:
+    reader = Reader(file, block_size=block_size, sample_size=sample_size if sample_size is not None else _sample_size, types=types)
+    category_policy = slycat.hdf5.StoragePolicy(**dict(arrayset.storage.to_json(), dictionary=True))
+    storage = dict([(reader.attributes[index]["name"], category_policy) for index in reader.categories])
+    array = arrayset.start_array(array_index, [{"name":"row", "type":"int64", "begin":0, "end":0}], reader.attributes, resizable=True, storage=storage)
+    try:
+      for block in reader:
+        array.append(block)
+    except PromotionRequired as e:
+      types[e.column] = "string"
+      file.seek(0)
+      continue
+    array.update_cache()
+    return array
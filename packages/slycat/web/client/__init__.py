@@ -5,6 +5,7 @@
 import argparse
 import collections
 import getpass
+import itertools
 import json
 import logging
 import numbers
@@ -14,12 +15,9 @@ import requests
 import shlex
 import slycat.darray
 import sys
+import threading
 import time
-
-try:
-  import cStringIO as StringIO
-except:
-  import StringIO
+import uuid
 
 log = logging.getLogger("slycat.web.client")
 log.setLevel(logging.INFO)
@@ -40,6 +38,27 @@ def _require_array_ranges(ranges):
   else:
     raise Exception("Not a valid ranges object.")
 
+def decode_table_chunk(content, byteorder):
+  """Decode a binary table chunk, returning the same structure as the JSON representation.
+
+  Column data is returned as numpy arrays, with missing values stored as NaN.
+  """
+  order = "<" if byteorder == "little" else ">"
+  header_length = int(numpy.fromstring(content[0:4], dtype=order + "u4")[0])
+  header = json.loads(content[4 : 4 + header_length])
+  content = content[4 + header_length:]
+
+  data = []
+  for type, buffers in zip(header["column-types"], header["buffers"]):
+    offset, length = buffers["data"]
+    if type == "string":
+      offsets = numpy.fromstring(content[buffers["offsets"][0] : buffers["offsets"][0] + buffers["offsets"][1]], dtype=order + "u4")
+      values = content[offset : offset + length]
+      data.append(numpy.array([values[begin:end].decode("utf-8") for begin, end in zip(offsets[:-1], offsets[1:])], dtype="object"))
+    else:
+      data.append(numpy.fromstring(content[offset : offset + length], dtype=order + numpy.dtype(type).str[1:]).astype(type))
+  return {"rows": header["rows"], "columns": header["columns"], "column-names": header["column-names"], "sort": header["sort"], "data": data}
+
 class ArgumentParser(argparse.ArgumentParser):
   """Return an instance of argparse.ArgumentParser, pre-configured with arguments to connect to a Slycat server."""
   def __init__(self, *arguments, **keywords):
@@ -87,6 +106,71 @@ class ArgumentParser(argparse.ArgumentParser):
 
     return arguments
 
+def encode_arrayset_data(data, binary, block_size=1024 * 1024):
+  """Serialize arrayset data chunks for upload, yielding strings of at most roughly `block_size` bytes.
+
+  Chunks are pulled from `data` one at a time, so an upload never needs more
+  memory than a single block, no matter how large the arrayset is.  Binary
+  data is sent in native byte order, JSON data as a JSON array containing one
+  nested list per chunk.
+  """
+  if binary:
+    for chunk in data:
+      if not isinstance(chunk, numpy.ndarray):
+        raise ValueError("Data chunk must be a numpy array.")
+      if chunk.dtype.char in ["S", "U", "O"]:
+        raise ValueError("Binary uploads require numeric data chunks.")
+      values = numpy.ascontiguousarray(chunk).reshape(-1)
+      count = max(1, block_size // max(1, values.itemsize))
+      for begin in range(0, len(values), count):
+        yield values[begin : begin + count].tostring()
+  else:
+    yield "["
+    for index, chunk in enumerate(data):
+      if not isinstance(chunk, numpy.ndarray):
+        raise ValueError("Data chunk must be a numpy array.")
+      yield ("," if index else "") + json.dumps(chunk.tolist())
+    yield "]"
+
+def encode_multipart(boundary, fields, name, content):
+  """Yield a multipart/form-data request body, streaming `content` as a file field."""
+  for key, value in fields:
+    yield "--%s\r\nContent-Disposition: form-data; name=\"%s\"\r\n\r\n%s\r\n" % (boundary, key, value)
+  yield "--%s\r\nContent-Disposition: form-data; name=\"%s\"; filename=\"%s\"\r\nContent-Type: application/octet-stream\r\n\r\n" % (boundary, name, name)
+  for block in content:
+    yield block
+  yield "\r\n--%s--\r\n" % boundary
+
+class StreamingBody(object):
+  """Read-only file-like object that produces a request body from an iterable of strings, as it's read.
+
+  Unlike a generator, which Requests sends using chunked transfer encoding,
+  a streaming body has a known length, so it's sent with a Content-Length
+  header.
+  """
+  def __init__(self, blocks, length):
+    self.len = length
+    self._blocks = iter(blocks)
+    self._buffer = ""
+
+  def __len__(self):
+    return self.len
+
+  def read(self, size=-1):
+    pieces = [self._buffer]
+    count = len(self._buffer)
+    while size < 0 or count < size:
+      block = next(self._blocks, None)
+      if block is None:
+        break
+      pieces.append(block)
+      count += len(block)
+    data = "".join(pieces)
+    if size < 0:
+      size = len(data)
+    data, self._buffer = data[:size], data[size:]
+    return data
+
 class Connection(object):
   """Encapsulates a set of requests to the given host.  Additional keyword
   arguments must be compatible with the Python Requests library,
@@ -229,6 +313,50 @@ class Connection(object):
     """
     return self.request("GET", "/models/%s" % mid, headers={"accept":"application/json"})
 
+  def get_model_array_lod(self, mid, name, array, x, y, viewport=None, resolution=(256, 256), limit=None, index=()):
+    """Summarize a scatterplot of two array attributes, for display at a given resolution.
+
+    Parameters
+    ----------
+    mid: string, required
+      Unique model identifier.
+    name: string, required
+      Unique (to the model) arrayset artifact name.
+    array: integer, required
+      Zero-based index of the array to plot.
+    x, y: integer, required
+      Zero-based indices of the numeric attributes to plot.
+    viewport: sequence of four numbers, optional
+      The (xmin, xmax, ymin, ymax) region to summarize.  Defaults to the
+      bounds of the data.
+    resolution: sequence of two integers, optional
+      The (width, height) of the viewport in pixels.
+    limit: integer, optional
+      Largest number of points to return as-is.  Defaults to the server's
+      configured limit.
+    index: sequence of integers, optional
+      For arrays with more than one dimension, indices along the leading
+      dimensions that select the 1D slice to plot.
+
+    Returns
+    -------
+    summary: dict
+      Either the points within the viewport, or binned counts plus a
+      representative point for each bin.
+
+    See Also
+    --------
+    :http:get:`/models/(mid)/arraysets/(name)/arrays/(array)/lod`
+    """
+    params = {"x": x, "y": y, "resolution": ",".join([str(value) for value in resolution])}
+    if viewport is not None:
+      params["viewport"] = ",".join([repr(float(value)) for value in viewport])
+    if limit is not None:
+      params["limit"] = limit
+    if index:
+      params["index"] = ",".join([str(value) for value in index])
+    return self.request("GET", "/models/%s/arraysets/%s/arrays/%s/lod" % (mid, name, array), params=params, headers={"accept":"application/json"})
+
   def get_model_file(self, mid, name):
     return self.request("GET", "/models/%s/files/%s" % (mid, name))
 
@@ -256,8 +384,14 @@ class Connection(object):
     """
     return self.request("GET", "/models/%s/parameters/%s" % (mid, name), headers={"accept":"application/json"})
 
-  def get_model_table_chunk(self, mid, name, array, rows, columns):
-    """Returns a chunk (set of rows and columns) from a table (array) artifact."""
+  def get_model_table_chunk(self, mid, name, array, rows, columns, binary=False):
+    """Returns a chunk (set of rows and columns) from a table (array) artifact.
+
+    If `binary` is True, the chunk is retrieved in binary format, and the
+    column data is returned as numpy arrays.
+    """
+    if binary:
+      return decode_table_chunk(self.request("GET", "/models/%s/tables/%s/arrays/%s/chunk?rows=%s&columns=%s&byteorder=%s" % (mid, name, array, ",".join([str(row) for row in rows]), ",".join([str(column) for column in columns]), sys.byteorder), headers={"accept":"application/octet-stream"}), sys.byteorder)
     return self.request("GET", "/models/%s/tables/%s/arrays/%s/chunk?rows=%s&columns=%s" % (mid, name, array, ",".join([str(row) for row in rows]), ",".join([str(column) for column in columns])), headers={"accept":"application/json"})
 
   def get_model_table_metadata(self, mid, name, array):
@@ -487,9 +621,16 @@ class Connection(object):
   def put_model(self, mid, model):
     self.request("PUT", "/models/%s" % (mid), headers={"content-type":"application/json"}, data=json.dumps(model))
 
-  def put_model_arrayset_data(self, mid, name, hyperchunks, data, force_json=False):
+  def put_model_arrayset_data(self, mid, name, hyperchunks, data, force_json=False, retries=3):
     """Write data to an arrayset artifact on the server.
 
+    Data chunks are serialized and streamed to the server as they're
+    needed, using a chunked request, so uploading an arrayset doesn't
+    require a second, serialized copy of it in memory.  `data` may be a
+    generator, in which case the chunks don't need to exist in memory all at
+    once either.  Use :func:`put_model_arrayset_parts` to split an upload into
+    several concurrent requests.
+
     Parameters
     ----------
     mid: string, required
@@ -503,6 +644,10 @@ class Connection(object):
       data chunks must match the number implied by the `hyperchunks` parameter.
     force_json: bool, optional)
       Force the client to upload data using JSON instead of the binary format.
+    retries: integer, optional
+      Number of times to retry the request if the connection fails or the
+      server returns a 5xx error.  Requests are only retried if `data` is a
+      list or tuple, since a generator can't be replayed.
 
     See Also
     --------
@@ -515,37 +660,129 @@ class Connection(object):
       raise ValueError("Artifact name must be a string.")
     if not isinstance(hyperchunks, basestring):
       raise ValueError("Hyperchunks specification must be a string.")
-    for chunk in data:
+
+    # Decide whether we can send the data in binary form, by looking at the first chunk of a generator, or every chunk of a sequence.
+    replayable = isinstance(data, (list, tuple))
+    if replayable:
+      chunks = list(data)
+    else:
+      data = iter(data)
+      first = next(data, None)
+      chunks = [] if first is None else [first]
+    for chunk in chunks:
       if not isinstance(chunk, numpy.ndarray):
         raise ValueError("Data chunk must be a numpy array.")
-
-    # Mark whether every data chunk is numeric ... if so, we can send the data in binary form.
-    use_binary = numpy.all([chunk.dtype.char != "S" for chunk in data]) and not force_json
+    use_binary = numpy.all([chunk.dtype.char != "S" for chunk in chunks]) and not force_json
 
     # Build-up the request
-    request_data = {}
-    request_data["hyperchunks"] = hyperchunks
+    fields = [("hyperchunks", hyperchunks)]
     if use_binary:
-      request_data["byteorder"] = sys.byteorder
-
-    request_buffer = StringIO.StringIO()
-    if use_binary:
-      for chunk in data:
-        request_buffer.write(chunk.tostring(order="C"))
-    else:
-      request_buffer.write(json.dumps([chunk.tolist() for chunk in data]))
-
-    # Send the request to the server ...
-    self.request("PUT", "/models/%s/arraysets/%s/data" % (mid, name), data=request_data, files={"data":request_buffer.getvalue()})
+      fields.append(("byteorder", sys.byteorder))
+
+    for attempt in range(retries + 1 if replayable else 1):
+      boundary = uuid.uuid4().hex
+      if replayable:
+        # We know the size of the data, so the body can be streamed with a Content-Length.
+        length = sum([len(block) for block in encode_multipart(boundary, fields, "data", [])])
+        length += sum([chunk.nbytes for chunk in chunks]) if use_binary else sum([len(block) for block in encode_arrayset_data(chunks, False)])
+        body = StreamingBody(encode_multipart(boundary, fields, "data", encode_arrayset_data(chunks, use_binary)), length)
+      else:
+        # Otherwise, use chunked transfer encoding.  CherryPy stops parsing a
+        # chunked multipart body as soon as it reads the end of the stream,
+        # even if that happens while it's still looking at an earlier part, so
+        # the body is padded with an epilogue (ignored by multipart parsers)
+        # that's longer than CherryPy reads at once.
+        body = itertools.chain(encode_multipart(boundary, fields, "data", encode_arrayset_data(itertools.chain(chunks, data), use_binary)), [" " * 65536])
+      try:
+        self.request("PUT", "/models/%s/arraysets/%s/data" % (mid, name), headers={"content-type":"multipart/form-data; boundary=%s" % boundary}, data=body)
+        return
+      except (requests.exceptions.ConnectionError, requests.exceptions.HTTPError) as e:
+        response = getattr(e, "response", None)
+        if response is not None and response.status_code < 500:
+          raise
+        if attempt == retries or not replayable:
+          raise
+        log.warning("Retrying upload to %s/%s after error: %s" % (mid, name, e))
+        time.sleep(min(2 ** attempt, 30))
+
+  def put_model_arrayset_parts(self, mid, name, parts, threads=4, retries=3, force_json=False):
+    """Write data to an arrayset artifact using several concurrent requests.
+
+    Each part is uploaded with :func:`put_model_arrayset_data`, including its
+    retries, and at most `threads` parts are read from `parts` and uploaded at
+    a time.  For example, to upload a large column in pieces of one million
+    rows each::
+
+      parts = (("0/0/%s:%s" % (begin, begin + 1000000), [column[begin : begin + 1000000]]) for begin in range(0, len(column), 1000000))
+      connection.put_model_arrayset_parts(mid, "data-table", parts)
 
-  def put_model_arrayset_array(self, mid, name, array, dimensions, attributes):
-    """Starts a new array set array, ready to receive data."""
+    Parameters
+    ----------
+    mid: string, required
+      Unique model identifier.
+    name: string, required
+      Unique (to the model) arrayset artifact name.
+    parts: iterable, required
+      A collection of (hyperchunks, data) tuples, as would be passed to
+      :func:`put_model_arrayset_data`.
+    threads: integer, optional
+      Number of concurrent requests.
+    retries: integer, optional
+      Number of times to retry each failed part.
+    force_json: bool, optional)
+      Force the client to upload data using JSON instead of the binary format.
+    """
+    parts = iter(parts)
+    lock = threading.Lock()
+    errors = []
+
+    def upload():
+      while True:
+        with lock:
+          if errors:
+            return
+          part = next(parts, None)
+        if part is None:
+          return
+        hyperchunks, data = part
+        try:
+          self.put_model_arrayset_data(mid, name, hyperchunks, list(data), force_json=force_json, retries=retries)
+        except Exception as e:
+          with lock:
+            errors.append(e)
+          return
+
+    workers = [threading.Thread(target=upload) for index in range(threads)]
+    for worker in workers:
+      worker.start()
+    for worker in workers:
+      worker.join()
+    if errors:
+      raise errors[0]
+
+  def put_model_arrayset_array(self, mid, name, array, dimensions, attributes, storage_policy=None):
+    """Starts a new array set array, ready to receive data.
+
+    `storage_policy` optionally names the storage policy for every attribute,
+    or maps attribute names to policy names, overriding the arrayset default.
+    """
     stub = slycat.darray.Stub(dimensions, attributes)
-    self.request("PUT", "/models/%s/arraysets/%s/arrays/%s" % (mid, name, array), headers={"content-type":"application/json"}, data=json.dumps({"dimensions":stub.dimensions, "attributes":stub.attributes}))
+    content = {"dimensions":stub.dimensions, "attributes":stub.attributes}
+    if storage_policy is not None:
+      content["storage-policy"] = storage_policy
+    self.request("PUT", "/models/%s/arraysets/%s/arrays/%s" % (mid, name, array), headers={"content-type":"application/json"}, data=json.dumps(content))
+
+  def put_model_arrayset(self, mid, name, input=True, storage_policy=None):
+    """Starts a new model array set artifact, ready to receive data.
 
-  def put_model_arrayset(self, mid, name, input=True):
-    """Starts a new model array set artifact, ready to receive data."""
-    self.request("PUT", "/models/%s/arraysets/%s" % (mid, name), headers={"content-type":"application/json"}, data=json.dumps({"input":input}))
+    `storage_policy` optionally names the default storage policy for arrays
+    in the arrayset: "contiguous", "chunked", "gzip", "lzf", "dictionary",
+    or "bitmap".
+    """
+    content = {"input":input}
+    if storage_policy is not None:
+      content["storage-policy"] = storage_policy
+    self.request("PUT", "/models/%s/arraysets/%s" % (mid, name), headers={"content-type":"application/json"}, data=json.dumps(content))
 
   def put_model_file(self, mid, name, data, content_type, input=True):
     """Stores a model file artifact."""
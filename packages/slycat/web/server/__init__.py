@@ -3,81 +3,718 @@
 # rights in this software.
 
 import cherrypy
+import collections
+import copy
+import couchdb.http
+import itertools
 import numbers
 import numpy
 import os
-import shutil
 import slycat.hdf5
 import slycat.hyperchunks
 import slycat.web.server.hdf5
+import slycat.web.server.scheduler
+import sys
+import threading
+import time
 import uuid
 
 def mix(a, b, amount):
   """Linear interpolation between two numbers.  Useful for computing model progress."""
   return ((1.0 - amount) * a) + (amount * b)
 
-def evaluate(hdf5_array, expression, expression_type, expression_level = 0):
-  """Evaluate a hyperchunk expression."""
-  cherrypy.log.error("%sEvaluating %s expression: %s" % ("  " * expression_level, expression_type, slycat.hyperchunks.tostring(expression)))
-  if isinstance(expression, int):
-    return expression
-  elif isinstance(expression, float):
-    return expression
-  elif isinstance(expression, basestring):
-    return expression
+def compile_expression(expression):
+  """Compile a hyperchunk attribute expression into a function.
+
+  The returned function takes a single argument, an evaluation context with
+  the following methods:
+
+  * `read(attribute)` - attribute values.
+  * `encoding(attribute)` - the codes and dictionary of a dictionary-encoded
+    attribute, or None.
+  * `bitmap(attribute, operator, value)` - a packed bitmap of the elements
+    that satisfy a comparison, from a bitmap index, or None.
+  * `unpack(bitmap)` - the boolean array for a packed bitmap.
+  * `index(dimension)` - array indices along a dimension.
+  * `sort_index(attribute, descending)` - stable sort indices.
+
+  Comparisons between a dictionary-encoded attribute and a constant are
+  evaluated once per dictionary entry, then looked-up using the codes.
+  Comparisons with constants, combined using `and` and `or`, are answered
+  from bitmap indexes (see :func:`compile_bitmap`) when every attribute
+  involved has one.
+
+  Parameters
+  ----------
+  expression: hyperchunks attribute expression, required
+
+  Returns
+  -------
+  function: callable
+  """
+  if isinstance(expression, (int, float, basestring)):
+    return lambda context: expression
   elif isinstance(expression, slycat.hyperchunks.grammar.AttributeIndex):
-    return hdf5_array.get_data(expression.index)[...]
+    attribute = expression.index
+    return lambda context: context.read(attribute)
   elif isinstance(expression, slycat.hyperchunks.grammar.BinaryOperator):
-    left = evaluate(hdf5_array, expression.operands[0], expression_type, expression_level + 1)
-    for operand in expression.operands[1:]:
-      right = evaluate(hdf5_array, operand, expression_type, expression_level + 1)
-      if expression.operator == "<":
-        left = left < right
-      elif expression.operator == ">":
-        left = left > right
-      elif expression.operator == "<=":
-        left = left <= right
-      elif expression.operator == ">=":
-        left = left >= right
-      elif expression.operator == "==":
-        left = left == right
-      elif expression.operator == "!=":
-        left = left != right
-      elif expression.operator == "and":
-        left = numpy.logical_and(left, right)
-      elif expression.operator == "or":
-        left = numpy.logical_or(left, right)
-      elif expression.operator == "in":
-        left = numpy.in1d(left, right)
-      elif expression.operator == "not in":
-        left = numpy.in1d(left, right, invert=True)
-      else:
-        raise ValueError("Unknown operator: %s" % expression.operator)
-    return left
+    if expression.operator not in compile_expression.operators:
+      raise ValueError("Unknown operator: %s" % expression.operator)
+    operator = compile_expression.operators[expression.operator]
+    operands = [compile_expression(operand) for operand in expression.operands]
+    def binary_operator(context):
+      left = operands[0](context)
+      for operand in operands[1:]:
+        left = operator(left, operand(context))
+      return left
+    scan = binary_operator
+    if expression.operator not in ["and", "or"] and len(operands) == 2 and isinstance(expression.operands[0], slycat.hyperchunks.grammar.AttributeIndex) and isinstance(expression.operands[1], (int, float, basestring, slycat.hyperchunks.grammar.List)):
+      attribute = expression.operands[0].index
+      def encoded_operator(context):
+        encoding = context.encoding(attribute)
+        if encoding is None:
+          return binary_operator(context)
+        codes, dictionary = encoding
+        return numpy.asarray(operator(dictionary, operands[1](context)))[codes]
+      scan = encoded_operator
+    bitmap = compile_bitmap(expression)
+    if bitmap is None:
+      return scan
+    def indexed_operator(context):
+      result = bitmap(context)
+      if result is None:
+        return scan(context)
+      return context.unpack(result)
+    return indexed_operator
   elif isinstance(expression, slycat.hyperchunks.grammar.FunctionCall):
     if expression.name == "index":
-      return numpy.indices(hdf5_array.shape)[expression.args[0]]
+      dimension = expression.args[0]
+      return lambda context: context.index(dimension)
     elif expression.name == "rank":
-      values = evaluate(hdf5_array, expression.args[0], expression_type, expression_level + 1)
-      order = numpy.argsort(values)
-      if expression.args[1] == "desc":
-        order = order[::-1]
-      return order
+      descending = len(expression.args) > 1 and expression.args[1] == "desc"
+      if isinstance(expression.args[0], slycat.hyperchunks.grammar.AttributeIndex):
+        attribute = expression.args[0].index
+        return lambda context: context.sort_index(attribute, descending)
+      values = compile_expression(expression.args[0])
+      return lambda context: slycat.hdf5.argsort(values(context), descending)
     else:
       raise ValueError("Unknown function: %s" % expression.name)
   elif isinstance(expression, slycat.hyperchunks.grammar.List):
-    return expression.values
+    values = expression.values
+    return lambda context: values
   else:
     raise ValueError("Unknown expression: %s" % expression)
+compile_expression.operators = {
+  "<": lambda left, right: left < right,
+  ">": lambda left, right: left > right,
+  "<=": lambda left, right: left <= right,
+  ">=": lambda left, right: left >= right,
+  "==": lambda left, right: left == right,
+  "!=": lambda left, right: left != right,
+  "and": numpy.logical_and,
+  "or": numpy.logical_or,
+  "in": lambda left, right: numpy.in1d(left, right),
+  "not in": lambda left, right: numpy.in1d(left, right, invert=True),
+  }
+
+def compile_bitmap(expression):
+  """Compile a hyperchunk filter expression into a function that evaluates it using bitmap indexes.
+
+  Only comparisons between an attribute and a constant (or list of
+  constants), combined with `and` and `or`, can be compiled.  The returned
+  function takes an evaluation context (see :func:`compile_expression`) and
+  returns the matching elements as a bitmap packed with
+  :func:`numpy.packbits`, or None if any attribute in the expression
+  doesn't have a bitmap index, in which case the expression has to be
+  evaluated by reading the attributes instead.
+
+  Parameters
+  ----------
+  expression: hyperchunks attribute expression, required
+
+  Returns
+  -------
+  function: callable, or None if the expression can't be compiled.
+  """
+  if not isinstance(expression, slycat.hyperchunks.grammar.BinaryOperator):
+    return None
+  if expression.operator in ["and", "or"]:
+    operands = [compile_bitmap(operand) for operand in expression.operands]
+    if None in operands:
+      return None
+    operator = numpy.bitwise_and if expression.operator == "and" else numpy.bitwise_or
+    def bitwise_operator(context):
+      result = None
+      for operand in operands:
+        bitmap = operand(context)
+        if bitmap is None:
+          return None
+        result = bitmap if result is None else operator(result, bitmap)
+      return result
+    return bitwise_operator
+  if len(expression.operands) != 2 or not isinstance(expression.operands[0], slycat.hyperchunks.grammar.AttributeIndex) or not isinstance(expression.operands[1], (int, float, basestring, slycat.hyperchunks.grammar.List)):
+    return None
+  attribute = expression.operands[0].index
+  operator = expression.operator
+  value = expression.operands[1].values if isinstance(expression.operands[1], slycat.hyperchunks.grammar.List) else expression.operands[1]
+  return lambda context: context.bitmap(attribute, operator, value)
+
+def elementwise(expression):
+  """Return True if a hyperchunk attribute expression can be evaluated one hyperslice at a time.
+
+  This is true of every expression except those that call rank(), which
+  depends on every value in an attribute.
+  """
+  if isinstance(expression, slycat.hyperchunks.grammar.BinaryOperator):
+    return all([elementwise(operand) for operand in expression.operands])
+  if isinstance(expression, slycat.hyperchunks.grammar.FunctionCall):
+    return expression.name != "rank" and all([elementwise(arg) for arg in expression.args])
+  return True
+
+def hyperslice_indices(shape, dimension, hyperslice):
+  """Return the equivalent of `numpy.indices(shape)[dimension][hyperslice]`, without computing indices for the entire array."""
+  if not isinstance(hyperslice, tuple):
+    hyperslice = (hyperslice,)
+  if Ellipsis in hyperslice:
+    position = hyperslice.index(Ellipsis)
+    hyperslice = hyperslice[:position] + (slice(None),) * (len(shape) - len(hyperslice) + 1) + hyperslice[position + 1:]
+  hyperslice = hyperslice + (slice(None),) * (len(shape) - len(hyperslice))
+
+  extents = [numpy.arange(size)[extent] for size, extent in zip(shape, hyperslice)]
+  result_shape = [len(extent) for extent in extents if numpy.ndim(extent)]
+  result = numpy.empty(result_shape, dtype="int64")
+  if numpy.ndim(extents[dimension]) == 0:
+    result.fill(extents[dimension])
+  else:
+    broadcast_shape = [1] * len(result_shape)
+    broadcast_shape[len([extent for extent in extents[:dimension] if numpy.ndim(extent)])] = -1
+    result[...] = extents[dimension].reshape(broadcast_shape)
+  return result
+
+def expand_hyperslice(shape, hyperslice):
+  """Convert a hyperslice into a tuple containing one explicit slice per dimension.
+
+  Integer indices become slices of length one, so that the selected region
+  keeps every dimension of the array.
+  """
+  if not isinstance(hyperslice, tuple):
+    hyperslice = (hyperslice,)
+  if Ellipsis in hyperslice:
+    position = hyperslice.index(Ellipsis)
+    hyperslice = hyperslice[:position] + (slice(None),) * (len(shape) - len(hyperslice) + 1) + hyperslice[position + 1:]
+  hyperslice = hyperslice + (slice(None),) * (len(shape) - len(hyperslice))
+
+  result = []
+  for size, extent in zip(shape, hyperslice):
+    if isinstance(extent, numbers.Integral):
+      index = extent + size if extent < 0 else extent
+      if not (0 <= index < size):
+        raise IndexError("Index %s out-of-range." % extent)
+      result.append(slice(index, index + 1, 1))
+    else:
+      result.append(slice(*extent.indices(size)))
+  return tuple(result)
+
+class BinaryHypersliceReader(object):
+  """Stores binary hyperslice data from a file, such as a request body, without loading it all into memory.
+
+  Values are read straight from the file into a buffer that's reused for every
+  hyperslice, byte-swapped in place if `byteorder` differs from the server's,
+  and written to the array in blocks of at most `block_size` bytes.  Large
+  hyperslices are split along their slowest-varying dimensions, so memory
+  use is bounded no matter how much data the client sends.  Hyperslices that
+  span more than one block discard the attribute's cached statistics rather
+  than merging them block-by-block, so callers should finish with
+  :meth:`slycat.hdf5.DArray.update_cache`.
+  """
+  def __init__(self, file, byteorder=sys.byteorder, block_size=None):
+    if byteorder not in ["big", "little"]:
+      raise ValueError("Byte order must be big or little.")
+    self.bytes = 0
+    self._file = file
+    self._swap = byteorder != sys.byteorder
+    self._block_size = block_size if block_size is not None else _binary_block_size
+    self._buffer = numpy.empty(0, dtype="uint8")
+
+  def _read(self, dtype, count):
+    """Read `count` values into the buffer, returning them as an array that shares its memory."""
+    size = count * dtype.itemsize
+    if len(self._buffer) < size:
+      self._buffer = numpy.empty(size, dtype="uint8")
+    view = self._buffer[:size]
+    offset = 0
+    while offset < size:
+      if hasattr(self._file, "readinto"):
+        received = self._file.readinto(view[offset:])
+      else:
+        content = self._file.read(size - offset)
+        received = len(content)
+        view[offset : offset + received] = numpy.frombuffer(content, dtype="uint8")
+      if not received:
+        raise ValueError("Expected %s bytes of data, received %s." % (size, offset))
+      offset += received
+    self.bytes += size
+    values = view.view(dtype)
+    if self._swap and dtype.itemsize > 1:
+      values.byteswap(True)
+    return values
+
+  def store(self, array, attribute, hyperslice):
+    """Read the data for one hyperslice and write it to an attribute of a :class:`slycat.hdf5.DArray`."""
+    dtype = numpy.dtype(slycat.hdf5.dtype(array.attributes[attribute]["type"]))
+    if dtype.hasobject:
+      raise ValueError("Binary data can't be stored in %s attributes." % array.attributes[attribute]["type"])
+
+    hyperslice = expand_hyperslice(array.shape, hyperslice)
+    shape = [len(xrange(extent.start, extent.stop, extent.step)) for extent in hyperslice]
+    if not numpy.prod(shape):
+      return
+
+    # Find the trailing dimensions that fit in a block, and split the next dimension to fit.
+    split = len(shape)
+    block_bytes = dtype.itemsize
+    while split > 0 and block_bytes * shape[split - 1] <= self._block_size:
+      split -= 1
+      block_bytes *= shape[split]
+    if split == 0:
+      array.set_data(attribute, hyperslice, self._read(dtype, numpy.prod(shape)).reshape(shape))
+      return
+
+    split -= 1
+    step = max(1, self._block_size // block_bytes)
+    for outer in itertools.product(*[xrange(size) for size in shape[:split]]):
+      prefix = tuple(slice(extent.start + index * extent.step, extent.start + index * extent.step + 1, 1) for index, extent in zip(outer, hyperslice))
+      extent = hyperslice[split]
+      for begin in xrange(0, shape[split], step):
+        end = min(begin + step, shape[split])
+        block = prefix + (slice(extent.start + begin * extent.step, extent.start + end * extent.step, extent.step),) + hyperslice[split + 1:]
+        block_shape = [1] * split + [end - begin] + shape[split + 1:]
+        array.set_data(attribute, block, self._read(dtype, numpy.prod(block_shape)).reshape(block_shape), statistics=False)
+
+_binary_block_size = 16 * 1024 * 1024
+
+class Evaluator(object):
+  """Evaluates hyperchunk attribute expressions on behalf of a single request.
+
+  Compiled expressions, attribute values, and expression results are cached
+  for the lifetime of the evaluator, so each expression is evaluated at most
+  once per array, no matter how many hyperslices are requested.  Results are
+  cached by array index, so an evaluator can be used with the same arrayset
+  across multiple opens of the underlying file.
+  """
+  def __init__(self):
+    self._expressions = {}
+    self._attributes = {}
+    self._encodings = {}
+    self._bitmaps = {}
+    self._results = {}
+
+  def _compile(self, expression):
+    key = slycat.hyperchunks.tostring(expression)
+    if key not in self._expressions:
+      self._expressions[key] = (key, compile_expression(expression), elementwise(expression))
+    return self._expressions[key]
+
+  class _Context(object):
+    def __init__(self, evaluator, hdf5_array, array_index, hyperslice):
+      self._evaluator = evaluator
+      self._hdf5_array = hdf5_array
+      self._array_index = array_index
+      self._hyperslice = hyperslice
+
+    def read(self, attribute):
+      key = (self._array_index, attribute)
+      if key in self._evaluator._attributes:
+        values = self._evaluator._attributes[key]
+        return values if self._hyperslice is None else values[self._hyperslice]
+      if self._hyperslice is not None:
+        return self._hdf5_array.get_data(attribute)[self._hyperslice]
+      values = self._evaluator._attributes[key] = self._hdf5_array.get_data(attribute)[...]
+      return values
+
+    def encoding(self, attribute):
+      key = (self._array_index, attribute)
+      if key not in self._evaluator._encodings:
+        self._evaluator._encodings[key] = self._hdf5_array.get_encoding(attribute)
+      encoding = self._evaluator._encodings[key]
+      if encoding is None:
+        return None
+      codes, dictionary = encoding
+      return codes[Ellipsis if self._hyperslice is None else self._hyperslice], dictionary
+
+    def bitmap(self, attribute, operator, value):
+      key = (self._array_index, attribute, operator, repr(value))
+      if key not in self._evaluator._bitmaps:
+        self._evaluator._bitmaps[key] = self._hdf5_array.get_bitmap(attribute, operator, value)
+      return self._evaluator._bitmaps[key]
+
+    def unpack(self, bitmap):
+      values = numpy.unpackbits(bitmap)[:self._hdf5_array.shape[0]].astype("bool")
+      return values if self._hyperslice is None else values[self._hyperslice]
+
+    def index(self, dimension):
+      return hyperslice_indices(self._hdf5_array.shape, dimension, Ellipsis if self._hyperslice is None else self._hyperslice)
+
+    def sort_index(self, attribute, descending):
+      if self._hdf5_array.ndim == 1:
+        return self._hdf5_array.get_sort_index(attribute, descending)
+      return slycat.hdf5.argsort(self.read(attribute), descending)
+
+  def _evaluate(self, hdf5_array, array_index, expression):
+    key, function, elementwise = self._compile(expression)
+    if (array_index, key) not in self._results:
+      self._results[(array_index, key)] = function(Evaluator._Context(self, hdf5_array, array_index, None))
+    return self._results[(array_index, key)]
+
+  def evaluate(self, hdf5_array, array_index, expression, hyperslice=None, order=None):
+    """Evaluate a hyperchunk attribute expression.
+
+    When there's no order expression, an expression that doesn't call
+    rank() is evaluated using only the data within the hyperslice, so plain
+    slices are pushed-down to the underlying file.  Otherwise, the expression
+    is evaluated once for the entire array and cached, and the hyperslice is
+    extracted from the (reordered) result.
+
+    Parameters
+    ----------
+    hdf5_array: :class:`slycat.hdf5.DArray`, required
+    array_index: integer, required
+      Index of the array within its arrayset, used to cache results.
+    expression: hyperchunks attribute expression, required
+    hyperslice: hyperslice, optional
+      Subset of the results to return.  By default, the results for the
+      entire array are returned.
+    order: hyperchunks attribute expression, optional
+      Expression that reorders the results before the hyperslice is applied.
+
+    Returns
+    -------
+    values: numpy.ndarray
+    """
+    if order is None and hyperslice is not None:
+      key, function, elementwise = self._compile(expression)
+      if elementwise and (array_index, key) not in self._results:
+        return function(Evaluator._Context(self, hdf5_array, array_index, hyperslice))
+
+    values = self._evaluate(hdf5_array, array_index, expression)
+    if order is not None:
+      order = self._evaluate(hdf5_array, array_index, order)
+      if hyperslice is not None and numpy.ndim(values) == 1:
+        return values[order[hyperslice]]
+      values = values[order]
+    if hyperslice is not None:
+      values = values[hyperslice]
+    return values
+
+class HistogramCache(object):
+  """Bounded, least-recently-used cache of attribute histograms.
+
+  Computing a histogram for a computed attribute expression, a subset of an
+  attribute, or an attribute without a cached sort index reads every value,
+  so results are cached by artifact, array version, expression, subset, and
+  bins.  Since :meth:`slycat.hdf5.DArray.set_data` changes the array version,
+  results for modified arrays are never returned, and simply age out of the
+  cache.  Arrays that don't record a version aren't cached.
+  """
+  def __init__(self, capacity=1024):
+    self.capacity = capacity
+    self.hits = 0
+    self.misses = 0
+    self._lock = threading.Lock()
+    self._entries = collections.OrderedDict()
+
+  def get(self, key, compute):
+    """Return a histogram, calling `compute()` to create it on a cache miss."""
+    if key[2] is None:
+      return compute()
+    with self._lock:
+      if key in self._entries:
+        self._entries[key] = self._entries.pop(key) # Mark the entry as most-recently used.
+        self.hits += 1
+        return self._entries[key]
+      self.misses += 1
+
+    result = compute()
+
+    with self._lock:
+      self._entries[key] = result
+      while len(self._entries) > self.capacity:
+        self._entries.popitem(last=False)
+    return result
+
+  def __len__(self):
+    with self._lock:
+      return len(self._entries)
+
+  def statistics(self):
+    """Return a dict containing cache hit and miss counts."""
+    with self._lock:
+      return {"size": len(self._entries), "capacity": self.capacity, "hits": self.hits, "misses": self.misses}
+
+histogram_cache = HistogramCache()
+
+class ArraysetVersions(object):
+  """Bounded, least-recently-used cache of arrayset artifact versions.
+
+  Arrayset artifacts belonging to a finished model don't change, so their
+  versions are cached by artifact id, and conditional requests for them can be
+  answered without opening the underlying HDF5 file.  Versions for models
+  that are still running are always read from the file.  Writes made through
+  this process discard the cached version for the artifact, in case a
+  finished model is modified.
+  """
+  def __init__(self, capacity=4096):
+    self.capacity = capacity
+    self.hits = 0
+    self.misses = 0
+    self._lock = threading.Lock()
+    self._entries = collections.OrderedDict()
+
+  def get(self, database, model, name):
+    """Return the version of a model arrayset artifact, or None if the artifact doesn't record one."""
+    artifact = model["artifact:%s" % name]
+    finished = model.get("state", None) == "finished"
+    if finished:
+      with self._lock:
+        if artifact in self._entries:
+          self._entries[artifact] = self._entries.pop(artifact) # Mark the entry as most-recently used.
+          self.hits += 1
+          return self._entries[artifact]
+        self.misses += 1
+
+    with slycat.web.server.hdf5.open(artifact, "r") as file:
+      version = slycat.hdf5.ArraySet(file).version
+
+    if finished and version is not None:
+      with self._lock:
+        self._entries[artifact] = version
+        while len(self._entries) > self.capacity:
+          self._entries.popitem(last=False)
+    return version
+
+  def discard(self, artifact):
+    """Forget the cached version of an artifact that is about to be modified."""
+    with self._lock:
+      self._entries.pop(artifact, None)
+
+  def __len__(self):
+    with self._lock:
+      return len(self._entries)
+
+  def statistics(self):
+    """Return a dict containing cache hit and miss counts."""
+    with self._lock:
+      return {"size": len(self._entries), "capacity": self.capacity, "hits": self.hits, "misses": self.misses}
+
+arrayset_versions = ArraysetVersions()
+
+class ModelUpdates(object):
+  """Coalesces model progress updates, and saves models without losing concurrent changes.
+
+  Progress and message updates are applied to the caller's model immediately,
+  but are saved to the database at most once every `interval` seconds per
+  model, since every save fans-out to every client watching the changes
+  feed.  Updates that haven't been saved yet are saved by a background thread
+  once the interval has passed, or along with the next change to any other
+  model field, such as a state transition, which is always saved immediately.
+
+  Callers identify the fields they've changed, so if a save fails because
+  someone else modified the model in the meantime, only those fields are
+  re-applied to the latest revision (list fields are merged), instead of
+  failing or overwriting the other changes.
+  """
+  def __init__(self, interval=1.0, retries=10):
+    self.interval = interval
+    self.retries = retries
+    self.saves = 0
+    self.coalesced = 0
+    self.conflicts = 0
+    self._locks = None
+    self._condition = threading.Condition(threading.Lock())
+    self._pending = {}
+    self._saved = {}
+    self._documents = {}
+    self._thread = None
+
+  def _lock(self, mid):
+    """Return a context manager that holds the exclusive lock for a model."""
+    with self._condition:
+      if self._locks is None:
+        self._locks = slycat.web.server.hdf5.LockManager()
+    return self._locks.exclusive(mid)
+
+  def update(self, database, model, fields):
+    """Apply updates to a model, saving them now, or later if they're only progress updates."""
+    mid = model["_id"]
+    with self._lock(mid):
+      for name, value in fields.items():
+        model[name] = value
+      with self._condition:
+        due = self._saved.get(mid, 0) + self.interval
+        buffered = time.time() < due and all(name in ["progress", "message"] for name in fields)
+        if buffered:
+          entry = self._pending.setdefault(mid, {"fields": {}})
+          entry["fields"].update(fields)
+          entry["database"] = database
+          entry["model"] = model
+          entry["due"] = due
+          self.coalesced += 1
+          self._start()
+          self._condition.notify()
+      if not buffered:
+        self._save(database, model, fields.keys())
+
+  def save(self, database, model, fields):
+    """Save changes to a model, along with any unsaved progress updates.
+
+    Parameters
+    ----------
+    database: database object, required
+    model: model object, required
+    fields: list, required
+      Names of the model fields that were changed.  A (name, key) tuple
+      identifies a single key within a dict-valued field.
+    """
+    with self._lock(model["_id"]):
+      self._save(database, model, fields)
+
+  def _save(self, database, model, fields):
+    """Save a model.  Assumes the caller holds the model lock."""
+    mid = model["_id"]
+    with self._condition:
+      entry = self._pending.pop(mid, None)
+    if entry is not None:
+      for name, value in entry["fields"].items():
+        model[name] = value
+      fields = list(fields) + entry["fields"].keys()
+
+    document = model
+    for attempt in range(self.retries):
+      try:
+        database.save(document)
+        break
+      except couchdb.http.ResourceConflict:
+        if attempt + 1 == self.retries:
+          raise
+        self.conflicts += 1
+        document = database[mid]
+        for field in fields:
+          source, target, name = (model[field[0]], document.setdefault(field[0], {}), field[1]) if isinstance(field, tuple) else (model, document, field)
+          if name not in source:
+            target.pop(name, None)
+          elif isinstance(source[name], list) and isinstance(target.get(name, None), list):
+            target[name] = list(set(target[name] + source[name]))
+          else:
+            target[name] = source[name]
+
+    # Bring the caller's model up to date with the saved revision, without emptying it along the way.
+    if document is not model:
+      for name in [name for name in model.keys() if name not in document]:
+        del model[name]
+      model.update(document)
+    self._record_save(mid, copy.deepcopy(model))
+
+  def _save_pending(self, mid, entry):
+    """Save buffered updates from the background thread.  Assumes the caller holds the model lock.
+
+    Other threads may be using the caller's model, so the buffered fields are
+    applied to a copy of the last revision saved through this object instead,
+    and only the new revision number is copied back, if the caller's model
+    was up to date.  The latest revision is only fetched if the model hasn't
+    been saved recently, or the save conflicts.
+    """
+    with self._condition:
+      if self._pending.get(mid, None) is not entry:
+        return
+      del self._pending[mid]
+      base = self._documents.get(mid, None)
+
+    database = entry["database"]
+    for attempt in range(self.retries):
+      if base is None:
+        base = database[mid]
+      document = dict(base)
+      document.update(entry["fields"])
+      try:
+        database.save(document)
+        break
+      except couchdb.http.ResourceConflict:
+        if attempt + 1 == self.retries:
+          raise
+        self.conflicts += 1
+        base = None
+
+    model = entry["model"]
+    if model.get("_rev", None) == base["_rev"]:
+      model["_rev"] = document["_rev"]
+    self._record_save(mid, document)
+
+  def _record_save(self, mid, document):
+    """Record the time and contents of a model save, forgetting models that haven't been saved recently."""
+    with self._condition:
+      self.saves += 1
+      now = time.time()
+      self._saved[mid] = now
+      self._documents[mid] = document
+      for key in [key for key, saved in self._saved.items() if saved + self.interval < now and key not in self._pending]:
+        del self._saved[key]
+        self._documents.pop(key, None)
+
+  def _start(self):
+    """Start the background thread that saves buffered updates.  Assumes the caller holds self._condition."""
+    if self._thread is None or not self._thread.is_alive():
+      self._thread = threading.Thread(name="Model updates", target=self._run)
+      self._thread.daemon = True
+      self._thread.start()
+
+  def _run(self):
+    while True:
+      mid, entry = None, None
+      try:
+        with self._condition:
+          while not self._pending:
+            self._condition.wait()
+          mid, entry = min(self._pending.items(), key=lambda item: item[1]["due"])
+          delay = entry["due"] - time.time()
+          if delay > 0:
+            self._condition.wait(delay)
+            continue
+        with self._lock(mid):
+          self._save_pending(mid, entry)
+      except Exception as e:
+        cherrypy.log.error("Discarding updates to model %s: %s" % (mid, e))
+        with self._condition:
+          if self._pending.get(mid, None) is entry:
+            del self._pending[mid]
+
+  def flush(self):
+    """Save every buffered update immediately."""
+    with self._condition:
+      mids = self._pending.keys()
+    for mid in mids:
+      with self._lock(mid):
+        with self._condition:
+          entry = self._pending.get(mid, None)
+        if entry is not None:
+          self._save_pending(mid, entry)
+
+  def statistics(self):
+    """Return a dict containing save, coalesced update, and conflict counts."""
+    with self._condition:
+      return {"interval": self.interval, "pending": len(self._pending), "saves": self.saves, "coalesced": self.coalesced, "conflicts": self.conflicts}
+
+model_updates = ModelUpdates()
 
 def update_model(database, model, **kwargs):
-  """Update the model, and signal any waiting threads that it's changed."""
-  for name, value in kwargs.items():
-    if name in ["state", "result", "started", "finished", "progress", "message"]:
-      model[name] = value
-  database.save(model)
+  """Update the model, and signal any waiting threads that it's changed.
+
+  Progress and message updates are coalesced, and saved to the database at a
+  bounded rate.  Changes to any other field are saved immediately, along with
+  any pending progress updates.  See :class:`ModelUpdates`.
+  """
+  model_updates.update(database, model, {name: value for name, value in kwargs.items() if name in ["state", "result", "started", "finished", "progress", "message"]})
 
-def get_model_arrayset_metadata(database, model, name, arrays=None, statistics=None, unique=None):
+def get_model_arrayset_metadata(database, model, name, arrays=None, statistics=None, unique=None, histograms=None, bins=10, quantiles=False):
   """Retrieve metadata describing an arrayset artifact.
 
   Parameters
@@ -95,6 +732,15 @@ def get_model_arrayset_metadata(database, model, name, arrays=None, statistics=N
   unique: string or hyperchunks parse tree, optional
     Specifies a collection of array attributes, in :ref:`Hyperchunks` format.
     Unique values from each attribute will be returned in the results.
+  histograms: string or hyperchunks parse tree, optional
+    Specifies a collection of numeric array attributes or expressions, in
+    :ref:`Hyperchunks` format.  A histogram of each attribute will be
+    returned in the results.  If hyperslices are specified, the histogram
+    only includes the values they contain.
+  bins: integer or sequence of numbers, optional
+    The number of histogram bins, or explicit bin edges.
+  quantiles: bool, optional
+    Use quantile (equal-count) histogram bins instead of equal-width bins.
 
   Returns
   -------
@@ -110,78 +756,105 @@ def get_model_arrayset_metadata(database, model, name, arrays=None, statistics=N
     statistics = slycat.hyperchunks.parse(statistics)
   if isinstance(unique, basestring):
     unique = slycat.hyperchunks.parse(unique)
+  if isinstance(histograms, basestring):
+    histograms = slycat.hyperchunks.parse(histograms)
 
   # Handle legacy behavior.
-  if arrays is None and statistics is None and unique is None:
-    with slycat.web.server.hdf5.lock:
-      with slycat.web.server.hdf5.open(model["artifact:%s" % name], "r") as file: 
-        hdf5_arrayset = slycat.hdf5.ArraySet(file)
-        results = []
-        for array in sorted(hdf5_arrayset.keys()):
-          hdf5_array = hdf5_arrayset[array]
-          results.append({
-            "array": int(array),
-            "index" : int(array),
-            "dimensions" : hdf5_array.dimensions,
-            "attributes" : hdf5_array.attributes,
-            "shape": tuple([dimension["end"] - dimension["begin"] for dimension in hdf5_array.dimensions]),
-            })
-        return results
-
-  with slycat.web.server.hdf5.lock:
-    with slycat.web.server.hdf5.open(model["artifact:%s" % name], "r+") as file: # We have to open the file with writing enabled in case the statistics cache needs to be updated.
+  if arrays is None and statistics is None and unique is None and histograms is None:
+    with slycat.web.server.hdf5.open(model["artifact:%s" % name], "r") as file: 
       hdf5_arrayset = slycat.hdf5.ArraySet(file)
-      results = {}
-      if arrays is not None:
-        results["arrays"] = []
-        for array in slycat.hyperchunks.arrays(arrays, hdf5_arrayset.array_count()):
-          hdf5_array = hdf5_arrayset[array.index]
-          results["arrays"].append({
-            "index" : array.index,
-            "dimensions" : hdf5_array.dimensions,
-            "attributes" : hdf5_array.attributes,
-            "shape": tuple([dimension["end"] - dimension["begin"] for dimension in hdf5_array.dimensions]),
-            })
-      if statistics is not None:
-        results["statistics"] = []
-        for array in slycat.hyperchunks.arrays(statistics, hdf5_arrayset.array_count()):
-          hdf5_array = hdf5_arrayset[array.index]
-          for attribute in array.attributes(len(hdf5_array.attributes)):
-            statistics = {}
-            statistics["array"] = array.index
-            if isinstance(attribute.expression, slycat.hyperchunks.grammar.AttributeIndex):
-              statistics["attribute"] = attribute.expression.index
-              statistics.update(hdf5_array.get_statistics(attribute.expression.index))
-            else:
-              values = evaluate(hdf5_array, attribute.expression, "statistics")
-              statistics["min"] = values.min()
-              statistics["max"] = values.max()
-              statistics["unique"] = len(numpy.unique(values))
-            results["statistics"].append(statistics)
-
-      if unique is not None:
-        results["unique"] = []
-        for array in slycat.hyperchunks.arrays(unique, hdf5_arrayset.array_count()):
-          hdf5_array = hdf5_arrayset[array.index]
-          for attribute in array.attributes(len(hdf5_array.attributes)):
-            unique = {}
-            unique["array"] = array.index
-            unique["values"] = []
-            if isinstance(attribute.expression, slycat.hyperchunks.grammar.AttributeIndex):
-              for hyperslice in attribute.hyperslices():
-                unique["attribute"] = attribute.expression.index
-                unique["values"].append(hdf5_array.get_unique(attribute.expression.index, hyperslice)["values"])
-            else:
-              values = evaluate(hdf5_array, attribute.expression, "uniques")
-              for hyperslice in attribute.hyperslices():
-                unique["values"].append(numpy.unique(values)[hyperslice])
-            results["unique"].append(unique)
-
+      results = []
+      for array in sorted(hdf5_arrayset.keys()):
+        hdf5_array = hdf5_arrayset[array]
+        results.append({
+          "array": int(array),
+          "index" : int(array),
+          "dimensions" : hdf5_array.dimensions,
+          "attributes" : hdf5_array.attributes,
+          "shape": tuple([dimension["end"] - dimension["begin"] for dimension in hdf5_array.dimensions]),
+          })
       return results
 
+  evaluator = Evaluator()
+  with slycat.web.server.hdf5.open(model["artifact:%s" % name], "r") as file:
+    hdf5_arrayset = slycat.hdf5.ArraySet(file)
+    results = {}
+    if arrays is not None:
+      results["arrays"] = []
+      for array in slycat.hyperchunks.arrays(arrays, hdf5_arrayset.array_count()):
+        hdf5_array = hdf5_arrayset[array.index]
+        results["arrays"].append({
+          "index" : array.index,
+          "dimensions" : hdf5_array.dimensions,
+          "attributes" : hdf5_array.attributes,
+          "shape": tuple([dimension["end"] - dimension["begin"] for dimension in hdf5_array.dimensions]),
+          })
+    if statistics is not None:
+      results["statistics"] = []
+      for array in slycat.hyperchunks.arrays(statistics, hdf5_arrayset.array_count()):
+        hdf5_array = hdf5_arrayset[array.index]
+        for attribute in array.attributes(len(hdf5_array.attributes)):
+          statistics = {}
+          statistics["array"] = array.index
+          if isinstance(attribute.expression, slycat.hyperchunks.grammar.AttributeIndex):
+            statistics["attribute"] = attribute.expression.index
+            statistics.update(hdf5_array.get_statistics(attribute.expression.index))
+          else:
+            values = evaluator.evaluate(hdf5_array, array.index, attribute.expression)
+            statistics["min"] = values.min()
+            statistics["max"] = values.max()
+            statistics["unique"] = len(numpy.unique(values))
+          results["statistics"].append(statistics)
+
+    if unique is not None:
+      results["unique"] = []
+      for array in slycat.hyperchunks.arrays(unique, hdf5_arrayset.array_count()):
+        hdf5_array = hdf5_arrayset[array.index]
+        for attribute in array.attributes(len(hdf5_array.attributes)):
+          unique = {}
+          unique["array"] = array.index
+          unique["values"] = []
+          if isinstance(attribute.expression, slycat.hyperchunks.grammar.AttributeIndex):
+            for hyperslice in attribute.hyperslices():
+              unique["attribute"] = attribute.expression.index
+              unique["values"].append(hdf5_array.get_unique(attribute.expression.index, hyperslice)["values"])
+          else:
+            values = numpy.unique(evaluator.evaluate(hdf5_array, array.index, attribute.expression))
+            for hyperslice in attribute.hyperslices():
+              unique["values"].append(values[hyperslice])
+          results["unique"].append(unique)
+
+    if histograms is not None:
+      results["histograms"] = []
+      for array in slycat.hyperchunks.arrays(histograms, hdf5_arrayset.array_count()):
+        hdf5_array = hdf5_arrayset[array.index]
+        for attribute in array.attributes(len(hdf5_array.attributes)):
+          hyperslices = list(attribute.hyperslices())
+          histogram = {}
+          histogram["array"] = array.index
+          if isinstance(attribute.expression, slycat.hyperchunks.grammar.AttributeIndex):
+            histogram["attribute"] = attribute.expression.index
+          if isinstance(attribute.expression, slycat.hyperchunks.grammar.AttributeIndex) and not hyperslices:
+            compute = lambda: hdf5_array.get_histogram(attribute.expression.index, bins, quantiles)
+          elif hyperslices:
+            compute = lambda: slycat.hdf5.histogram(numpy.concatenate([numpy.ravel(evaluator.evaluate(hdf5_array, array.index, attribute.expression, hyperslice)) for hyperslice in hyperslices]), bins, quantiles)
+          else:
+            compute = lambda: slycat.hdf5.histogram(evaluator.evaluate(hdf5_array, array.index, attribute.expression), bins, quantiles)
+          key = (model["artifact:%s" % name], array.index, hdf5_array.version, slycat.hyperchunks.tostring(attribute.expression), repr(hyperslices), repr(bins), quantiles)
+          histogram.update(histogram_cache.get(key, compute))
+          results["histograms"].append(histogram)
+
+    return results
+
 def get_model_arrayset_data(database, model, name, hyperchunks):
   """Read data from an arrayset artifact.
 
+  Data is read in batches of up to `get_model_arrayset_data.buffer_size`
+  bytes.  Each batch is read while holding a shared lock on the artifact, and
+  the file is closed and the lock released before any of the batch is
+  yielded, so a slow consumer (such as a client draining a socket) never holds
+  the artifact open or locked.
+
   Parameters
   ----------
   database: database object, required
@@ -202,46 +875,147 @@ def get_model_arrayset_data(database, model, name, hyperchunks):
   if isinstance(hyperchunks, basestring):
     hyperchunks = slycat.hyperchunks.parse(hyperchunks)
 
-  with slycat.web.server.hdf5.lock:
-    with slycat.web.server.hdf5.open(model["artifact:%s" % name], "r") as file:
+  artifact = model["artifact:%s" % name]
+
+  # Expand the hyperchunks into an explicit list of hyperslices to be read.
+  hyperslices = []
+  with slycat.web.server.hdf5.open(artifact, "r") as file:
+    hdf5_arrayset = slycat.hdf5.ArraySet(file)
+    for array in slycat.hyperchunks.arrays(hyperchunks, hdf5_arrayset.array_count()):
+      hdf5_array = hdf5_arrayset[array.index]
+      for attribute in array.attributes(len(hdf5_array.attributes)):
+        for hyperslice in attribute.hyperslices():
+          hyperslices.append((array.index, array.order, attribute.expression, hyperslice))
+
+  evaluator = Evaluator()
+  position = 0
+  while position < len(hyperslices):
+    buffer = []
+    buffer_size = 0
+    with slycat.web.server.hdf5.open(artifact, "r") as file:
       hdf5_arrayset = slycat.hdf5.ArraySet(file)
-      for array in slycat.hyperchunks.arrays(hyperchunks, hdf5_arrayset.array_count()):
-        hdf5_array = hdf5_arrayset[array.index]
+      while position < len(hyperslices) and (not buffer or buffer_size < get_model_arrayset_data.buffer_size):
+        array_index, order, expression, hyperslice = hyperslices[position]
+        hdf5_array = hdf5_arrayset[array_index]
+        values = evaluator.evaluate(hdf5_array, array_index, expression, hyperslice, order)
+        buffer.append(values)
+        buffer_size += values.nbytes
+        position += 1
 
-        if array.order is not None:
-          order = evaluate(hdf5_array, array.order, "order")
+    for values in buffer:
+      yield values
+get_model_arrayset_data.buffer_size = 16 * 1024 * 1024
 
-        for attribute in array.attributes(len(hdf5_array.attributes)):
-          for hyperslice in attribute.hyperslices():
-            values = evaluate(hdf5_array, attribute.expression, "attribute")
-            if array.order is not None:
-              yield values[order][hyperslice]
-            else:
-              yield values[hyperslice]
+def get_model_array_lod(database, model, name, array, x, y, viewport=None, resolution=(256, 256), limit=None, index=()):
+  """Summarize a scatterplot of two array attributes, for display at a given resolution.
+
+  Returns the points within the viewport if there are no more than `limit`,
+  or a binned density plus one representative point per bin otherwise.  The
+  artifact is only read: the first time a pair of attributes is plotted, the
+  multi-resolution pyramid used to answer the request is computed on-the-fly,
+  and a background job stores it in the artifact, so later requests (while
+  panning and zooming) only read the bins they return.
+
+  Parameters
+  ----------
+  database: database object, required
+  model: model object, required
+  name: string, required
+    Unique (to the model) arrayset artifact name.
+  array: integer, required
+    Zero-based index of the array to plot.
+  x, y: integer, required
+    Zero-based indices of the numeric attributes to plot.
+  viewport: sequence of four numbers, optional
+    The (xmin, xmax, ymin, ymax) region to summarize.  Defaults to the bounds
+    of the data.
+  resolution: sequence of two integers, optional
+    The (width, height) of the viewport in pixels.
+  limit: integer, optional
+    Largest number of points to return as-is.  Defaults to
+    `get_model_array_lod.limit`.
+  index: tuple of integers, optional
+    For arrays with more than one dimension, indices along the leading
+    dimensions that select the 1D slice to plot.
+
+  Returns
+  -------
+  summary: dict
+    See :meth:`slycat.hdf5.DArray.get_lod`.
+
+  See Also
+  --------
+  :http:get:`/models/(mid)/arraysets/(name)/arrays/(array)/lod`
+  """
+  artifact = model["artifact:%s" % name]
+  limit = get_model_array_lod.limit if limit is None else limit
+
+  with slycat.web.server.hdf5.open(artifact, "r") as file:
+    hdf5_array = slycat.hdf5.ArraySet(file)[array]
+    stored = hdf5_array.has_lod(x, y, index)
+    summary = hdf5_array.get_lod(x, y, viewport, resolution, limit, index)
+
+  if not stored:
+    key = (artifact, array, x, y, tuple(index))
+    with _lod_jobs_lock:
+      submit = key not in _lod_jobs
+      _lod_jobs.add(key)
+    if submit:
+      slycat.web.server.scheduler.submit(_update_lod, args=key, name="LOD", priority=-1, key=model["_id"])
+
+  return summary
+get_model_array_lod.limit = 10000
+
+_lod_jobs = set()
+_lod_jobs_lock = threading.Lock()
+
+def _update_lod(artifact, array, x, y, index):
+  """Store the level-of-detail pyramid for a pair of attributes, unless the artifact was deleted or the pyramid already exists."""
+  try:
+    if not os.path.exists(slycat.web.server.hdf5.path(artifact)):
+      return
+    with slycat.web.server.hdf5.open(artifact, "r+") as file:
+      hdf5_array = slycat.hdf5.ArraySet(file)[array]
+      if not hdf5_array.has_lod(x, y, index):
+        hdf5_array.update_lod(x, y, index)
+  finally:
+    with _lod_jobs_lock:
+      _lod_jobs.discard((artifact, array, x, y, index))
 
 def get_model_parameter(database, model, name):
   return model["artifact:" + name]
 
-def put_model_arrayset(database, model, name, input=False):
-  """Start a new model array set artifact."""
+def put_model_arrayset(database, model, name, input=False, storage_policy=None):
+  """Start a new model array set artifact.
+
+  Arrays in the arrayset are stored using `storage_policy`, which may be any
+  :class:`slycat.hdf5.StoragePolicy` or policy name, and defaults to
+  `put_model_arrayset.storage_policy`.
+  """
   slycat.web.server.update_model(database, model, message="Starting array set %s." % (name))
   storage = uuid.uuid4().hex
-  with slycat.web.server.hdf5.lock:
-    with slycat.web.server.hdf5.create(storage) as file:
-      arrayset = slycat.hdf5.start_arrayset(file)
-      database.save({"_id" : storage, "type" : "hdf5"})
-      model["artifact:%s" % name] = storage
-      model["artifact-types"][name] = "hdf5"
-      if input:
-        model["input-artifacts"] = list(set(model["input-artifacts"] + [name]))
-      database.save(model)
-
-def put_model_array(database, model, name, array_index, attributes, dimensions):
+  with slycat.web.server.hdf5.create(storage) as file:
+    arrayset = slycat.hdf5.start_arrayset(file, storage_policy if storage_policy is not None else put_model_arrayset.storage_policy)
+    database.save({"_id" : storage, "type" : "hdf5"})
+    model["artifact:%s" % name] = storage
+    model["artifact-types"][name] = "hdf5"
+    if input:
+      model["input-artifacts"] = list(set(model["input-artifacts"] + [name]))
+    model_updates.save(database, model, _artifact_fields(name, input))
+put_model_arrayset.storage_policy = "contiguous"
+
+def put_model_array(database, model, name, array_index, attributes, dimensions, storage_policy=None):
+  """Start a new array in an arrayset artifact.
+
+  `storage_policy` may be a :class:`slycat.hdf5.StoragePolicy`, a policy name,
+  or a dict mapping attribute names to either, and defaults to the arrayset's
+  policy.
+  """
   slycat.web.server.update_model(database, model, message="Starting array set %s array %s." % (name, array_index))
   storage = model["artifact:%s" % name]
-  with slycat.web.server.hdf5.lock:
-    with slycat.web.server.hdf5.open(storage, "r+") as file:
-      slycat.hdf5.ArraySet(file).start_array(array_index, dimensions, attributes)
+  arrayset_versions.discard(storage)
+  with slycat.web.server.hdf5.open(storage, "r+") as file:
+    slycat.hdf5.ArraySet(file).start_array(array_index, dimensions, attributes, storage=storage_policy)
 
 def put_model_arrayset_data(database, model, name, hyperchunks, data):
   """Write data to an arrayset artifact.
@@ -269,22 +1043,23 @@ def put_model_arrayset_data(database, model, name, hyperchunks, data):
 
   slycat.web.server.update_model(database, model, message="Storing data to array set %s." % (name))
 
-  with slycat.web.server.hdf5.lock:
-    with slycat.web.server.hdf5.open(model["artifact:%s" % name], "r+") as file:
-      hdf5_arrayset = slycat.hdf5.ArraySet(file)
-      for array in slycat.hyperchunks.arrays(hyperchunks, hdf5_arrayset.array_count()):
-        hdf5_array = hdf5_arrayset[array.index]
-        for attribute in array.attributes(len(hdf5_array.attributes)):
-          if not isinstance(attribute.expression, slycat.hyperchunks.grammar.AttributeIndex):
-            raise ValueError("Cannot write to computed attribute.")
-          stored_type = slycat.hdf5.dtype(hdf5_array.attributes[attribute.expression.index]["type"])
-          for hyperslice in attribute.hyperslices():
-            cherrypy.log.error("Writing to %s/%s/%s/%s" % (name, array.index, attribute.expression.index, hyperslice))
+  arrayset_versions.discard(model["artifact:%s" % name])
+  with slycat.web.server.hdf5.open(model["artifact:%s" % name], "r+") as file:
+    hdf5_arrayset = slycat.hdf5.ArraySet(file)
+    for array in slycat.hyperchunks.arrays(hyperchunks, hdf5_arrayset.array_count()):
+      hdf5_array = hdf5_arrayset[array.index]
+      for attribute in array.attributes(len(hdf5_array.attributes)):
+        if not isinstance(attribute.expression, slycat.hyperchunks.grammar.AttributeIndex):
+          raise ValueError("Cannot write to computed attribute.")
+        stored_type = slycat.hdf5.dtype(hdf5_array.attributes[attribute.expression.index]["type"])
+        for hyperslice in attribute.hyperslices():
+          cherrypy.log.error("Writing to %s/%s/%s/%s" % (name, array.index, attribute.expression.index, hyperslice))
 
-            data_hyperslice = next(data)
-            if isinstance(data_hyperslice, list):
-              data_hyperslice = numpy.array(data_hyperslice, dtype=stored_type)
-            hdf5_array.set_data(attribute.expression.index, hyperslice, data_hyperslice)
+          data_hyperslice = next(data)
+          if isinstance(data_hyperslice, list):
+            data_hyperslice = numpy.array(data_hyperslice, dtype=stored_type)
+          hdf5_array.set_data(attribute.expression.index, hyperslice, data_hyperslice)
+      hdf5_array.update_cache()
 
 def put_model_file(database, model, name, value, content_type, input=False):
   fid = database.write_file(model, content=value, content_type=content_type)
@@ -293,7 +1068,7 @@ def put_model_file(database, model, name, value, content_type, input=False):
   model["artifact-types"][name] = "file"
   if input:
     model["input-artifacts"] = list(set(model["input-artifacts"] + [name]))
-  database.save(model)
+  model_updates.save(database, model, _artifact_fields(name, input))
   return model
 
 def put_model_inputs(database, model, source, deep_copy=False):
@@ -306,12 +1081,11 @@ def put_model_inputs(database, model, source, deep_copy=False):
       model["artifact:%s" % name] = original_value
     elif original_type == "hdf5":
       if deep_copy:
+        # Share the original's datasets until the copy is modified.
         new_value = uuid.uuid4().hex
-        os.makedirs(os.path.dirname(slycat.web.server.hdf5.path(new_value)))
-        with slycat.web.server.hdf5.lock:
-          shutil.copy(slycat.web.server.hdf5.path(original_value), slycat.web.server.hdf5.path(new_value))
+        links = slycat.web.server.hdf5.link(original_value, new_value)
         model["artifact:%s" % name] = new_value
-        database.save({"_id" : new_value, "type" : "hdf5"})
+        database.save({"_id" : new_value, "type" : "hdf5", "links" : links})
       else:
         model["artifact:%s" % name] = original_value
     else:
@@ -319,12 +1093,16 @@ def put_model_inputs(database, model, source, deep_copy=False):
     model["artifact-types"][name] = original_type
     model["input-artifacts"] = list(set(model["input-artifacts"] + [name]))
 
-  database.save(model)
+  model_updates.save(database, model, [field for name in source["input-artifacts"] for field in _artifact_fields(name, True)])
 
 def put_model_parameter(database, model, name, value, input=False):
   model["artifact:%s" % name] = value
   model["artifact-types"][name] = "json"
   if input:
     model["input-artifacts"] = list(set(model["input-artifacts"] + [name]))
-  database.save(model)
+  model_updates.save(database, model, _artifact_fields(name, input))
+
+def _artifact_fields(name, input):
+  """Return the model fields changed by storing an artifact."""
+  return ["artifact:%s" % name, ("artifact-types", name)] + (["input-artifacts"] if input else [])
 
@@ -0,0 +1,142 @@
+# Copyright 2013, Sandia Corporation. Under the terms of Contract
+# DE-AC04-94AL85000 with Sandia Corporation, the U.S. Government retains certain
+# rights in this software.
+
+"""Deletes HDF5 arrays from the data store once no model refers to them.
+
+Models refer to arrays by id, in their `artifact:*` fields, and each array is
+recorded by a CouchDB document of type "hdf5".  Arrays that were copied from
+another array, and still share its data, refer to it in their `links` field.
+Rather than counting the references to every array in the store whenever
+something is deleted, the :class:`ArrayCollector` scans the store once, then
+follows the CouchDB `_changes` feed to find the arrays that have lost a
+reference since its last run.  Only those candidates are checked, and the ones
+that turn out to be orphaned are deleted in batches.
+"""
+
+from __future__ import absolute_import
+
+import multiprocessing.pool
+import os
+import slycat.web.server.hdf5
+import threading
+import time
+
+class ArrayCollector(object):
+  """Incremental mark-and-sweep garbage collector for HDF5 arrays.
+
+  The first call to :meth:`collect` scans the `slycat/hdf5-file-counts` view
+  to record the arrays referenced by each model, and to find arrays that are
+  already orphaned.  Subsequent calls read the changes made since the previous
+  call, and only check arrays that were referenced by a model that has been
+  deleted or has dropped the artifact.  Orphaned arrays are processed
+  `batch_size` at a time: their files are deleted using at most `threads`
+  concurrent threads, then their documents are deleted with a single bulk
+  request.
+  """
+  def __init__(self, batch_size=500, threads=4):
+    self.batch_size = batch_size
+    self.threads = threads
+    self.last_seq = None
+    self.runs = 0
+    self.arrays = 0
+    self.bytes = 0
+    self.last_run = None
+    self._lock = threading.Lock()
+    self._references = {}
+    self._candidates = set()
+
+  def _scan(self, database):
+    """Record every model's array references, and mark orphaned arrays as candidates."""
+    # Record the sequence number first, so changes made during the scan are replayed by the next update.
+    self.last_seq = database.info()["update_seq"]
+    self._references = {}
+    for row in database.view("slycat/hdf5-file-counts", reduce=False):
+      if row.value:
+        self._references.setdefault(row.id, set()).add(row.key)
+    self._candidates = set([row.key for row in database.view("slycat/hdf5-file-counts", group=True) if row.value == 0])
+    return "scan"
+
+  def _update(self, database):
+    """Mark the arrays that have lost a reference since the last run as candidates."""
+    while True:
+      changes = database.changes(since=self.last_seq, include_docs=True, limit=self.batch_size)
+      for change in changes["results"]:
+        references = self._references.pop(change["id"], set())
+        current = set() if change.get("deleted", False) else _references(change.get("doc", {}))
+        if current:
+          self._references[change["id"]] = current
+        self._candidates.update(references - current)
+      self.last_seq = changes["last_seq"]
+      if len(changes["results"]) < self.batch_size:
+        return "update"
+
+  @staticmethod
+  def _delete_file(array):
+    """Delete an array from the data store, returning the number of bytes reclaimed."""
+    array_path = slycat.web.server.hdf5.path(array)
+    size = os.path.getsize(array_path) if os.path.exists(array_path) else 0
+    slycat.web.server.hdf5.delete(array)
+    return size
+
+  def collect(self, database):
+    """Delete orphaned arrays, returning a dict describing the run.
+
+    Parameters
+    ----------
+    database: :class:`slycat.web.server.database.couchdb.Database`
+    """
+    with self._lock:
+      start = time.time()
+      mode = self._scan(database) if self.last_seq is None else self._update(database)
+      checked = 0
+      arrays = 0
+      reclaimed = 0
+
+      pool = multiprocessing.pool.ThreadPool(self.threads)
+      try:
+        while self._candidates:
+          batch = sorted(self._candidates)[:self.batch_size]
+          checked += len(batch)
+          orphans = [row.key for row in database.view("slycat/hdf5-file-counts", group=True, keys=batch) if row.value == 0]
+          if orphans:
+            revisions = [row for row in database.view("_all_docs", keys=orphans) if row.value is not None and not row.value.get("deleted", False)]
+            reclaimed += sum(pool.map(self._delete_file, orphans))
+            database.update([{"_id": row.id, "_rev": row.value["rev"], "_deleted": True} for row in revisions])
+            arrays += len(orphans)
+          self._candidates.difference_update(batch)
+          # Deleting a copied array may orphan the arrays it shared data with.
+          for array in orphans:
+            self._candidates.update(self._references.pop(array, set()))
+      finally:
+        pool.close()
+        pool.join()
+
+      self.runs += 1
+      self.arrays += arrays
+      self.bytes += reclaimed
+      self.last_run = {"mode": mode, "checked": checked, "arrays": arrays, "bytes": reclaimed, "duration": time.time() - start}
+      return dict(self.last_run)
+
+  def reset(self):
+    """Forget everything, so the next run starts with a full scan."""
+    with self._lock:
+      self.last_seq = None
+      self._references = {}
+      self._candidates = set()
+
+  def statistics(self):
+    """Return a dict containing the total arrays and bytes reclaimed, and a description of the most recent run."""
+    return {"runs": self.runs, "arrays": self.arrays, "bytes": self.bytes, "models": len(self._references), "candidates": len(self._candidates), "last-run": self.last_run}
+
+def _references(document):
+  """Return the arrays referred to by a document: a model's artifacts, or the arrays that a copied array shares data with."""
+  if document.get("type", None) == "model":
+    references = set([document.get("artifact:%s" % name, None) for name, type in document.get("artifact-types", {}).items() if type == "hdf5"])
+    references.discard(None)
+    return references
+  if document.get("type", None) == "hdf5":
+    return set(document.get("links", []))
+  return set()
+
+collector = ArrayCollector()
@@ -11,7 +11,13 @@ database stores links to HDF5 files stored on disk.
 from __future__ import absolute_import
 
 import cherrypy
+import collections
+import contextlib
+import copy
 import couchdb.client
+import couchdb.http
+import couchdb.util
+import socket
 import threading
 import time
 import uuid
@@ -27,20 +33,39 @@ class Database:
   def changes(self, *arguments, **keywords):
     return self._database.changes(*arguments, **keywords)
 
-  def delete(self, *arguments, **keywords):
-    return self._database.delete(*arguments, **keywords)
+  def delete(self, document, *arguments, **keywords):
+    cache.invalidate(document["_id"])
+    return self._database.delete(document, *arguments, **keywords)
 
   def get_attachment(self, *arguments, **keywords):
     return self._database.get_attachment(*arguments, **keywords)
 
-  def put_attachment(self, *arguments, **keywords):
-    return self._database.put_attachment(*arguments, **keywords)
+  def info(self, *arguments, **keywords):
+    return self._database.info(*arguments, **keywords)
 
-  def save(self, *arguments, **keywords):
+  def put_attachment(self, document, *arguments, **keywords):
     try:
-      return self._database.save(*arguments, **keywords)
+      return self._database.put_attachment(document, *arguments, **keywords)
+    finally:
+      cache.invalidate(document["_id"])
+
+  def save(self, document, *arguments, **keywords):
+    try:
+      return self._database.save(document, *arguments, **keywords)
     except couchdb.http.ServerError as e:
       raise cherrypy.HTTPError("%s %s" % (e.message[0], e.message[1][1]))
+    finally:
+      if "_id" in document:
+        cache.invalidate(document["_id"])
+
+  def update(self, documents, *arguments, **keywords):
+    """Save or delete several documents with one _bulk_docs request."""
+    try:
+      return self._database.update(documents, *arguments, **keywords)
+    finally:
+      for document in documents:
+        if "_id" in document:
+          cache.invalidate(document["_id"])
 
   def view(self, *arguments, **keywords):
     return self._database.view(*arguments, **keywords)
@@ -51,8 +76,9 @@ class Database:
       yield document
 
   def get(self, type, id):
+    """Return a document of the given type, using the :class:`DocumentCache` if possible."""
     try:
-      document = self[id]
+      document = cache.get(id, self.__getitem__)
     except couchdb.client.http.ResourceNotFound:
       raise cherrypy.HTTPError(404)
     if document["type"] != type:
@@ -64,13 +90,315 @@ class Database:
     self.put_attachment(document, content, filename=fid, content_type=content_type)
     return fid
 
+class DocumentCache(object):
+  """Short-lived, in-process cache of CouchDB documents.
+
+  Nearly every request looks up a project and model before doing any real
+  work, so documents returned by :meth:`Database.get` are cached by id along
+  with their revision.  Entries expire after `ttl` seconds, and are discarded
+  as soon as the CouchDB _changes feed reports a new revision, or when this
+  process saves or deletes the document.  Documents are only cached while the
+  feed is being followed (see :func:`start_cache_worker`), and callers always
+  receive a deep copy, so they're free to modify it.
+  """
+  def __init__(self, ttl=5.0, capacity=1024):
+    self.ttl = ttl
+    self.capacity = capacity
+    self.hits = 0
+    self.misses = 0
+    self.invalidations = 0
+    self.last_seq = None
+    self._following = False
+    self._generation = 0
+    self._lock = threading.Lock()
+    self._entries = collections.OrderedDict()
+
+  def get(self, id, load):
+    """Return a copy of a document, calling `load(id)` to retrieve it on a cache miss."""
+    with self._lock:
+      entry = self._entries.get(id, None)
+      if entry is not None and entry[2] > time.time():
+        self._entries[id] = self._entries.pop(id) # Mark the entry as most-recently used.
+        self.hits += 1
+        return copy.deepcopy(entry[1])
+      self.misses += 1
+      generation = self._generation
+
+    document = load(id)
+
+    with self._lock:
+      # Don't cache the document if anything was invalidated while we were loading it, since we can't know whether it was stale.
+      if self._following and self.ttl > 0 and generation == self._generation:
+        self._entries.pop(id, None)
+        self._entries[id] = (document.get("_rev", None), copy.deepcopy(document), time.time() + self.ttl)
+        while len(self._entries) > self.capacity:
+          self._entries.popitem(last=False)
+    return document
+
+  def invalidate(self, id, rev=None):
+    """Discard a cached document, unless it's already at the given revision."""
+    with self._lock:
+      self._generation += 1
+      entry = self._entries.get(id, None)
+      if entry is not None and (rev is None or entry[0] != rev):
+        del self._entries[id]
+        self.invalidations += 1
+
+  def clear(self):
+    """Discard every cached document."""
+    with self._lock:
+      self._generation += 1
+      self._entries.clear()
+
+  def follow(self, database):
+    """Keep the cache up-to-date using the _changes feed from a :class:`couchdb.client.Database`.
+
+    Returns only if the feed ends, and clears the cache when it does, since
+    changes may be missed until the feed is followed again.
+    """
+    if self.last_seq is None:
+      self.last_seq = database.info()["update_seq"]
+    self.clear()
+    self._following = True
+    try:
+      for change in database.changes(feed="continuous", since=self.last_seq, heartbeat=30000):
+        if "last_seq" in change:
+          self.last_seq = change["last_seq"]
+        else:
+          self.invalidate(change["id"], None if change.get("deleted", False) else change["changes"][-1]["rev"])
+          self.last_seq = change["seq"]
+    finally:
+      self._following = False
+      self.clear()
+
+  def __len__(self):
+    with self._lock:
+      return len(self._entries)
+
+  def statistics(self):
+    """Return a dict containing cache hit, miss, and invalidation counts."""
+    with self._lock:
+      return {"size": len(self._entries), "capacity": self.capacity, "ttl": self.ttl, "following": self._following, "hits": self.hits, "misses": self.misses, "invalidations": self.invalidations}
+
+cache = DocumentCache()
+
+def cache_worker():
+  while True:
+    try:
+      cache.follow(_client())
+    except Exception as e:
+      cherrypy.log.error("Document cache thread waiting for couchdb.")
+      time.sleep(2)
+cache_worker.thread = threading.Thread(name="couchdb-cache", target=cache_worker)
+cache_worker.thread.daemon = True
+
+def start_cache_worker():
+  """Start following the CouchDB _changes feed, so the :class:`DocumentCache` can be used."""
+  cache_worker.thread.start()
+
+class ConnectionPool(couchdb.http.ConnectionPool):
+  """Process-wide pool of keep-alive HTTP connections to CouchDB.
+
+  Every thread in the server shares one :class:`couchdb.http.Session`, so
+  requests reuse idle connections instead of connecting to CouchDB each time.
+  At most `size` requests are in flight at once, and callers wait up to
+  `timeout` seconds for a turn before failing with 503.  Connections that have
+  been idle for longer than `max_idle` seconds may have been dropped by
+  CouchDB, so they're closed instead of being reused, and every idle
+  connection is closed when a request fails with a socket error.
+  """
+  def __init__(self, size=32, timeout=30.0, max_idle=60.0):
+    couchdb.http.ConnectionPool.__init__(self, timeout=None)
+    self.size = size
+    self.timeout = timeout
+    self.max_idle = max_idle
+    self.requests = 0
+    self.waits = 0
+    self.wait_time = 0.0
+    self.max_wait_time = 0.0
+    self.connects = 0
+    self.reuses = 0
+    self.expirations = 0
+    self.failures = 0
+    self.healthy = True
+    self._active = 0
+    self._idle = {}
+    self._condition = threading.Condition(threading.Lock())
+    self._local = threading.local()
+
+  @contextlib.contextmanager
+  def reserve(self):
+    """Return a context manager that waits for a turn to make a request."""
+    if getattr(self._local, "reserved", False): # Redirects issue nested requests.
+      yield
+      return
+
+    with self._condition:
+      self.requests += 1
+      if self._active >= self.size:
+        self.waits += 1
+        start = time.time()
+        while self._active >= self.size:
+          remaining = start + self.timeout - time.time()
+          if remaining <= 0:
+            raise cherrypy.HTTPError("503 Timed-out waiting for a couchdb connection.")
+          self._condition.wait(remaining)
+        wait_time = time.time() - start
+        self.wait_time += wait_time
+        self.max_wait_time = max(self.max_wait_time, wait_time)
+      self._active += 1
+
+    self._local.reserved = True
+    try:
+      yield
+      self.healthy = True
+    except socket.error as e:
+      with self._condition:
+        self.failures += 1
+        self.healthy = False
+      self.clear()
+      raise
+    finally:
+      self._local.reserved = False
+      with self._condition:
+        self._active -= 1
+        self._condition.notify()
+
+  def get(self, url):
+    scheme, host = couchdb.util.urlsplit(url, "http", False)[:2]
+    expired = []
+    conn = None
+    with self._condition:
+      idle = self._idle.setdefault((scheme, host), [])
+      while idle and conn is None:
+        candidate, released = idle.pop()
+        if time.time() - released > self.max_idle:
+          expired.append(candidate)
+          self.expirations += 1
+        else:
+          conn = candidate
+          self.reuses += 1
+      if conn is None:
+        self.connects += 1
+    for candidate in expired:
+      candidate.close()
+    if conn is None:
+      conn = couchdb.http.ConnectionPool.get(self, url)
+    return conn
+
+  def release(self, url, conn):
+    scheme, host = couchdb.util.urlsplit(url, "http", False)[:2]
+    with self._condition:
+      idle = self._idle.setdefault((scheme, host), [])
+      if len(idle) < self.size:
+        idle.append((conn, time.time()))
+        return
+    conn.close()
+
+  def clear(self):
+    """Close every idle connection."""
+    with self._condition:
+      idle, self._idle = self._idle, {}
+    for connections in idle.values():
+      for conn, released in connections:
+        conn.close()
+
+  def __del__(self):
+    self.clear()
+
+  def statistics(self):
+    """Return a dict containing request, wait, and connection counts."""
+    with self._condition:
+      return {
+        "size": self.size,
+        "active": self._active,
+        "idle": sum(len(connections) for connections in self._idle.values()),
+        "healthy": self.healthy,
+        "requests": self.requests,
+        "waits": self.waits,
+        "wait-time": self.wait_time,
+        "max-wait-time": self.max_wait_time,
+        "connects": self.connects,
+        "reuses": self.reuses,
+        "expirations": self.expirations,
+        "failures": self.failures,
+        }
+
+class Session(couchdb.http.Session):
+  """:class:`couchdb.http.Session` that makes its requests using a :class:`ConnectionPool`."""
+  def __init__(self, connection_pool):
+    couchdb.http.Session.__init__(self)
+    self.connection_pool = connection_pool
+
+  def request(self, *arguments, **keywords):
+    with self.connection_pool.reserve():
+      return couchdb.http.Session.request(self, *arguments, **keywords)
+
+pool = ConnectionPool()
+
+def _client():
+  """Return the shared :class:`couchdb.client.Database`, creating it on first use."""
+  with _client.lock:
+    if _client.database is None:
+      server = couchdb.client.Server(url=cherrypy.tree.apps[""].config["slycat"]["couchdb-host"], session=Session(pool))
+      _client.database = server[cherrypy.tree.apps[""].config["slycat"]["couchdb-database"]]
+    return _client.database
+_client.lock = threading.Lock()
+_client.database = None
+
+def check():
+  """Check that CouchDB is reachable using the shared connection pool.
+
+  Returns
+  -------
+  healthy : boolean
+  """
+  try:
+    _client().info()
+  except Exception as e:
+    cherrypy.log.error("CouchDB health check failed: %s" % e)
+  return pool.healthy
+
+def log_status():
+  """Check CouchDB, then log the health of the connection pool and its statistics, and those of the document cache."""
+  healthy = check()
+  pool_statistics = pool.statistics()
+  cache_statistics = cache.statistics()
+  cherrypy.log.error("CouchDB %s: %s/%s connections active, %s idle, %s requests, %s waits (%.3f seconds max), %s failures; document cache %s hits, %s misses, %s invalidations." % (
+    "healthy" if healthy else "unhealthy",
+    pool_statistics["active"],
+    pool_statistics["size"],
+    pool_statistics["idle"],
+    pool_statistics["requests"],
+    pool_statistics["waits"],
+    pool_statistics["max-wait-time"],
+    pool_statistics["failures"],
+    cache_statistics["hits"],
+    cache_statistics["misses"],
+    cache_statistics["invalidations"],
+    ))
+  return {"healthy": healthy, "pool": pool_statistics, "cache": cache_statistics}
+
+def status_worker():
+  while True:
+    time.sleep(status_worker.interval)
+    log_status()
+status_worker.interval = 300.0
+status_worker.thread = threading.Thread(name="couchdb-status", target=status_worker)
+status_worker.thread.daemon = True
+
+def start_status_worker():
+  """Start logging the status of the connection pool and document cache every `status_worker.interval` seconds."""
+  status_worker.thread.start()
+
 def connect():
   """Connect to a CouchDB database.
 
+  Every caller shares the same underlying client and :class:`ConnectionPool`,
+  so this is cheap enough to call on every request.
+
   Returns
   -------
   database : :class:`slycat.web.server.database.couchdb.Database`
   """
-  server = couchdb.client.Server(url=cherrypy.tree.apps[""].config["slycat"]["couchdb-host"])
-  database = Database(server[cherrypy.tree.apps[""].config["slycat"]["couchdb-database"]])
-  return database
+  return Database(_client())
@@ -14,8 +14,14 @@ import pwd
 import re
 import sys
 
+import slycat.hdf5
+import slycat.web.server
+import slycat.web.server.cleanup
+import slycat.web.server.database.couchdb
+import slycat.web.server.hdf5
 import slycat.web.server.handlers
 import slycat.web.server.plugin
+import slycat.web.server.scheduler
 
 class DropPrivilegesRotatingFileHandler(logging.handlers.RotatingFileHandler):
   """Custom logfile handler that ensures newly-created logfiles have a specific user and group."""
@@ -118,6 +124,7 @@ def start(root_path, config_file):
   dispatcher.connect("get-global-resource", "/resources/global/{resource:.*}", slycat.web.server.handlers.get_global_resource, conditions={"method" : ["GET"]})
   dispatcher.connect("get-home", "/", slycat.web.server.handlers.get_home, conditions={"method" : ["GET"]})
   dispatcher.connect("get-model-array-attribute-chunk", "/models/:mid/arraysets/:aid/arrays/:array/attributes/:attribute/chunk", slycat.web.server.handlers.get_model_array_attribute_chunk, conditions={"method" : ["GET"]})
+  dispatcher.connect("get-model-array-lod", "/models/:mid/arraysets/:aid/arrays/:array/lod", slycat.web.server.handlers.get_model_array_lod, conditions={"method" : ["GET"]})
   dispatcher.connect("get-model-arrayset-data", "/models/:mid/arraysets/:aid/data", slycat.web.server.handlers.get_model_arrayset_data, conditions={"method" : ["GET"]})
   dispatcher.connect("get-model-arrayset-metadata", "/models/:mid/arraysets/:name/metadata", slycat.web.server.handlers.get_model_arrayset_metadata, conditions={"method" : ["GET"]})
   dispatcher.connect("get-model-command", "/models/:mid/commands/:command", slycat.web.server.handlers.get_model_command, conditions={"method" : ["GET"]})
@@ -251,7 +258,43 @@ def start(root_path, config_file):
   # Expand remote host aliases.
   configuration["slycat-web-server"]["remote-hosts"] = {hostname: remote for remote in configuration["slycat-web-server"]["remote-hosts"] for hostname in remote.get("hostnames", [])}
 
+  # Size the cache of open HDF5 file handles, and the chunk cache used by each.
+  slycat.web.server.hdf5.files.capacity = configuration["slycat-web-server"]["hdf5-file-cache-size"]
+  slycat.web.server.hdf5.open_file.chunk_cache_size = configuration["slycat-web-server"]["hdf5-chunk-cache-size"]
+
+  # Choose how new arraysets are laid out on disk.
+  slycat.web.server.put_model_arrayset.storage_policy = slycat.hdf5.storage_policy(configuration["slycat-web-server"]["hdf5-storage-policy"])
+
+  # Size the cache of computed histograms.
+  slycat.web.server.histogram_cache.capacity = configuration["slycat-web-server"]["histogram-cache-size"]
+
+  # Size the cache of finished arrayset versions.
+  slycat.web.server.arrayset_versions.capacity = configuration["slycat-web-server"]["arrayset-version-cache-size"]
+
+  # Choose the largest number of scatterplot points returned without binning.
+  slycat.web.server.get_model_array_lod.limit = configuration["slycat-web-server"]["lod-point-limit"]
+
+  # Size the pool of couchdb connections shared by every thread.
+  slycat.web.server.database.couchdb.pool.size = configuration["slycat-web-server"]["couchdb-pool-size"]
+
+  # Cache project and model documents, following the couchdb changes feed to keep them current.
+  slycat.web.server.database.couchdb.cache.ttl = configuration["slycat-web-server"]["couchdb-cache-ttl"]
+  slycat.web.server.database.couchdb.cache.capacity = configuration["slycat-web-server"]["couchdb-cache-size"]
+  cherrypy.engine.subscribe("start", slycat.web.server.database.couchdb.start_cache_worker, priority=80)
+
+  # Periodically log couchdb health, along with connection pool and document cache statistics.
+  slycat.web.server.database.couchdb.status_worker.interval = configuration["slycat-web-server"]["couchdb-status-interval"]
+  cherrypy.engine.subscribe("start", slycat.web.server.database.couchdb.start_status_worker, priority=80)
+
+  # Limit the rate at which model progress updates are saved.
+  slycat.web.server.model_updates.interval = configuration["slycat-web-server"]["model-update-interval"]
+
+  # Limit the resources used to compute models.
+  slycat.web.server.scheduler.scheduler.threads = configuration["slycat-web-server"]["job-threads"]
+  slycat.web.server.scheduler.scheduler.processes = configuration["slycat-web-server"]["job-processes"]
+
   # Wait for requests to cleanup deleted arrays.
+  slycat.web.server.cleanup.collector.threads = configuration["slycat-web-server"]["array-cleanup-threads"]
   cherrypy.engine.subscribe("start", slycat.web.server.handlers.start_array_cleanup_worker, priority=80)
 
   # Cleanup expired sessions.
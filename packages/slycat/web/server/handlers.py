@@ -10,7 +10,6 @@ import hashlib
 import itertools
 import json
 import logging.handlers
-import numbers
 import numpy
 import os
 import Queue
@@ -20,11 +19,13 @@ import slycat.hyperchunks
 import slycat.table
 import slycat.web.server
 import slycat.web.server.authentication
+import slycat.web.server.cleanup
 import slycat.web.server.database.couchdb
 import slycat.web.server.hdf5
 import slycat.web.server.plugin
 import slycat.web.server.remote
 import slycat.web.server.resource
+import slycat.web.server.scheduler
 import slycat.web.server.streaming
 import slycat.web.server.template
 import stat
@@ -32,6 +33,7 @@ import subprocess
 import sys
 import threading
 import time
+import traceback
 import uuid
 
 def css_bundle():
@@ -103,6 +105,17 @@ def require_boolean_parameter(name):
     raise cherrypy.HTTPError("400 Parameter %s must be true or false." % name)
   return value
 
+def require_storage_policy_parameter(per_attribute=False):
+  """Return the optional storage-policy parameter, which names one of :data:`slycat.hdf5.storage_policies`, or maps attribute names to them."""
+  value = cherrypy.request.json.get("storage-policy", None)
+  if value is None:
+    return None
+  policies = value.values() if per_attribute and isinstance(value, dict) else [value]
+  for policy in policies:
+    if not isinstance(policy, basestring) or policy not in slycat.hdf5.storage_policies:
+      raise cherrypy.HTTPError("400 storage-policy must be one of %s." % ", ".join(sorted(slycat.hdf5.storage_policies.keys())))
+  return value
+
 def get_home():
   raise cherrypy.HTTPRedirect(cherrypy.request.app.config["slycat-web-server"]["server-root"] + "projects")
 
@@ -206,18 +219,18 @@ def put_project(pid):
 def array_cleanup_worker():
   while True:
     cleanup_arrays.queue.get()
+    # Requests that arrived while we were waiting are handled by a single run.
+    while not cleanup_arrays.queue.empty():
+      cleanup_arrays.queue.get_nowait()
     while True:
       try:
         database = slycat.web.server.database.couchdb.connect()
         cherrypy.log.error("Array cleanup started.")
-        for file in database.view("slycat/hdf5-file-counts", group=True):
-          if file.value == 0:
-            slycat.web.server.hdf5.delete(file.key)
-            database.delete(database[file.key])
-        cherrypy.log.error("Array cleanup finished.")
+        run = slycat.web.server.cleanup.collector.collect(database)
+        cherrypy.log.error("Array cleanup finished: %s checked, %s arrays deleted, %s bytes reclaimed in %.3f seconds." % (run["checked"], run["arrays"], run["bytes"], run["duration"]))
         break
       except Exception as e:
-        cherrypy.log.error("Array cleanup thread aiting for couchdb.")
+        cherrypy.log.error("Array cleanup thread waiting for couchdb: %s" % e)
         time.sleep(2)
 
 def cleanup_arrays():
@@ -470,17 +483,17 @@ def put_model(mid):
   project = database.get("project", model["project"])
   slycat.web.server.authentication.require_project_writer(project)
 
-  save_model = False
+  changed = []
   for key, value in cherrypy.request.json.items():
     if key in ["name", "description", "state", "result", "progress", "message", "started", "finished", "marking"]:
       if value != model.get(key):
         model[key] = value
-        save_model = True
+        changed.append(key)
     else:
       raise cherrypy.HTTPError("400 Unknown model parameter: %s" % key)
 
-  if save_model:
-    database.save(model)
+  if changed:
+    slycat.web.server.model_updates.save(database, model, changed)
 
 def post_model_finish(mid):
   database = slycat.web.server.database.couchdb.connect()
@@ -542,36 +555,40 @@ def put_model_table(mid, name, input=None, file=None, sid=None, path=None):
     raise cherrypy.HTTPError("400 Required input parameter is missing.")
   input = True if input == "true" else False
 
+  def store_table(data, filename):
+    slycat.web.server.update_model(database, model, message="Loading table %s from %s." % (name, filename))
+    storage = uuid.uuid4().hex
+    try:
+      with slycat.web.server.hdf5.create(storage) as file:
+        slycat.table.store(data, slycat.hdf5.ArraySet(file), 0)
+    except:
+      cherrypy.log.error(traceback.format_exc())
+      slycat.web.server.hdf5.delete(storage)
+      raise cherrypy.HTTPError("400 Could not parse file %s" % filename)
+
+    database.save({"_id" : storage, "type" : "hdf5"})
+    model["artifact:%s" % name] = storage
+    model["artifact-types"][name] = "hdf5"
+    if input:
+      model["input-artifacts"] = list(set(model["input-artifacts"] + [name]))
+    slycat.web.server.model_updates.save(database, model, ["artifact:%s" % name, ("artifact-types", name)] + (["input-artifacts"] if input else []))
+
   if file is not None and sid is None and path is None:
-    data = file.file.read()
-    filename = file.filename
+    store_table(file.file, file.filename)
   elif file is None and sid is not None and path is not None:
     with slycat.web.server.remote.get_session(sid) as session:
       filename = "%s@%s:%s" % (session.username, session.hostname, path)
       if stat.S_ISDIR(session.sftp.stat(path).st_mode):
         raise cherrypy.HTTPError("400 Cannot load directory %s." % filename)
-      data = session.sftp.file(path).read()
+
+    # Stream the file without holding the session lock, so the session remains usable while the table loads.
+    def progress(count, size):
+      slycat.web.server.update_model(database, model, message="Loading table %s from %s: %s of %s bytes." % (name, filename, count, size))
+    with slycat.web.server.remote.RemoteFile(session, path, progress=progress) as data:
+      store_table(data, filename)
   else:
     raise cherrypy.HTTPError("400 Must supply a file parameter, or sid and path parameters.")
 
-  slycat.web.server.update_model(database, model, message="Loading table %s from %s." % (name, filename))
-  try:
-    array = slycat.table.parse(data)
-  except:
-    raise cherrypy.HTTPError("400 Could not parse file %s" % filename)
-
-  storage = uuid.uuid4().hex
-  with slycat.web.server.hdf5.lock:
-    with slycat.web.server.hdf5.create(storage) as file:
-      database.save({"_id" : storage, "type" : "hdf5"})
-      model["artifact:%s" % name] = storage
-      model["artifact-types"][name] = "hdf5"
-      if input:
-        model["input-artifacts"] = list(set(model["input-artifacts"] + [name]))
-      database.save(model)
-      arrayset = slycat.hdf5.ArraySet(file)
-      arrayset.store_array(0, array)
-
 @cherrypy.tools.json_in(on = True)
 def put_model_parameter(mid, name):
   database = slycat.web.server.database.couchdb.connect()
@@ -592,8 +609,9 @@ def put_model_arrayset(mid, name):
   slycat.web.server.authentication.require_project_writer(project)
 
   input = require_boolean_parameter("input")
+  storage_policy = require_storage_policy_parameter()
 
-  slycat.web.server.put_model_arrayset(database, model, name, input)
+  slycat.web.server.put_model_arrayset(database, model, name, input, storage_policy)
 
 @cherrypy.tools.json_in(on = True)
 def put_model_arrayset_array(mid, name, array):
@@ -606,7 +624,11 @@ def put_model_arrayset_array(mid, name, array):
   array_index = int(array)
   attributes = cherrypy.request.json["attributes"]
   dimensions = cherrypy.request.json["dimensions"]
-  slycat.web.server.put_model_array(database, model, name, array_index, attributes, dimensions)
+  storage_policy = require_storage_policy_parameter(per_attribute=True)
+  try:
+    slycat.web.server.put_model_array(database, model, name, array_index, attributes, dimensions, storage_policy)
+  except ValueError as e:
+    raise cherrypy.HTTPError("400 %s" % e)
 
 def put_model_arrayset_data(mid, name, hyperchunks, data, byteorder=None):
   # Validate inputs.
@@ -626,53 +648,41 @@ def put_model_arrayset_data(mid, name, hyperchunks, data, byteorder=None):
   slycat.web.server.authentication.require_project_writer(project)
 
   slycat.web.server.update_model(database, model, message="Storing data to array set %s." % (name))
+  slycat.web.server.arrayset_versions.discard(model["artifact:%s" % name])
 
   if byteorder is None:
     data = json.load(data.file)
     data_iterator = iter(data)
-
-  with slycat.web.server.hdf5.lock:
-    with slycat.web.server.hdf5.open(model["artifact:%s" % name], "r+") as file:
-      hdf5_arrayset = slycat.hdf5.ArraySet(file)
-      for array in slycat.hyperchunks.arrays(hyperchunks, hdf5_arrayset.array_count()):
-        hdf5_array = hdf5_arrayset[array.index]
-        for attribute in array.attributes(len(hdf5_array.attributes)):
-          if not isinstance(attribute.expression, slycat.hyperchunks.grammar.AttributeIndex):
-            raise cherrypy.HTTPError("400 Cannot assign data to computed attributes.")
-          for hyperslice in attribute.hyperslices():
-            cherrypy.log.error("Writing %s/%s/%s/%s" % (name, array.index, attribute.expression.index, hyperslice))
-
-            # We have to convert our hyperslice into a shape with explicit extents so we can compute
-            # how many bytes to extract from the input data.
-            if hyperslice == (Ellipsis,):
-              data_shape = [dimension["end"] - dimension["begin"] for dimension in hdf5_array.dimensions]
-            else:
-              data_shape = []
-              for hyperslice_dimension, array_dimension in zip(hyperslice, hdf5_array.dimensions):
-                if isinstance(hyperslice_dimension, numbers.Integral):
-                  data_shape.append(1)
-                elif isinstance(hyperslice_dimension, type(Ellipsis)):
-                  data_shape.append(array_dimension["end"] - array_dimension["begin"])
-                elif isinstance(hyperslice_dimension, slice):
-                  # TODO: Handle step
-                  start, stop, step = hyperslice_dimension.indices(array_dimension["end"] - array_dimension["begin"])
-                  data_shape.append(stop - start)
-                else:
-                  raise ValueError("Unexpected hyperslice: %s" % hyperslice_dimension)
-
-            # Convert data to an array ...
-            data_type = slycat.hdf5.dtype(hdf5_array.attributes[attribute.expression.index]["type"])
-            data_size = numpy.prod(data_shape)
-
-            if byteorder is None:
-              hyperslice_data = numpy.array(data_iterator.next(), dtype=data_type).reshape(data_shape)
-            elif byteorder == sys.byteorder:
-              hyperslice_data = numpy.fromfile(data.file, dtype=data_type, count=data_size).reshape(data_shape)
-            else:
-              raise NotImplementedError()
-
-            hdf5_array.set_data(attribute.expression.index, hyperslice, hyperslice_data)
-
+  else:
+    reader = slycat.web.server.BinaryHypersliceReader(data.file, byteorder)
+
+  with slycat.web.server.hdf5.open(model["artifact:%s" % name], "r+") as file:
+    hdf5_arrayset = slycat.hdf5.ArraySet(file)
+    for array in slycat.hyperchunks.arrays(hyperchunks, hdf5_arrayset.array_count()):
+      hdf5_array = hdf5_arrayset[array.index]
+      for attribute in array.attributes(len(hdf5_array.attributes)):
+        if not isinstance(attribute.expression, slycat.hyperchunks.grammar.AttributeIndex):
+          raise cherrypy.HTTPError("400 Cannot assign data to computed attributes.")
+        for hyperslice in attribute.hyperslices():
+          cherrypy.log.error("Writing %s/%s/%s/%s" % (name, array.index, attribute.expression.index, hyperslice))
+
+          # Binary data is read and written in bounded blocks, straight from the request body.
+          if byteorder is not None:
+            try:
+              reader.store(hdf5_array, attribute.expression.index, hyperslice)
+            except (IndexError, ValueError) as e:
+              raise cherrypy.HTTPError("400 %s" % e)
+            continue
+
+          # We have to convert our hyperslice into a shape with explicit extents so we can reshape the input data.
+          try:
+            data_shape = [len(xrange(extent.start, extent.stop, extent.step)) for extent in slycat.web.server.expand_hyperslice(hdf5_array.shape, hyperslice)]
+          except IndexError as e:
+            raise cherrypy.HTTPError("400 %s" % e)
+          data_type = slycat.hdf5.dtype(hdf5_array.attributes[attribute.expression.index]["type"])
+          hyperslice_data = numpy.array(data_iterator.next(), dtype=data_type).reshape(data_shape)
+          hdf5_array.set_data(attribute.expression.index, hyperslice, hyperslice_data)
+      hdf5_array.update_cache()
 
 def delete_model(mid):
   couchdb = slycat.web.server.database.couchdb.connect()
@@ -680,6 +690,7 @@ def delete_model(mid):
   project = couchdb.get("project", model["project"])
   slycat.web.server.authentication.require_project_writer(project)
 
+  slycat.web.server.scheduler.cancel(mid)
   couchdb.delete(model)
   cleanup_arrays()
 
@@ -720,6 +731,23 @@ def delete_project_cache_object(pid, key):
 
   raise cherrypy.HTTPError(404)
 
+def check_artifact_etag(database, model, aid):
+  """Answer a conditional request for data read from an arrayset artifact.
+
+  Sets a strong ETag derived from the artifact version, the request URL, and
+  the response content type, so it changes whenever the artifact is modified.
+  Browsers must revalidate every response, since the artifacts of finished
+  models can still be written.  Raises a 304 response if the client's copy
+  is current.  Artifacts that don't record a version are never cached.
+  """
+  version = slycat.web.server.arrayset_versions.get(database, model, aid)
+  if version is None:
+    return
+  etag = hashlib.sha1("\n".join([version, cherrypy.request.path_info, cherrypy.request.query_string, cherrypy.response.headers.get("content-type", "")])).hexdigest()
+  cherrypy.response.headers["etag"] = '"%s"' % etag
+  cherrypy.response.headers["cache-control"] = "private, no-cache"
+  cherrypy.lib.cptools.validate_etags()
+
 def get_model_array_attribute_chunk(mid, aid, array, attribute, **arguments):
   try:
     attribute = int(attribute)
@@ -753,30 +781,84 @@ def get_model_array_attribute_chunk(mid, aid, array, attribute, **arguments):
   artifact_type = model["artifact-types"][aid]
   if artifact_type not in ["hdf5"]:
     raise cherrypy.HTTPError("400 %s is not an array artifact." % aid)
+  check_artifact_etag(database, model, aid)
 
-  with slycat.web.server.hdf5.lock:
-    with slycat.web.server.hdf5.open(artifact) as file:
-      hdf5_arrayset = slycat.hdf5.ArraySet(file)
-      hdf5_array = hdf5_arrayset[array]
+  with slycat.web.server.hdf5.open(artifact) as file:
+    hdf5_arrayset = slycat.hdf5.ArraySet(file)
+    hdf5_array = hdf5_arrayset[array]
 
-      if not(0 <= attribute and attribute < len(hdf5_array.attributes)):
-        raise cherrypy.HTTPError("400 Attribute argument out-of-range.")
-      if len(ranges) != hdf5_array.ndim:
-        raise cherrypy.HTTPError("400 Ranges argument doesn't contain the correct number of dimensions.")
+    if not(0 <= attribute and attribute < len(hdf5_array.attributes)):
+      raise cherrypy.HTTPError("400 Attribute argument out-of-range.")
+    if len(ranges) != hdf5_array.ndim:
+      raise cherrypy.HTTPError("400 Ranges argument doesn't contain the correct number of dimensions.")
 
-      ranges = [(max(dimension["begin"], range[0]), min(dimension["end"], range[1])) for dimension, range in zip(hdf5_array.dimensions, ranges)]
-      index = tuple([slice(begin, end) for begin, end in ranges])
+    ranges = [(max(dimension["begin"], range[0]), min(dimension["end"], range[1])) for dimension, range in zip(hdf5_array.dimensions, ranges)]
+    index = tuple([slice(begin, end) for begin, end in ranges])
 
-      attribute_type =  hdf5_array.attributes[attribute]["type"]
-      data = hdf5_array.get_data(attribute)[index]
+    attribute_type =  hdf5_array.attributes[attribute]["type"]
+    data = hdf5_array.get_data(attribute)[index]
 
-      if byteorder is None:
-        return json.dumps(data.tolist())
+    if byteorder is None:
+      return json.dumps(data.tolist())
+    else:
+      if sys.byteorder != byteorder:
+        return data.byteswap().tostring(order="C")
       else:
-        if sys.byteorder != byteorder:
-          return data.byteswap().tostring(order="C")
-        else:
-          return data.tostring(order="C")
+        return data.tostring(order="C")
+
+@cherrypy.tools.json_out(on = True)
+def get_model_array_lod(mid, aid, array, **arguments):
+  try:
+    array = int(array)
+    x = int(arguments["x"])
+    y = int(arguments["y"])
+  except:
+    raise cherrypy.HTTPError("400 Malformed array, x, or y argument must be a zero-based integer index.")
+
+  try:
+    viewport = [float(value) for value in arguments["viewport"].split(",")] if "viewport" in arguments else None
+    if viewport is not None and len(viewport) != 4:
+      raise Exception()
+  except:
+    raise cherrypy.HTTPError("400 Malformed viewport argument must be a comma separated xmin, xmax, ymin, ymax.")
+
+  try:
+    resolution = [int(value) for value in arguments.get("resolution", "256,256").split(",")]
+    if len(resolution) != 2:
+      raise Exception()
+  except:
+    raise cherrypy.HTTPError("400 Malformed resolution argument must be a comma separated width, height in pixels.")
+
+  try:
+    limit = int(arguments["limit"]) if "limit" in arguments else None
+    index = tuple([int(value) for value in arguments["index"].split(",")]) if arguments.get("index", "") else ()
+  except:
+    raise cherrypy.HTTPError("400 Malformed limit or index argument must contain integers.")
+
+  database = slycat.web.server.database.couchdb.connect()
+  model = database.get("model", mid)
+  project = database.get("project", model["project"])
+  slycat.web.server.authentication.require_project_reader(project)
+
+  artifact = model.get("artifact:%s" % aid, None)
+  if artifact is None:
+    raise cherrypy.HTTPError(404)
+  artifact_type = model["artifact-types"][aid]
+  if artifact_type not in ["hdf5"]:
+    raise cherrypy.HTTPError("400 %s is not an array artifact." % aid)
+  check_artifact_etag(database, model, aid)
+
+  try:
+    summary = slycat.web.server.get_model_array_lod(database, model, aid, array, x, y, viewport, resolution, limit, index)
+  except (KeyError, ValueError) as e:
+    raise cherrypy.HTTPError("400 %s" % e)
+
+  for key in ["rows", "x", "y"]:
+    if key in summary:
+      summary[key] = summary[key].tolist()
+  if "bins" in summary:
+    summary["bins"] = dict([(key, value.tolist()) for key, value in summary["bins"].items()])
+  return summary
 
 @cherrypy.tools.json_out(on = True)
 def get_model_arrayset_metadata(mid, name, **kwargs):
@@ -791,6 +873,7 @@ def get_model_arrayset_metadata(mid, name, **kwargs):
   artifact_type = model["artifact-types"][name]
   if artifact_type not in ["hdf5"]:
     raise cherrypy.HTTPError("400 %s is not an array artifact." % name)
+  check_artifact_etag(database, model, name)
 
   try:
     arrays = slycat.hyperchunks.parse(kwargs["arrays"]) if "arrays" in kwargs else None
@@ -807,10 +890,31 @@ def get_model_arrayset_metadata(mid, name, **kwargs):
   except:
     raise cherrypy.HTTPError("400 Not a valid hyperchunks specification.")
 
-  results = slycat.web.server.get_model_arrayset_metadata(database, model, name, arrays, statistics, unique)
+  try:
+    histograms = slycat.hyperchunks.parse(kwargs["histograms"]) if "histograms" in kwargs else None
+  except:
+    raise cherrypy.HTTPError("400 Not a valid hyperchunks specification.")
+
+  try:
+    bins = [float(edge) for edge in kwargs["bins"].split(",")] if "," in kwargs.get("bins", "") else int(kwargs.get("bins", 10))
+  except:
+    raise cherrypy.HTTPError("400 Malformed bins argument must be a bin count or comma separated bin edges.")
+
+  if kwargs.get("bin-type", "fixed") not in ["fixed", "quantile"]:
+    raise cherrypy.HTTPError("400 Optional bin-type argument must be fixed or quantile.")
+  quantiles = kwargs.get("bin-type", "fixed") == "quantile"
+
+  try:
+    results = slycat.web.server.get_model_arrayset_metadata(database, model, name, arrays, statistics, unique, histograms, bins, quantiles)
+  except ValueError as e:
+    raise cherrypy.HTTPError("400 %s" % e)
   if "unique" in results:
     for unique in results["unique"]:
       unique["values"] = [array.tolist() for array in unique["values"]]
+  if "histograms" in results:
+    for histogram in results["histograms"]:
+      histogram["edges"] = histogram["edges"].tolist()
+      histogram["counts"] = histogram["counts"].tolist()
 
   return results
 
@@ -841,6 +945,7 @@ def get_model_arrayset_data(mid, aid, hyperchunks, byteorder=None):
   artifact_type = model["artifact-types"][aid]
   if artifact_type not in ["hdf5"]:
     raise cherrypy.HTTPError("400 %s is not an array artifact." % aid)
+  check_artifact_etag(database, model, aid)
 
   def mask_nans(array):
     """Convert an array containing nans into a masked array."""
@@ -929,18 +1034,10 @@ def get_table_sort_index(file, metadata, array_index, sort, index):
   if sort is not None:
     sort_column, sort_order = sort[0]
     if index is not None and sort_column == metadata["column-count"]-1:
-      pass # At this point, the sort index is already set from above
+      if sort_order == "descending":
+        sort_index = sort_index[::-1]
     else:
-      index_key = "array/%s/index/%s" % (array_index, sort_column)
-      if index_key not in file:
-        #cherrypy.log.error("Caching array index for file %s array %s attribute %s" % (file.filename, array_index, sort_column))
-        sort_index = numpy.argsort(slycat.hdf5.ArraySet(file)[array_index].get_data(sort_column)[...], kind="mergesort")
-        file[index_key] = sort_index
-      else:
-        #cherrypy.log.error("Loading cached sort index.")
-        sort_index = file[index_key][...]
-    if sort_order == "descending":
-      sort_index = sort_index[::-1]
+      sort_index = slycat.hdf5.ArraySet(file)[array_index].get_sort_index(sort_column, descending=(sort_order == "descending"))
   return sort_index
 
 def get_table_metadata(file, array_index, index):
@@ -986,17 +1083,88 @@ def get_model_table_metadata(mid, aid, array, index = None):
   artifact_type = model["artifact-types"][aid]
   if artifact_type not in ["hdf5"]:
     raise cherrypy.HTTPError("400 %s is not an array artifact." % aid)
+  check_artifact_etag(database, model, aid)
 
-  with slycat.web.server.hdf5.lock:
-    with slycat.web.server.hdf5.open(artifact, "r+") as file: # We have to open the file with writing enabled because the statistics cache may need to be updated.
-      metadata = get_table_metadata(file, array, index)
+  with slycat.web.server.hdf5.open(artifact, "r") as file:
+    metadata = get_table_metadata(file, array, index)
   return metadata
 
-@cherrypy.tools.json_out(on = True)
-def get_model_table_chunk(mid, aid, array, rows=None, columns=None, index=None, sort=None):
+def encode_table_chunk(chunk, column_types, byteorder):
+  """Encode a table chunk as a single binary payload.
+
+  The payload starts with a 32-bit unsigned integer containing the length of
+  a UTF-8 JSON header.  The header contains the same "rows", "columns",
+  "column-names", and "sort" values as the JSON representation, plus
+  "column-types" and "buffers", which locate the data for each column.  Each
+  buffer is a two-element [offset, length] list, in bytes, with offsets
+  measured from the end of the header.  The header is padded so that every
+  buffer starts on an eight-byte boundary, and can be used directly as the
+  storage for a typed array:
+
+  * "data" - column values, stored using the column type.  int64 and uint64
+    columns are sent as float64, since JavaScript has no 64-bit integer typed
+    arrays.  String values are UTF-8 encoded and concatenated.
+  * "offsets" - for string columns, uint32 offsets of the start and end of
+    each value within "data" (one more than the number of rows).
+  * "validity" - for floating-point columns that contain NaNs, a bitmap with
+    one bit per row, most-significant bit first, that is 0 for NaN (missing)
+    values.  Otherwise null.
+
+  Numbers are stored using the requested byteorder.
+  """
+  order = "<" if byteorder == "little" else ">"
+  buffers = []
+  header_columns = []
+  wire_types = []
+  position = [0]
+
+  def append(buffer):
+    extent = [position[0], len(buffer)]
+    padding = -len(buffer) % 8
+    buffers.append(buffer + "\0" * padding)
+    position[0] += len(buffer) + padding
+    return extent
+
+  for values, type in zip(chunk["data"], column_types):
+    values = numpy.asarray(values)
+    column = {"data": None, "offsets": None, "validity": None}
+    if type == "string":
+      if values.dtype.kind == "U":
+        values = numpy.char.encode(values, "utf-8")
+      elif values.dtype.kind != "S":
+        values = numpy.char.encode(values.astype("U"), "utf-8")
+      values = numpy.ascontiguousarray(values)
+      lengths = numpy.char.str_len(values) if len(values) else numpy.zeros(0, dtype="int64")
+      characters = values.view("uint8").reshape((len(values), values.dtype.itemsize))
+      column["offsets"] = append(numpy.concatenate(([0], numpy.cumsum(lengths))).astype(order + "u4").tostring())
+      column["data"] = append(characters[numpy.arange(values.dtype.itemsize) < lengths[:, None]].tostring())
+    else:
+      if type in ["int64", "uint64"]:
+        type = "float64"
+      column["data"] = append(values.astype(order + numpy.dtype(type).str[1:]).tostring())
+      if values.dtype.kind == "f":
+        missing = numpy.isnan(values)
+        if numpy.any(missing):
+          column["validity"] = append(numpy.packbits(numpy.invert(missing)).tostring())
+    header_columns.append(column)
+    wire_types.append(type)
+
+  header = json.dumps({
+    "rows": chunk["rows"],
+    "columns": chunk["columns"],
+    "column-names": chunk["column-names"],
+    "column-types": wire_types,
+    "sort": chunk["sort"],
+    "buffers": header_columns,
+    })
+  header += " " * (-(4 + len(header)) % 8)
+  return numpy.array([len(header)], dtype=order + "u4").tostring() + header + "".join(buffers)
+
+def get_model_table_chunk(mid, aid, array, rows=None, columns=None, index=None, sort=None, byteorder=None):
   rows = validate_table_rows(rows)
   columns = validate_table_columns(columns)
   sort = validate_table_sort(sort)
+  byteorder = validate_table_byteorder(byteorder)
 
   database = slycat.web.server.database.couchdb.connect()
   model = database.get("model", mid)
@@ -1009,45 +1177,51 @@ def get_model_table_chunk(mid, aid, array, rows=None, columns=None, index=None,
   artifact_type = model["artifact-types"][aid]
   if artifact_type not in ["hdf5"]:
     raise cherrypy.HTTPError("400 %s is not an array artifact." % aid)
+  check_artifact_etag(database, model, aid)
+
+  with slycat.web.server.hdf5.open(artifact, mode="r") as file:
+    metadata = get_table_metadata(file, array, index)
+
+    # Constrain end <= count along both dimensions
+    rows = rows[rows < metadata["row-count"]]
+    if numpy.any(columns >= metadata["column-count"]):
+      raise cherrypy.HTTPError("400 Column out-of-range.")
+    if sort is not None:
+      for column, order in sort:
+        if column >= metadata["column-count"]:
+          raise cherrypy.HTTPError("400 Sort column out-of-range.")
+
+    # Retrieve the data
+    data = []
+    sort_index = get_table_sort_index(file, metadata, array, sort, index)
+    slice = sort_index[rows]
+    gather = slycat.hdf5.RowGather(slice)
+    hdf5_array = slycat.hdf5.ArraySet(file)[array]
+    for column in columns:
+      if index is not None and column == metadata["column-count"]-1:
+        values = slice
+      else:
+        values = gather.read(hdf5_array.get_data(column))
+      data.append(values)
+
+  result = {
+    "rows" : rows.tolist(),
+    "columns" : columns.tolist(),
+    "column-names" : [metadata["column-names"][column] for column in columns],
+    "data" : data,
+    "sort" : sort
+    }
 
-  with slycat.web.server.hdf5.lock:
-    with slycat.web.server.hdf5.open(artifact, mode="r+") as file:
-      metadata = get_table_metadata(file, array, index)
-
-      # Constrain end <= count along both dimensions
-      rows = rows[rows < metadata["row-count"]]
-      if numpy.any(columns >= metadata["column-count"]):
-        raise cherrypy.HTTPError("400 Column out-of-range.")
-      if sort is not None:
-        for column, order in sort:
-          if column >= metadata["column-count"]:
-            raise cherrypy.HTTPError("400 Sort column out-of-range.")
-
-      # Retrieve the data
-      data = []
-      sort_index = get_table_sort_index(file, metadata, array, sort, index)
-      slice = sort_index[rows]
-      slice_index = numpy.argsort(slice, kind="mergesort")
-      slice_reverse_index = numpy.argsort(slice_index, kind="mergesort")
-      for column in columns:
-        type = metadata["column-types"][column]
-        if index is not None and column == metadata["column-count"]-1:
-          values = slice.tolist()
-        else:
-          values = slycat.hdf5.ArraySet(file)[array].get_data(column)[slice[slice_index].tolist()][slice_reverse_index].tolist()
-          if type in ["float32", "float64"]:
-            values = [None if numpy.isnan(value) else value for value in values]
-        data.append(values)
-
-      result = {
-        "rows" : rows.tolist(),
-        "columns" : columns.tolist(),
-        "column-names" : [metadata["column-names"][column] for column in columns],
-        "data" : data,
-        "sort" : sort
-        }
+  if byteorder is not None:
+    return encode_table_chunk(result, [metadata["column-types"][column] for column in columns], byteorder)
 
-  return result
+  for position, values in enumerate(data):
+    if values.dtype.kind == "f":
+      missing = numpy.isnan(values)
+      values = values.astype("object")
+      values[missing] = None
+    result["data"][position] = values.tolist()
+  return json.dumps(result)
 
 def get_model_table_sorted_indices(mid, aid, array, rows=None, index=None, sort=None, byteorder=None):
   rows = validate_table_rows(rows)
@@ -1065,21 +1239,21 @@ def get_model_table_sorted_indices(mid, aid, array, rows=None, index=None, sort=
   artifact_type = model["artifact-types"][aid]
   if artifact_type not in ["hdf5"]:
     raise cherrypy.HTTPError("400 %s is not an array artifact." % aid)
+  check_artifact_etag(database, model, aid)
 
-  with slycat.web.server.hdf5.lock:
-    with slycat.web.server.hdf5.open(artifact, mode="r+") as file:
-      metadata = get_table_metadata(file, array, index)
+  with slycat.web.server.hdf5.open(artifact, mode="r") as file:
+    metadata = get_table_metadata(file, array, index)
 
-      # Constrain end <= count along both dimensions
-      rows = rows[rows < metadata["row-count"]]
-      if sort is not None:
-        for column, order in sort:
-          if column >= metadata["column-count"]:
-            raise cherrypy.HTTPError("400 Sort column out-of-range.")
+    # Constrain end <= count along both dimensions
+    rows = rows[rows < metadata["row-count"]]
+    if sort is not None:
+      for column, order in sort:
+        if column >= metadata["column-count"]:
+          raise cherrypy.HTTPError("400 Sort column out-of-range.")
 
-      # Retrieve the data ...
-      sort_index = get_table_sort_index(file, metadata, array, sort, index)
-      slice = numpy.argsort(sort_index, kind="mergesort")[rows].astype("int32")
+    # Retrieve the data ...
+    sort_index = get_table_sort_index(file, metadata, array, sort, index)
+    slice = numpy.argsort(sort_index, kind="mergesort")[rows].astype("int32")
 
   if byteorder is None:
     return json.dumps(slice.tolist())
@@ -1105,21 +1279,21 @@ def get_model_table_unsorted_indices(mid, aid, array, rows=None, index=None, sor
   artifact_type = model["artifact-types"][aid]
   if artifact_type not in ["hdf5"]:
     raise cherrypy.HTTPError("400 %s is not an array artifact." % aid)
+  check_artifact_etag(database, model, aid)
 
-  with slycat.web.server.hdf5.lock:
-    with slycat.web.server.hdf5.open(artifact, mode="r+") as file:
-      metadata = get_table_metadata(file, array, index)
+  with slycat.web.server.hdf5.open(artifact, mode="r") as file:
+    metadata = get_table_metadata(file, array, index)
 
-      # Constrain end <= count along both dimensions
-      rows = rows[rows < metadata["row-count"]]
-      if sort is not None:
-        for column, order in sort:
-          if column >= metadata["column-count"]:
-            raise cherrypy.HTTPError("400 Sort column out-of-range.")
+    # Constrain end <= count along both dimensions
+    rows = rows[rows < metadata["row-count"]]
+    if sort is not None:
+      for column, order in sort:
+        if column >= metadata["column-count"]:
+          raise cherrypy.HTTPError("400 Sort column out-of-range.")
 
-      # Generate a database query
-      sort_index = get_table_sort_index(file, metadata, array, sort, index)
-      slice = sort_index[rows].astype("int32")
+    # Generate a database query
+    sort_index = get_table_sort_index(file, metadata, array, sort, index)
+    slice = sort_index[rows].astype("int32")
 
   if byteorder is None:
     return json.dumps(slice.tolist())
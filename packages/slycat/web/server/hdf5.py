@@ -3,9 +3,13 @@
 # rights in this software.
 
 import cherrypy
+import collections
+import contextlib
 import h5py
+import numpy
 import os
 import slycat.hdf5
+import thread
 import threading
 import types
 
@@ -16,32 +20,374 @@ def path(array):
   return slycat.hdf5.path(array, path.root)
 path.root = None
 
+def open_file(array_path, mode="r"):
+  """Open an HDF5 file with the configured chunk cache, without locking it."""
+  return h5py.File(array_path, mode=mode, rdcc_nbytes=open_file.chunk_cache_size, rdcc_nslots=open_file.chunk_cache_slots)
+open_file.chunk_cache_size = 16 * 1024 * 1024
+open_file.chunk_cache_slots = 3203
+
+@contextlib.contextmanager
 def create(array):
-  "Create a new array in the data store, ready for writing."""
-  array_path = path(array)
-  cherrypy.log.error("Creating file {}".format(array_path))
-  os.makedirs(os.path.dirname(array_path))
-  return h5py.File(array_path, mode="w")
+  """Create a new array in the data store, ready for writing.
+
+  The array is exclusively locked until the returned file is closed::
+
+    with slycat.web.server.hdf5.create(array) as file:
+      ...
+  """
+  with locks.exclusive(array):
+    files.invalidate(array)
+    array_path = path(array)
+    cherrypy.log.error("Creating file {}".format(array_path))
+    os.makedirs(os.path.dirname(array_path))
+    with open_file(array_path, mode="w") as file:
+      yield file
 
+@contextlib.contextmanager
 def open(array, mode="r"):
-  """Open an array from the data store for reading."""
-  array_path = path(array)
-  cherrypy.log.error("Opening file {}".format(array_path))
-  return h5py.File(array_path, mode=mode)
+  """Open an array from the data store.
+
+  Opening an array read-only (mode "r") acquires a shared lock, so any number
+  of readers can work with the same array concurrently, and returns a handle
+  from the :class:`FileCache`.  Any other mode acquires an exclusive lock,
+  and discards the cached handle before opening the file.  The lock is held
+  until the returned file is closed::
+
+    with slycat.web.server.hdf5.open(array, "r+") as file:
+      ...
+
+  Before an array that other arrays share data with (see :func:`link`) is
+  opened for writing, those arrays are given private copies of the shared
+  datasets, so writes never show through to them.
+  """
+  if mode == "r":
+    with locks.shared(array):
+      with files.open(array) as file:
+        with _shared_links(file):
+          yield file
+    return
+
+  while True:
+    with locks.exclusive(array):
+      files.invalidate(array)
+      array_path = path(array)
+      with open_file(array_path, mode="r") as file:
+        dependents = _dependents(file)
+      if not dependents:
+        cherrypy.log.error("Opening file {}".format(array_path))
+        with open_file(array_path, mode=mode) as file:
+          try:
+            with _shared_links(file):
+              yield file
+          finally:
+            slycat.hdf5.close_linked_files(file)
+        return
+    # Dependents lock this array while they're detached, so don't hold its lock meanwhile.
+    for dependent in dependents:
+      _detach(dependent, array)
+
+def link(source, array):
+  """Create a new array in the data store that shares the data of an existing array.
+
+  The new array starts out as a set of links to the datasets in the source,
+  and datasets are copied individually as they're modified, see
+  :func:`slycat.hdf5.link_arrayset`.  The new array is recorded in the
+  `linked-by` attribute of every array it refers to, so it can be given
+  private copies before any of them is modified, see :func:`open`.
+
+  Returns
+  -------
+  links : list of strings
+    The arrays that the new array refers to, newest first, which must not be
+    deleted before it is.
+  """
+  with create(array) as file:
+    with open(source) as source_file:
+      links = [source] + [linked for linked in _links(source_file) if linked != source]
+    # Register the new array before linking, so a concurrent writer detaches it once it's done.
+    for linked in links:
+      _update_dependents(linked, add=array)
+    with open(source) as source_file:
+      slycat.hdf5.link_arrayset(source_file, file)
+    file.attrs["linked-arrays"] = numpy.array(links, dtype=h5py.special_dtype(vlen=unicode))
+  return links
+
+def _links(file):
+  """Return the arrays that an array shares datasets with."""
+  return [str(array) for array in file.attrs.get("linked-arrays", [])]
+
+def _dependents(file):
+  """Return the arrays that may share datasets with an array."""
+  return [str(array) for array in file.attrs.get("linked-by", [])]
+
+def _update_dependents(array, add=None, remove=None):
+  """Add an array to, or remove an array from, the arrays that may share datasets with another array."""
+  with locks.exclusive(array):
+    files.invalidate(array)
+    array_path = path(array)
+    if not os.path.exists(array_path):
+      return
+    with open_file(array_path, mode="r+") as file:
+      dependents = [dependent for dependent in _dependents(file) if dependent != remove]
+      if add is not None and add not in dependents:
+        dependents.append(add)
+      file.attrs["linked-by"] = numpy.array(dependents, dtype=h5py.special_dtype(vlen=unicode))
+
+def _detach(array, source):
+  """Give an array private copies of the datasets it shares with another array, so the other array can be modified."""
+  with locks.exclusive(array):
+    files.invalidate(array)
+    array_path = path(array)
+    if os.path.exists(array_path):
+      cherrypy.log.error("Detaching file {} from {}".format(array_path, path(source)))
+      with open_file(array_path, mode="r+") as file:
+        with open(source) as source_file:
+          slycat.hdf5.unlink_arrayset(source_file, file)
+        file.attrs["linked-arrays"] = numpy.array([linked for linked in _links(file) if linked != source], dtype=h5py.special_dtype(vlen=unicode))
+  _update_dependents(source, remove=array)
+
+@contextlib.contextmanager
+def _shared_links(file):
+  """Hold shared locks on the arrays that an open array shares datasets with.
+
+  Arrays are only ever linked to older arrays, and locks are always acquired
+  from the newest array to the oldest, so they can't deadlock.
+  """
+  links = _links(file)
+  if not links:
+    yield
+    return
+  with contextlib.nested(*[locks.shared(array) for array in links]):
+    yield
 
 def delete(array):
-  """Remove an array from the data store."""
-  array_path = path(array)
-  if os.path.exists(array_path):
-    cherrypy.log.error("Deleting file {}".format(array_path))
-    os.remove(array_path)
-
-class null_lock(object):
-  """Do-nothing replacement for a thread lock, useful for debugging threading problems with h5py."""
-  def __enter__(self):
-    pass
-  def __exit__(self, exc_type, exc_value, traceback):
-    pass
-
-#lock = null_lock()
-lock = threading.RLock()
+  """Remove an array from the data store, and from the dependents of the arrays it shared data with."""
+  links = []
+  with locks.exclusive(array):
+    files.invalidate(array)
+    array_path = path(array)
+    if os.path.exists(array_path):
+      with open_file(array_path, mode="r") as file:
+        links = _links(file)
+      cherrypy.log.error("Deleting file {}".format(array_path))
+      os.remove(array_path)
+  for linked in links:
+    _update_dependents(linked, remove=array)
+
+class ReadWriteLock(object):
+  """Lock that can be held by any number of readers, or a single writer.
+
+  Read and write acquisitions are both reentrant, and a thread holding the
+  write lock may also acquire the read lock.  A thread holding only the read
+  lock cannot upgrade to the write lock.  Waiting writers take precedence over
+  new readers, so a steady stream of readers can't starve a writer.
+  """
+  def __init__(self):
+    self._condition = threading.Condition(threading.Lock())
+    self._readers = {}
+    self._writer = None
+    self._writer_depth = 0
+    self._waiting_writers = 0
+
+  def acquire_read(self):
+    owner = thread.get_ident()
+    with self._condition:
+      if self._writer != owner and owner not in self._readers:
+        while self._writer is not None or self._waiting_writers:
+          self._condition.wait()
+      self._readers[owner] = self._readers.get(owner, 0) + 1
+
+  def release_read(self):
+    owner = thread.get_ident()
+    with self._condition:
+      depth = self._readers.get(owner, 0)
+      if depth < 1:
+        raise RuntimeError("Cannot release an un-acquired read lock.")
+      if depth > 1:
+        self._readers[owner] = depth - 1
+      else:
+        del self._readers[owner]
+        if not self._readers:
+          self._condition.notify_all()
+
+  def acquire_write(self):
+    owner = thread.get_ident()
+    with self._condition:
+      if self._writer == owner:
+        self._writer_depth += 1
+        return
+      if owner in self._readers:
+        raise RuntimeError("Cannot upgrade a read lock to a write lock.")
+      self._waiting_writers += 1
+      try:
+        while self._writer is not None or self._readers:
+          self._condition.wait()
+      finally:
+        self._waiting_writers -= 1
+      self._writer = owner
+      self._writer_depth = 1
+
+  def release_write(self):
+    owner = thread.get_ident()
+    with self._condition:
+      if self._writer != owner:
+        raise RuntimeError("Cannot release an un-acquired write lock.")
+      self._writer_depth -= 1
+      if self._writer_depth == 0:
+        self._writer = None
+        self._condition.notify_all()
+
+class LockManager(object):
+  """Maintains a :class:`ReadWriteLock` for each array in the data store.
+
+  Locks are created on demand and discarded once nobody is waiting on them, so
+  the number of live locks is bounded by the number of arrays in use.
+  """
+  def __init__(self):
+    self._lock = threading.Lock()
+    self._locks = {}
+
+  @contextlib.contextmanager
+  def _hold(self, array, exclusive):
+    with self._lock:
+      entry = self._locks.get(array, None)
+      if entry is None:
+        entry = self._locks[array] = [ReadWriteLock(), 0]
+      entry[1] += 1
+    try:
+      if exclusive:
+        entry[0].acquire_write()
+        try:
+          yield
+        finally:
+          entry[0].release_write()
+      else:
+        entry[0].acquire_read()
+        try:
+          yield
+        finally:
+          entry[0].release_read()
+    finally:
+      with self._lock:
+        entry[1] -= 1
+        if entry[1] == 0:
+          del self._locks[array]
+
+  def shared(self, array):
+    """Return a context manager that holds a shared (read) lock on an array."""
+    return self._hold(array, False)
+
+  def exclusive(self, array):
+    """Return a context manager that holds an exclusive (write) lock on an array."""
+    return self._hold(array, True)
+
+  def __len__(self):
+    with self._lock:
+      return len(self._locks)
+
+locks = LockManager()
+
+class FileCache(object):
+  """Bounded, least-recently-used cache of read-only :class:`h5py.File` handles.
+
+  Handles are keyed by array id and shared by every reader of that array.
+  Callers must hold a shared lock on the array while using a handle, and an
+  exclusive lock while invalidating it, which :func:`open`, :func:`create`,
+  and :func:`delete` take care of.  A handle evicted while still in use is
+  closed when its last user is done with it.  Handles are also reopened if
+  the underlying file is modified on disk by another process.
+  """
+  class _Entry(object):
+    def __init__(self, file, signature):
+      self.file = file
+      self.signature = signature
+      self.users = 0
+      self.cached = True
+
+  def __init__(self, capacity=64):
+    self.capacity = capacity
+    self.hits = 0
+    self.misses = 0
+    self.evictions = 0
+    self.invalidations = 0
+    self._lock = threading.Lock()
+    self._entries = collections.OrderedDict()
+
+  @staticmethod
+  def _signature(array_path):
+    stat = os.stat(array_path)
+    return (stat.st_ino, stat.st_size, stat.st_mtime)
+
+  def _release(self, entry):
+    """Decrement the user count for an entry, closing it if it's no longer needed.  Assumes the caller holds self._lock."""
+    entry.users -= 1
+    if entry.users == 0 and not entry.cached:
+      entry.file.close()
+
+  def _discard(self, array):
+    """Remove an entry from the cache.  Assumes the caller holds self._lock."""
+    entry = self._entries.pop(array, None)
+    if entry is not None:
+      entry.cached = False
+      entry.users += 1
+      self._release(entry)
+    return entry
+
+  @contextlib.contextmanager
+  def open(self, array):
+    """Return a context manager that provides a read-only handle for an array."""
+    array_path = path(array)
+    signature = self._signature(array_path)
+
+    with self._lock:
+      entry = self._entries.get(array, None)
+      if entry is not None and entry.signature != signature:
+        self._discard(array)
+        entry = None
+      if entry is not None:
+        self._entries[array] = self._entries.pop(array) # Mark the entry as most-recently used.
+        entry.users += 1
+        self.hits += 1
+
+    if entry is None:
+      # Open the file without holding the cache lock.  If several readers race
+      # to open the same array, the last one wins and the others' handles are
+      # closed once they're done with them.
+      entry = FileCache._Entry(open_file(array_path), signature)
+      entry.users += 1
+      with self._lock:
+        self.misses += 1
+        self._discard(array)
+        self._entries[array] = entry
+        while len(self._entries) > self.capacity:
+          self._discard(next(iter(self._entries)))
+          self.evictions += 1
+
+    try:
+      yield entry.file
+    finally:
+      with self._lock:
+        self._release(entry)
+
+  def invalidate(self, array):
+    """Discard any cached handle for an array."""
+    with self._lock:
+      if self._discard(array) is not None:
+        self.invalidations += 1
+
+  def clear(self):
+    """Discard every cached handle."""
+    with self._lock:
+      for array in list(self._entries.keys()):
+        self._discard(array)
+
+  def __len__(self):
+    with self._lock:
+      return len(self._entries)
+
+  def statistics(self):
+    """Return a dict containing cache hit, miss, eviction, and invalidation counts."""
+    with self._lock:
+      return {"size": len(self._entries), "capacity": self.capacity, "hits": self.hits, "misses": self.misses, "evictions": self.evictions, "invalidations": self.invalidations}
+
+files = FileCache()
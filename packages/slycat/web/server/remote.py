@@ -34,6 +34,7 @@ import hashlib
 import json
 import os
 import paramiko
+import Queue
 import slycat.mime_type
 import slycat.web.server.authentication
 import slycat.web.server.database
@@ -95,6 +96,7 @@ class Session(object):
     self._created = now
     self._accessed = now
     self._lock = threading.Lock()
+    self._agent_read = None
   def __enter__(self):
     self._lock.__enter__()
     return self
@@ -264,6 +266,38 @@ class Session(object):
       cherrypy.response.headers["x-slycat-message"] = "Remote access failed: %s" % str(e)
       raise cherrypy.HTTPError("400 Remote access failed.")
 
+  def read_file(self, path, offset, size, file=None):
+    """Read a block of a remote file.  Callers must hold the session lock.
+
+    Uses the agent's chunked `read-file` command when available.  Otherwise,
+    reads from `file` (an open SFTP file), issuing the SFTP requests for the
+    whole block at once so they're pipelined.
+
+    Returns
+    -------
+    content : string
+      Up to `size` bytes, starting at `offset`.  Empty at the end of the file.
+    file_size : integer
+      Size of the entire file.
+    """
+    if self._agent is not None and self._agent_read is not False:
+      stdin, stdout, stderr = self._agent
+      stdin.write("%s\n" % json.dumps({"action":"read-file", "path":path, "offset":offset, "size":size}))
+      stdin.flush()
+      metadata = json.loads(stdout.readline())
+      if metadata["ok"]:
+        self._agent_read = True
+        return stdout.read(metadata["size"]), metadata["file-size"]
+      if metadata["message"] != "Unknown command." or self._agent_read:
+        raise Exception("Reading %s:%s failed: %s" % (self.hostname, path, metadata["message"]))
+      # Older agents don't support chunked reads, so fall back to sftp.
+      self._agent_read = False
+
+    if file is None:
+      with self._sftp.file(path, "rb") as file:
+        return _read_block(file, offset, size)
+    return _read_block(file, offset, size)
+
   def get_image(self, path, **kwargs):
     content_type = kwargs.get("content-type", None)
     max_size = kwargs.get("max-size", None)
@@ -383,6 +417,138 @@ class Session(object):
     sys.stderr.write("\n%s\n" % metadata)
     return slycat.web.server.streaming.serve(stdout, metadata["size"], metadata["content-type"])
 
+class RemoteFile(object):
+  """Read-only, file-like access to a remote file, without reading it into memory.
+
+  A background thread reads the file in blocks of `block_size` bytes, holding
+  the session lock only while each block is read, so other requests can use
+  the session in between.  Up to `read_ahead` blocks are buffered ahead of the
+  caller, so the network transfer overlaps whatever the caller does with the
+  data.  If provided, `progress(bytes_read, file_size)` is called as the
+  caller reads through the file::
+
+    with slycat.web.server.remote.RemoteFile(session, path) as file:
+      slycat.table.store(file, arrayset)
+
+  The session lock must not be held when the file is created.
+  """
+  def __init__(self, session, path, block_size=None, read_ahead=None, progress=None):
+    self._session = session
+    self._path = path
+    self._block_size = block_size if block_size is not None else _read_block_size
+    self._queue = Queue.Queue(read_ahead if read_ahead is not None else _read_ahead)
+    self._progress = progress
+    self._position = 0
+    self._buffer = ""
+    self._eof = False
+    self._stop = None
+    self._thread = None
+
+    with session:
+      self._file = session.sftp.file(path, "rb") if session._agent is None or session._agent_read is False else None
+      content, self.size = session.read_file(path, 0, 0, self._file)
+      if self._file is None and session._agent_read is False:
+        self._file = session.sftp.file(path, "rb")
+    self._start(0)
+
+  def _start(self, offset):
+    self._stop = threading.Event()
+    self._thread = threading.Thread(name="Remote read %s" % self._path, target=self._read_ahead, args=(offset, self._stop, self._queue))
+    self._thread.daemon = True
+    self._thread.start()
+
+  def _halt(self):
+    """Stop the read-ahead thread and discard anything it buffered."""
+    self._stop.set()
+    while self._thread.is_alive():
+      try:
+        self._queue.get(timeout=0.1)
+      except Queue.Empty:
+        pass
+    while not self._queue.empty():
+      self._queue.get_nowait()
+
+  def _read_ahead(self, offset, stop, queue):
+    try:
+      while not stop.is_set():
+        with self._session:
+          self._session._accessed = datetime.datetime.utcnow()
+          content, file_size = self._session.read_file(self._path, offset, self._block_size, self._file)
+        offset += len(content)
+        self._put(queue, stop, content)
+        if not content:
+          return
+    except Exception as e:
+      self._put(queue, stop, e)
+
+  @staticmethod
+  def _put(queue, stop, item):
+    while not stop.is_set():
+      try:
+        queue.put(item, timeout=0.1)
+        return
+      except Queue.Full:
+        pass
+
+  def read(self, size=-1):
+    """Read up to `size` bytes (or the rest of the file, if `size` is negative)."""
+    pieces = [self._buffer]
+    count = len(self._buffer)
+    while (size < 0 or count < size) and not self._eof:
+      content = self._queue.get()
+      if isinstance(content, Exception):
+        raise content
+      if not content:
+        self._eof = True
+      pieces.append(content)
+      count += len(content)
+    data = "".join(pieces)
+    if size >= 0:
+      data, self._buffer = data[:size], data[size:]
+    else:
+      self._buffer = ""
+    self._position += len(data)
+    if self._progress is not None and data:
+      self._progress(self._position, self.size)
+    return data
+
+  def tell(self):
+    return self._position
+
+  def seek(self, offset, whence=0):
+    """Move to an absolute offset.  Only `whence` == 0 is supported."""
+    if whence != 0:
+      raise ValueError("Only absolute seeks are supported.")
+    self._halt()
+    self._position = offset
+    self._buffer = ""
+    self._eof = False
+    self._start(offset)
+
+  def close(self):
+    if self._thread is not None:
+      self._halt()
+      self._thread = None
+    if self._file is not None:
+      with self._session:
+        self._file.close()
+      self._file = None
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    self.close()
+
+def _read_block(file, offset, size):
+  """Read a block from an open SFTP file, returning the block and the file size."""
+  file_size = file.stat().st_size
+  size = max(0, min(size, file_size - offset))
+  return ("".join(file.readv([(offset, size)])) if size else ""), file_size
+
+_read_block_size = 1024 * 1024
+_read_ahead = 4
+
 def create_session(hostname, username, password, agent):
   """Create a cached remote session for the given host.
 
@@ -0,0 +1,317 @@
+# Copyright 2013, Sandia Corporation. Under the terms of Contract
+# DE-AC04-94AL85000 with Sandia Corporation, the U.S. Government retains certain
+# rights in this software.
+
+"""Runs model computations in the background, isolated from request handling.
+
+Plugins submit jobs with :func:`submit` instead of starting their own threads.
+Jobs wait in a priority queue until one of a fixed number of scheduler threads
+is free to run them, and the expensive numerical parts of a job can be handed
+to :func:`compute`, which runs them in a separate worker process so they don't
+compete with request threads for the GIL::
+
+  def work(mid):
+    ...
+    x, y = slycat.web.server.scheduler.compute(slycat.cca.cca, X, Y)
+    ...
+
+  slycat.web.server.scheduler.submit(work, args=(mid,), name="CCA", key=mid)
+
+Jobs can be cancelled using the key they were submitted with, and each job
+records the time it spent queued and running, and the CPU time and peak memory
+used by its thread and worker processes.
+"""
+
+from __future__ import absolute_import
+
+import cherrypy
+import collections
+import datetime
+import heapq
+import itertools
+import multiprocessing
+import resource
+import sys
+import threading
+import traceback
+import uuid
+
+class Cancelled(Exception):
+  """Raised inside a job when it has been cancelled."""
+  pass
+
+class Job(object):
+  """A unit of work managed by the :class:`Scheduler`."""
+  def __init__(self, function, args, kwargs, name, priority, key):
+    self.id = uuid.uuid4().hex
+    self.name = name if name is not None else getattr(function, "__name__", "job")
+    self.priority = priority
+    self.key = key
+    self.state = "queued"
+    self.result = None
+    self.message = None
+    self.submitted = datetime.datetime.utcnow()
+    self.started = None
+    self.finished = None
+    self.usage = {"user-time": 0.0, "system-time": 0.0, "max-rss": 0, "processes": 0, "process-user-time": 0.0, "process-system-time": 0.0, "process-max-rss": 0}
+    self._function = function
+    self._args = args
+    self._kwargs = kwargs
+    self._cancelled = threading.Event()
+    self._done = threading.Event()
+
+  @property
+  def cancelled(self):
+    return self._cancelled.is_set()
+
+  def cancel(self):
+    """Ask the job to stop.  Queued jobs never start, and running jobs stop at their next call to :func:`compute` or :func:`check`."""
+    self._cancelled.set()
+
+  def wait(self, timeout=None):
+    """Wait for the job to finish, returning True if it did."""
+    return self._done.wait(timeout)
+
+  def status(self):
+    """Return a JSON-compatible description of the job."""
+    return {
+      "id": self.id,
+      "name": self.name,
+      "key": self.key,
+      "priority": self.priority,
+      "state": self.state,
+      "result": self.result,
+      "submitted": self.submitted.isoformat(),
+      "started": self.started.isoformat() if self.started is not None else None,
+      "finished": self.finished.isoformat() if self.finished is not None else None,
+      "queued-time": ((self.started or datetime.datetime.utcnow()) - self.submitted).total_seconds(),
+      "run-time": ((self.finished or datetime.datetime.utcnow()) - self.started).total_seconds() if self.started is not None else 0.0,
+      "usage": dict(self.usage),
+      }
+
+class Scheduler(object):
+  """Runs jobs in priority order using a bounded number of threads and worker processes.
+
+  Jobs with higher priorities run first, and jobs with equal priorities run
+  in the order they were submitted.  At most `threads` jobs run at once, and
+  at most `processes` worker processes (see :meth:`compute`) exist at once,
+  across all jobs.  Worker processes are forked for each call to
+  :meth:`compute`, so they can be terminated when a job is cancelled, and
+  their resource usage can be charged to the job that started them.
+  """
+  def __init__(self, threads=4, processes=4, history=100):
+    self.threads = threads
+    self.processes = processes
+    self.submitted = 0
+    self.completed = collections.Counter()
+    self._lock = threading.Lock()
+    self._condition = threading.Condition(self._lock)
+    self._queue = []
+    self._sequence = itertools.count()
+    self._running = {}
+    self._history = collections.deque(maxlen=history)
+    self._workers = []
+    self._process_count = 0
+    self._local = threading.local()
+
+  def submit(self, function, args=(), kwargs={}, name=None, priority=0, key=None):
+    """Queue `function(*args, **kwargs)` to run in a scheduler thread.
+
+    Parameters
+    ----------
+    function: callable
+    args: tuple, optional
+    kwargs: dict, optional
+    name: string, optional
+      Human-readable job name.
+    priority: integer, optional
+      Jobs with higher priorities run first.
+    key: string, optional
+      Used to cancel all of the jobs working on an object, such as a model id.
+
+    Returns
+    -------
+    job: :class:`Job`
+    """
+    job = Job(function, args, dict(kwargs), name, priority, key)
+    with self._condition:
+      heapq.heappush(self._queue, (-priority, next(self._sequence), job))
+      self.submitted += 1
+      while len(self._workers) < self.threads:
+        worker = threading.Thread(name="Scheduler %s" % len(self._workers), target=self._work)
+        worker.daemon = True
+        worker.start()
+        self._workers.append(worker)
+      self._condition.notify()
+    return job
+
+  def cancel(self, key):
+    """Cancel every queued or running job submitted with the given key (or id), returning the number of jobs cancelled."""
+    with self._condition:
+      jobs = [job for priority, sequence, job in self._queue] + self._running.values()
+    jobs = [job for job in jobs if key in (job.key, job.id) and not job.cancelled]
+    for job in jobs:
+      cherrypy.log.error("Cancelling job %s %s." % (job.name, job.id))
+      job.cancel()
+    return len(jobs)
+
+  def _work(self):
+    while True:
+      with self._condition:
+        while not self._queue:
+          self._condition.wait()
+        priority, sequence, job = heapq.heappop(self._queue)
+        if job.cancelled:
+          self._finish(job, "cancelled")
+          continue
+        job.state = "running"
+        job.started = datetime.datetime.utcnow()
+        self._running[job.id] = job
+
+      self._local.job = job
+      before = _thread_usage()
+      try:
+        job._function(*job._args, **job._kwargs)
+        result = "cancelled" if job.cancelled else "succeeded"
+      except Cancelled:
+        result = "cancelled"
+      except Exception as e:
+        cherrypy.log.error("Job %s %s failed: %s" % (job.name, job.id, traceback.format_exc()))
+        job.message = traceback.format_exc()
+        result = "failed"
+      finally:
+        self._local.job = None
+        after = _thread_usage()
+        if before is not None and after is not None:
+          job.usage["user-time"] += after.ru_utime - before.ru_utime
+          job.usage["system-time"] += after.ru_stime - before.ru_stime
+          job.usage["max-rss"] = max(job.usage["max-rss"], after.ru_maxrss)
+
+      with self._condition:
+        del self._running[job.id]
+        self._finish(job, result)
+
+  def _finish(self, job, result):
+    """Record a job's final state.  Assumes the caller holds self._lock."""
+    job.state = "finished"
+    job.result = result
+    job.finished = datetime.datetime.utcnow()
+    self.completed[result] += 1
+    self._history.append(job)
+    job._done.set()
+
+  def current(self):
+    """Return the :class:`Job` running in the calling thread, or None."""
+    return getattr(self._local, "job", None)
+
+  def check(self):
+    """Raise :class:`Cancelled` if the job running in the calling thread has been cancelled."""
+    job = self.current()
+    if job is not None and job.cancelled:
+      raise Cancelled()
+
+  def compute(self, function, *args, **kwargs):
+    """Call `function(*args, **kwargs)` in a worker process, returning its result.
+
+    The function, arguments, and any state they reference are inherited by
+    the forked worker, and only the result is pickled and sent back, so
+    arguments can be large arrays.  The function must not use CouchDB, HDF5
+    files, or anything else that relies on locks held by the server process.
+    Waits for a free worker if `processes` are already busy.  If the calling
+    job is cancelled, the worker is terminated and :class:`Cancelled` is
+    raised.
+    """
+    job = self.current()
+    self.check()
+    with self._condition:
+      while self._process_count >= self.processes:
+        self._condition.wait(0.1)
+        self.check()
+      self._process_count += 1
+
+    try:
+      receiver, sender = multiprocessing.Pipe(duplex=False)
+      process = multiprocessing.Process(target=_compute, args=(sender, function, args, kwargs))
+      process.daemon = True
+      process.start()
+      sender.close()
+      try:
+        while not receiver.poll(0.1):
+          if job is not None and job.cancelled:
+            process.terminate()
+            raise Cancelled()
+          if not process.is_alive() and not receiver.poll():
+            raise Exception("Worker process exited unexpectedly with code %s." % process.exitcode)
+        result, error, usage = receiver.recv()
+      finally:
+        receiver.close()
+        process.join()
+    finally:
+      with self._condition:
+        self._process_count -= 1
+        self._condition.notify_all()
+
+    if job is not None:
+      job.usage["processes"] += 1
+      job.usage["process-user-time"] += usage[0]
+      job.usage["process-system-time"] += usage[1]
+      job.usage["process-max-rss"] = max(job.usage["process-max-rss"], usage[2])
+    if error is not None:
+      raise Exception("Worker process failed: %s" % error)
+    return result
+
+  def jobs(self):
+    """Return the status of queued, running, and recently-finished jobs."""
+    with self._condition:
+      jobs = [job for priority, sequence, job in sorted(self._queue)] + self._running.values() + list(self._history)
+    return [job.status() for job in jobs]
+
+  def statistics(self):
+    """Return a dict containing queue length, running job, and completed job counts."""
+    with self._condition:
+      return {
+        "threads": self.threads,
+        "processes": self.processes,
+        "queued": len(self._queue),
+        "running": len(self._running),
+        "active-processes": self._process_count,
+        "submitted": self.submitted,
+        "succeeded": self.completed["succeeded"],
+        "failed": self.completed["failed"],
+        "cancelled": self.completed["cancelled"],
+        }
+
+def _compute(sender, function, args, kwargs):
+  """Entry point for worker processes."""
+  try:
+    result, error = function(*args, **kwargs), None
+  except Exception as e:
+    result, error = None, traceback.format_exc()
+  usage = resource.getrusage(resource.RUSAGE_SELF)
+  sender.send((result, error, (usage.ru_utime, usage.ru_stime, usage.ru_maxrss)))
+  sender.close()
+
+def _thread_usage():
+  """Return resource usage for the calling thread, if the platform supports it."""
+  if _thread_usage.who is None:
+    return None
+  return resource.getrusage(_thread_usage.who)
+_thread_usage.who = getattr(resource, "RUSAGE_THREAD", 1 if sys.platform.startswith("linux") else None)
+
+scheduler = Scheduler()
+
+def submit(function, args=(), kwargs={}, name=None, priority=0, key=None):
+  """Submit a job to the server's :class:`Scheduler`.  See :meth:`Scheduler.submit`."""
+  return scheduler.submit(function, args, kwargs, name, priority, key)
+
+def cancel(key):
+  """Cancel jobs in the server's :class:`Scheduler`.  See :meth:`Scheduler.cancel`."""
+  return scheduler.cancel(key)
+
+def check():
+  """Raise :class:`Cancelled` if the calling job has been cancelled.  See :meth:`Scheduler.check`."""
+  scheduler.check()
+
+def compute(function, *args, **kwargs):
+  """Run a function in a worker process.  See :meth:`Scheduler.compute`."""
+  return scheduler.compute(function, *args, **kwargs)
@@ -0,0 +1,85 @@
+# Copyright 2013, Sandia Corporation. Under the terms of Contract
+# DE-AC04-94AL85000 with Sandia Corporation, the U.S. Government retains certain
+# rights in this software.
+
+"""Measure binary arrayset upload throughput, in MB/s.
+
+Compares the original upload path, which reads each hyperslice into a new
+array with numpy.fromfile() and only handles native byte order, against
+:class:`slycat.web.server.BinaryHypersliceReader`, which reads into a reused
+buffer, byteswaps in place, and writes in bounded blocks.  The request body is
+simulated with a temporary file, the way CherryPy spools large uploads.  Both
+the write alone and the write plus the update_cache() call that follows every
+upload are timed, and the peak memory used by the write is reported.
+"""
+
+import argparse
+import h5py
+import multiprocessing
+import numpy
+import os
+import resource
+import shutil
+import slycat.hdf5
+import slycat.web.server
+import sys
+import tempfile
+import time
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--size", type=float, default=256, help="Megabytes of data per upload.  Default: %(default)s")
+parser.add_argument("--columns", type=int, default=64, help="Number of columns in the 2D array.  Default: %(default)s")
+parser.add_argument("--block-size", type=float, default=16, help="Reader block size in megabytes.  Default: %(default)s")
+parser.add_argument("--repeat", type=int, default=2, help="Number of times to repeat each upload.  Default: %(default)s")
+arguments = parser.parse_args()
+
+directory = tempfile.mkdtemp()
+other_byteorder = "big" if sys.byteorder == "little" else "little"
+
+def upload(shape, byteorder, method):
+  """Return the best write and write + update_cache() rates in MB/s, plus the extra memory used by the write in MB."""
+  values = numpy.random.random(shape).astype("%sf8" % ("<" if byteorder == "little" else ">"))
+  body_path = os.path.join(directory, "body")
+  values.tofile(body_path)
+  nbytes = values.nbytes
+  del values
+
+  results = []
+  for iteration in range(arguments.repeat):
+    # Run each upload in a forked process, so its peak memory use can be measured separately.
+    receiver, sender = multiprocessing.Pipe(duplex=False)
+    process = multiprocessing.Process(target=upload_process, args=(sender, shape, byteorder, method, body_path))
+    process.start()
+    results.append(receiver.recv())
+    process.join()
+  return max([write_rate for write_rate, total_rate, memory in results]), max([total_rate for write_rate, total_rate, memory in results]), min([memory for write_rate, total_rate, memory in results])
+
+def upload_process(sender, shape, byteorder, method, body_path):
+  nbytes = os.path.getsize(body_path)
+  with h5py.File(os.path.join(directory, "array.hdf5"), "w") as file:
+    array = slycat.hdf5.start_arrayset(file).start_array(0, [{"name":"d%s" % index, "end":size} for index, size in enumerate(shape)], [{"name":"value", "type":"float64"}])
+    with open(body_path, "rb") as body:
+      baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+      start = time.time()
+      if method == "fromfile":
+        array.set_data(0, Ellipsis, numpy.fromfile(body, dtype="float64", count=nbytes // 8).reshape(shape))
+      else:
+        slycat.web.server.BinaryHypersliceReader(body, byteorder, block_size=int(arguments.block_size * 1024 * 1024)).store(array, 0, (Ellipsis,))
+      file.flush()
+      write_time = time.time() - start
+      memory = (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - baseline) / 1024.0
+      array.update_cache()
+      file.flush()
+      total_time = time.time() - start
+  sender.send((nbytes / write_time / 1024 / 1024, nbytes / total_time / 1024 / 1024, memory))
+
+try:
+  count = int(arguments.size * 1024 * 1024 / 8)
+  shapes = [(count,), (count // arguments.columns, arguments.columns)]
+
+  print "%12s %10s %10s %12s %12s %12s" % ("shape", "byteorder", "method", "write MB/s", "total MB/s", "memory MB")
+  for shape in shapes:
+    for byteorder, method in [(sys.byteorder, "fromfile"), (sys.byteorder, "reader"), (other_byteorder, "reader")]:
+      print "%12s %10s %10s %12.1f %12.1f %12.1f" % (("x".join(str(size) for size in shape), byteorder, method) + upload(shape, byteorder, method))
+finally:
+  shutil.rmtree(directory)
@@ -0,0 +1,95 @@
+# Copyright 2013, Sandia Corporation. Under the terms of Contract
+# DE-AC04-94AL85000 with Sandia Corporation, the U.S. Government retains certain
+# rights in this software.
+
+"""Compare request throughput using a single process-wide HDF5 lock against per-array reader / writer locks.
+
+Each simulated request opens one array, reads a chunk of one column, and
+serializes it to JSON, the way the table chunk handlers do.  Requests are
+spread across disjoint arrays, so with per-array locking they only contend for
+h5py's own internal lock and the GIL.  The --hold argument adds time spent
+inside the locked region that doesn't touch HDF5 (a slow client, a CouchDB
+round trip, etc.), which is where a global lock hurts the most.
+"""
+
+import argparse
+import cherrypy
+import contextlib
+import h5py
+import json
+import numpy
+import shutil
+import slycat.hdf5
+import slycat.web.server.hdf5
+import tempfile
+import threading
+import time
+import uuid
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--arrays", type=int, default=16, help="Number of arrays to create.  Default: %(default)s")
+parser.add_argument("--columns", type=int, default=4, help="Number of columns per array.  Default: %(default)s")
+parser.add_argument("--rows", type=int, default=100000, help="Number of rows per array.  Default: %(default)s")
+parser.add_argument("--chunk", type=int, default=1000, help="Number of rows read by each request.  Default: %(default)s")
+parser.add_argument("--hold", type=float, default=0.002, help="Extra seconds spent inside the locked region by each request.  Default: %(default)s")
+parser.add_argument("--duration", type=float, default=2.0, help="Seconds to run each configuration.  Default: %(default)s")
+parser.add_argument("--threads", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32], help="Thread pool sizes to test.  Default: %(default)s")
+arguments = parser.parse_args()
+
+cherrypy.log.screen = False
+
+data_store = tempfile.mkdtemp()
+slycat.web.server.hdf5.path.root = data_store
+
+print "Creating %s arrays with %s rows x %s columns in %s ..." % (arguments.arrays, arguments.rows, arguments.columns, data_store)
+arrays = [uuid.uuid4().hex for index in range(arguments.arrays)]
+for array in arrays:
+  with slycat.web.server.hdf5.create(array) as file:
+    arrayset = slycat.hdf5.start_arrayset(file)
+    hdf5_array = arrayset.start_array(0, [dict(name="row", end=arguments.rows)], [dict(name="c%s" % column, type="float64") for column in range(arguments.columns)])
+    for column in range(arguments.columns):
+      hdf5_array.set_data(column, slice(0, arguments.rows), numpy.random.random(arguments.rows))
+
+global_lock = threading.RLock()
+
+@contextlib.contextmanager
+def global_open(array):
+  with global_lock:
+    with h5py.File(slycat.web.server.hdf5.path(array), mode="r") as file:
+      yield file
+
+def request(open, array):
+  with open(array) as file:
+    begin = numpy.random.randint(0, arguments.rows - arguments.chunk)
+    column = numpy.random.randint(0, arguments.columns)
+    values = slycat.hdf5.ArraySet(file)[0].get_data(column)[begin : begin + arguments.chunk]
+    json.dumps(values.tolist())
+    if arguments.hold:
+      time.sleep(arguments.hold)
+
+def run(open, thread_count):
+  counts = [0] * thread_count
+  stop = threading.Event()
+  def worker(index):
+    while not stop.is_set():
+      request(open, arrays[(index + counts[index]) % len(arrays)])
+      counts[index] += 1
+  threads = [threading.Thread(target=worker, args=(index,)) for index in range(thread_count)]
+  start = time.time()
+  for thread in threads:
+    thread.start()
+  time.sleep(arguments.duration)
+  stop.set()
+  for thread in threads:
+    thread.join()
+  return sum(counts) / (time.time() - start)
+
+try:
+  print
+  print "%8s %16s %16s %8s" % ("threads", "global req/s", "per-array req/s", "speedup")
+  for thread_count in arguments.threads:
+    global_rate = run(global_open, thread_count)
+    array_rate = run(slycat.web.server.hdf5.open, thread_count)
+    print "%8s %16.1f %16.1f %8.2f" % (thread_count, global_rate, array_rate, array_rate / global_rate)
+finally:
+  shutil.rmtree(data_store)
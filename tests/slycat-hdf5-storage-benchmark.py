@@ -0,0 +1,68 @@
+# Copyright 2013, Sandia Corporation. Under the terms of Contract
+# DE-AC04-94AL85000 with Sandia Corporation, the U.S. Government retains certain
+# rights in this software.
+
+"""Compare the disk footprint and read latency of arrayset storage policies.
+
+Stores the same repetitive, simulation-like 2D array using each of the
+policies in :data:`slycat.hdf5.storage_policies`, then times the access
+patterns used when serving arrays: ranges of rows, slabs of a few columns, and
+a single value from each of many rows.  Reads are repeated with h5py's default
+chunk cache and with the larger cache used by the web server.  Each
+measurement is the best of several runs, in milliseconds.
+"""
+
+import argparse
+import h5py
+import numpy
+import os
+import shutil
+import slycat.hdf5
+import tempfile
+import time
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--rows", type=int, default=1000000, help="Number of rows in the array.  Default: %(default)s")
+parser.add_argument("--columns", type=int, default=16, help="Number of columns in the array.  Default: %(default)s")
+parser.add_argument("--chunk-cache-size", type=float, default=16, help="Tuned chunk cache size in megabytes.  Default: %(default)s")
+parser.add_argument("--repeat", type=int, default=3, help="Number of times to repeat each read.  Default: %(default)s")
+arguments = parser.parse_args()
+
+directory = tempfile.mkdtemp()
+
+def simulation_data(rows, columns):
+  """Return smooth, quantized values with long runs of repeats, like a typical simulation output."""
+  time = numpy.linspace(0, 10, rows)[:, numpy.newaxis]
+  frequency = numpy.arange(1, columns + 1)[numpy.newaxis, :]
+  return numpy.round(numpy.sin(time * frequency) * 100) / 100
+
+def best(function):
+  times = []
+  for iteration in range(arguments.repeat):
+    start = time.time()
+    function()
+    times.append(time.time() - start)
+  return min(times) * 1000
+
+try:
+  data = simulation_data(arguments.rows, arguments.columns)
+  row_begin = arguments.rows // 3
+  rows = numpy.sort(numpy.random.choice(arguments.rows, 1000, replace=False))
+
+  print "%12s %10s %12s %12s %12s %12s" % ("policy", "size MB", "cache MB", "rows ms", "columns ms", "scatter ms")
+  for name in ["contiguous", "chunked", "lzf", "gzip"]:
+    path = os.path.join(directory, "%s.hdf5" % name)
+    with h5py.File(path, "w") as file:
+      array = slycat.hdf5.start_arrayset(file, name).start_array(0, [{"name":"row", "end":arguments.rows}, {"name":"column", "end":arguments.columns}], [{"name":"value", "type":"float64"}])
+      array.set_data(0, Ellipsis, data)
+    size = os.path.getsize(path) / 1024.0 / 1024.0
+
+    for cache in [1, arguments.chunk_cache_size]:
+      with h5py.File(path, "r", rdcc_nbytes=int(cache * 1024 * 1024), rdcc_nslots=3203) as file:
+        values = file["array/0/attribute/0"]
+        row_range = best(lambda: values[row_begin : row_begin + 10000, :])
+        column_slab = best(lambda: values[:, 2:4])
+        scatter = best(lambda: slycat.hdf5.RowGather(rows).read(values))
+      print "%12s %10.1f %12.1f %12.1f %12.1f %12.1f" % (name, size, cache, row_range, column_slab, scatter)
+finally:
+  shutil.rmtree(directory)
@@ -0,0 +1,72 @@
+# Copyright 2013, Sandia Corporation. Under the terms of Contract
+# DE-AC04-94AL85000 with Sandia Corporation, the U.S. Government retains certain
+# rights in this software.
+
+"""Compare reading arbitrary row sets from table columns using h5py point selection against :class:`slycat.hdf5.RowGather`.
+
+Each request reads the same set of rows from every column, the way the table
+chunk handler does.  The point selection path is the one the handler used
+before: sort the rows, read them with a fancy index, then restore the original
+order with a second argsort.
+"""
+
+import argparse
+import h5py
+import numpy
+import os
+import shutil
+import slycat.hdf5
+import tempfile
+import time
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--columns", type=int, default=8, help="Number of columns.  Default: %(default)s")
+parser.add_argument("--rows", type=int, default=1000000, help="Number of rows.  Default: %(default)s")
+parser.add_argument("--chunk", type=int, default=1000, help="Number of rows read by each request.  Default: %(default)s")
+parser.add_argument("--stride", type=int, default=10, help="Stride between rows in strided requests.  Default: %(default)s")
+parser.add_argument("--repeat", type=int, default=10, help="Number of requests per configuration.  Default: %(default)s")
+arguments = parser.parse_args()
+
+directory = tempfile.mkdtemp()
+
+def point_selection(array, rows):
+  slice_index = numpy.argsort(rows, kind="mergesort")
+  slice_reverse_index = numpy.argsort(slice_index, kind="mergesort")
+  return [array.get_data(column)[rows[slice_index].tolist()][slice_reverse_index] for column in range(arguments.columns)]
+
+def row_gather(array, rows):
+  gather = slycat.hdf5.RowGather(rows)
+  return [gather.read(array.get_data(column)) for column in range(arguments.columns)]
+
+def run(read, array, rows):
+  start = time.time()
+  for iteration in range(arguments.repeat):
+    read(array, rows)
+  return (time.time() - start) / arguments.repeat
+
+try:
+  print "Creating %s rows x %s columns in %s ..." % (arguments.rows, arguments.columns, directory)
+  with h5py.File(os.path.join(directory, "test.hdf5"), "w") as file:
+    arrayset = slycat.hdf5.start_arrayset(file)
+    array = arrayset.start_array(0, [dict(name="row", end=arguments.rows)], [dict(name="c%s" % column, type="float64") for column in range(arguments.columns)])
+    for column in range(arguments.columns):
+      array.set_data(column, slice(0, arguments.rows), numpy.random.random(arguments.rows))
+
+    begin = numpy.random.randint(0, arguments.rows - arguments.chunk * arguments.stride)
+    row_sets = [
+      ("contiguous", numpy.arange(begin, begin + arguments.chunk)),
+      ("strided", numpy.arange(begin, begin + arguments.chunk * arguments.stride, arguments.stride)),
+      ("random", numpy.random.choice(arguments.rows, arguments.chunk, replace=False)),
+      ("sorted", array.get_sort_index(0)[begin : begin + arguments.chunk]),
+      ]
+
+    print
+    print "%12s %8s %16s %16s %8s" % ("rows", "reads", "points ms/req", "gather ms/req", "speedup")
+    for name, rows in row_sets:
+      for expected, actual in zip(point_selection(array, rows), row_gather(array, rows)):
+        numpy.testing.assert_array_equal(expected, actual)
+      point_time = run(point_selection, array, rows)
+      gather_time = run(row_gather, array, rows)
+      print "%12s %8s %16.2f %16.2f %8.2f" % (name, len(slycat.hdf5.RowGather(rows)), point_time * 1000, gather_time * 1000, point_time / gather_time)
+finally:
+  shutil.rmtree(directory)
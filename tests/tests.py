@@ -1,13 +1,25 @@
+import copy
 import h5py
 import nose.tools
 import numpy.testing
+import json
 import os
+import socket
 import tempfile
+import threading
+import time
 
 import slycat.cca
 import slycat.darray
 import slycat.hdf5
 import slycat.table
+import slycat.web.client
+import slycat.web.server
+import slycat.web.server.database.couchdb
+import slycat.web.server.handlers
+import slycat.web.server.hdf5
+import slycat.web.server.remote
+import slycat.web.server.scheduler
 
 ########################################################################################################
 # Helper functions.
@@ -122,8 +134,8 @@ def test_slycat_hdf5_array_basic():
     nose.tools.assert_equal(array.size, 4)
     nose.tools.assert_equal(array.dimensions, [{"name":"i", "type":"int64", "begin":0, "end":4}])
     nose.tools.assert_equal(array.attributes, [{"name":"a", "type":"float64"}, {"name":"b", "type":"string"}])
-    nose.tools.assert_equal(array.get_statistics(0), {"min":0, "max":0})
-    nose.tools.assert_equal(array.get_statistics(1), {"min":"", "max":""})
+    nose.tools.assert_equal(array.get_statistics(0), {"min":0, "max":0, "unique":1})
+    nose.tools.assert_equal(array.get_statistics(1), {"min":"", "max":"", "unique":1})
 
     array = arrayset[1]
     nose.tools.assert_equal(array.ndim, 1)
@@ -131,15 +143,15 @@ def test_slycat_hdf5_array_basic():
     nose.tools.assert_equal(array.size, 4)
     nose.tools.assert_equal(array.dimensions, [{"name":"i", "type":"int64", "begin":0, "end":4}])
     nose.tools.assert_equal(array.attributes, [{"name":"a", "type":"float64"}, {"name":"b", "type":"string"}])
-    nose.tools.assert_equal(array.get_statistics(0), {"min":0, "max":0})
-    nose.tools.assert_equal(array.get_statistics(1), {"min":"", "max":""})
+    nose.tools.assert_equal(array.get_statistics(0), {"min":0, "max":0, "unique":1})
+    nose.tools.assert_equal(array.get_statistics(1), {"min":"", "max":"", "unique":1})
 
     array.set_data(0, slice(0, 4), numpy.arange(2, 6))
     array.set_data(1, slice(0, 4), numpy.array(["foo", "bar", "baz", "blah"]))
-    numpy.testing.assert_array_equal(array.get_data(0), [2, 3, 4, 5])
-    numpy.testing.assert_array_equal(array.get_data(1), ["foo", "bar", "baz", "blah"])
-    nose.tools.assert_equal(array.get_statistics(0), {"min":2, "max":5})
-    nose.tools.assert_equal(array.get_statistics(1), {"min":"bar", "max":"foo"})
+    numpy.testing.assert_array_equal(array.get_data(0)[...], [2, 3, 4, 5])
+    numpy.testing.assert_array_equal(array.get_data(1)[...], ["foo", "bar", "baz", "blah"])
+    nose.tools.assert_equal(array.get_statistics(0), {"min":2, "max":5, "unique":4})
+    nose.tools.assert_equal(array.get_statistics(1), {"min":"bar", "max":"foo", "unique":4})
 
 def test_slycat_hdf5_array_incremental_stats():
   with h5py.File(os.path.join(tempfile.mkdtemp(), "test.hdf5"), "w") as file:
@@ -148,8 +160,8 @@ def test_slycat_hdf5_array_incremental_stats():
 
     array.set_data(0, slice(0, 2), numpy.array([1, 5]))
     array.set_data(0, slice(2, 4), numpy.array([2, 6]))
-    numpy.testing.assert_array_equal(array.get_data(0), [1, 5, 2, 6])
-    nose.tools.assert_equal(array.get_statistics(0), {"min":1, "max":6})
+    numpy.testing.assert_array_equal(array.get_data(0)[...], [1, 5, 2, 6])
+    nose.tools.assert_equal(array.get_statistics(0), {"min":1, "max":6, "unique":4})
 
 def test_slycat_hdf5_array_nan_stats():
   with h5py.File(os.path.join(tempfile.mkdtemp(), "test.hdf5"), "w") as file:
@@ -157,8 +169,8 @@ def test_slycat_hdf5_array_nan_stats():
     array = arrayset.start_array(0, [dict(name="i", end=4)], [dict(name="a", type="float64")])
 
     array.set_data(0, slice(0, 4), numpy.array([1, numpy.nan, 5, 3]))
-    numpy.testing.assert_array_equal(array.get_data(0), [1, numpy.nan, 5, 3])
-    nose.tools.assert_equal(array.get_statistics(0), {"min":1, "max":5})
+    numpy.testing.assert_array_equal(array.get_data(0)[...], [1, numpy.nan, 5, 3])
+    nose.tools.assert_equal(array.get_statistics(0), {"min":1, "max":5, "unique":3})
 
 def test_slycat_hdf5_array_all_nan_stats():
   with h5py.File(os.path.join(tempfile.mkdtemp(), "test.hdf5"), "w") as file:
@@ -166,8 +178,280 @@ def test_slycat_hdf5_array_all_nan_stats():
     array = arrayset.start_array(0, [dict(name="i", end=4)], [dict(name="a", type="float64")])
 
     array.set_data(0, slice(0, 4), numpy.repeat(numpy.nan, 4))
-    numpy.testing.assert_array_equal(array.get_data(0), [numpy.nan, numpy.nan, numpy.nan, numpy.nan])
-    nose.tools.assert_equal(array.get_statistics(0), {"min":None, "max":None})
+    numpy.testing.assert_array_equal(array.get_data(0)[...], [numpy.nan, numpy.nan, numpy.nan, numpy.nan])
+    nose.tools.assert_equal(array.get_statistics(0), {"min":None, "max":None, "unique":None})
+
+def test_slycat_hdf5_array_overlapping_stats():
+  with h5py.File(os.path.join(tempfile.mkdtemp(), "test.hdf5"), "w") as file:
+    arrayset = slycat.hdf5.start_arrayset(file)
+    array = arrayset.start_array(0, [dict(name="i", end=6)], [dict(name="a", type="int64"), dict(name="b", type="string")])
+
+    array.set_data(0, slice(0, 3), numpy.array([7, 3, 5]))
+    array.set_data(1, slice(3, 6), numpy.array(["c", "a", "c"]))
+    nose.tools.assert_in("unique/0", file["array/0"])
+    nose.tools.assert_equal(array.get_statistics(0), {"min":0, "max":7, "unique":4})
+    numpy.testing.assert_array_equal(array.get_unique(1, slice(None))["values"], ["", "a", "c"])
+
+    array.set_data(0, slice(3, 6), numpy.array([9, 3, 1]))
+    array.set_data(1, slice(0, 3), numpy.array(["b", "b", "d"]))
+    nose.tools.assert_equal(array.get_statistics(0), {"min":1, "max":9, "unique":5})
+    numpy.testing.assert_array_equal(array.get_unique(1, slice(None))["values"], ["a", "b", "c", "d"])
+
+    # Overlapping writes discard the statistics, until the cache is updated.
+    array.set_data(0, slice(2, 4), numpy.array([2, 2]))
+    nose.tools.assert_not_in("unique/0", file["array/0"])
+    nose.tools.assert_equal(array.get_statistics(0), {"min":1, "max":7, "unique":4})
+    array.update_cache()
+    numpy.testing.assert_array_equal(array.get_unique(0, slice(None))["values"], [1, 2, 3, 7])
+
+def test_slycat_hdf5_argsort():
+  values = numpy.array([2, numpy.nan, 1, 2, numpy.nan, 3, 1, 2])
+  numpy.testing.assert_array_equal(slycat.hdf5.argsort(values), [2, 6, 0, 3, 7, 5, 1, 4])
+  numpy.testing.assert_array_equal(slycat.hdf5.argsort(values, descending=True), [1, 4, 5, 0, 3, 7, 2, 6])
+  numpy.testing.assert_array_equal(slycat.hdf5.argsort(numpy.array(["b", "a", "b"]), descending=True), [0, 2, 1])
+  numpy.testing.assert_array_equal(slycat.hdf5.argsort(numpy.array([], dtype="float64"), descending=True), [])
+
+def test_slycat_hdf5_array_sort_index():
+  with h5py.File(os.path.join(tempfile.mkdtemp(), "test.hdf5"), "w") as file:
+    arrayset = slycat.hdf5.start_arrayset(file)
+    array = arrayset.start_array(0, [dict(name="i", end=5)], [dict(name="a", type="int64")])
+    array.set_data(0, slice(0, 5), numpy.array([1, 0, 1, 0, 2]))
+    numpy.testing.assert_array_equal(array.get_sort_index(0, descending=True), [4, 0, 2, 1, 3])
+    array.update_cache()
+    nose.tools.assert_in("ties/0", file["array/0"])
+    numpy.testing.assert_array_equal(array.get_sort_index(0), [1, 3, 0, 2, 4])
+    numpy.testing.assert_array_equal(array.get_sort_index(0, descending=True), [4, 0, 2, 1, 3])
+
+    array.set_data(0, slice(0, 5), numpy.array([3, 4, 3, 4, 3]))
+    nose.tools.assert_not_in("index/0", file["array/0"])
+    nose.tools.assert_not_in("ties/0", file["array/0"])
+    numpy.testing.assert_array_equal(array.get_sort_index(0, descending=True), [1, 3, 0, 2, 4])
+
+def test_slycat_hdf5_row_gather():
+  with h5py.File(os.path.join(tempfile.mkdtemp(), "test.hdf5"), "w") as file:
+    arrayset = slycat.hdf5.start_arrayset(file)
+    array = arrayset.start_array(0, [dict(name="i", end=1000)], [dict(name="a", type="int64"), dict(name="b", type="string")])
+    array.set_data(0, slice(0, 1000), numpy.arange(1000) * 2)
+    array.set_data(1, slice(0, 1000), numpy.array(["s%s" % i for i in range(1000)]))
+
+    rows = numpy.array([900, 3, 5, 4, 500, 3, 999, 0, 902, 901])
+    for gap, reads in [(2, 4), (0, 1), (None, 1)]:
+      gather = slycat.hdf5.RowGather(rows, gap=gap)
+      nose.tools.assert_equal(len(gather), reads)
+      numpy.testing.assert_array_equal(gather.read(array.get_data(0)), rows * 2)
+      numpy.testing.assert_array_equal(gather.read(array.get_data(1)), ["s%s" % i for i in rows])
+    nose.tools.assert_equal(len(slycat.hdf5.RowGather(rows, gap=1000)), 1)
+    nose.tools.assert_equal(slycat.hdf5.RowGather([]).read(array.get_data(0)).shape, (0,))
+
+def test_slycat_hdf5_storage_policy():
+  policy = slycat.hdf5.StoragePolicy(chunk_size=8 * 1000)
+  nose.tools.assert_equal(policy.chunks((10000,), "float64"), None)
+  policy = slycat.hdf5.StoragePolicy(chunked=True, chunk_size=8 * 1000)
+  nose.tools.assert_equal(policy.chunks((10000,), "float64"), (625,))
+  nose.tools.assert_equal(policy.chunks((100000, 4), "float64"), (196, 4))
+  nose.tools.assert_equal(policy.chunks((1000, 1000), "float64"), (16, 32))
+  nose.tools.assert_equal(policy.chunks((0, 10), "float64"), None)
+  nose.tools.assert_equal(slycat.hdf5.storage_policy("gzip").options((10,), "float64"), {"chunks":(10,), "compression":"gzip", "compression_opts":4, "shuffle":True})
+  with nose.tools.assert_raises(ValueError):
+    slycat.hdf5.storage_policy("bogus")
+  with nose.tools.assert_raises(ValueError):
+    slycat.hdf5.StoragePolicy(compression="bzip2")
+
+  with h5py.File(os.path.join(tempfile.mkdtemp(), "test.hdf5"), "w") as file:
+    arrayset = slycat.hdf5.start_arrayset(file, "gzip")
+    nose.tools.assert_equal(slycat.hdf5.ArraySet(file).storage, slycat.hdf5.storage_policies["gzip"])
+    array = arrayset.start_array(0, [dict(name="i", end=1000), dict(name="j", end=3)], [dict(name="a", type="float64"), dict(name="b", type="string"), dict(name="c", type="int32")], storage={"c":"contiguous"})
+    nose.tools.assert_equal(file["array/0/attribute/0"].compression, "gzip")
+    nose.tools.assert_equal(file["array/0/attribute/1"].compression, "gzip")
+    nose.tools.assert_equal(file["array/0/attribute/2"].chunks, None)
+    array.set_data(0, Ellipsis, numpy.ones((1000, 3)))
+    array.set_data(1, (slice(0, 1000), 1), numpy.array(["s%s" % i for i in range(1000)]))
+    array.set_data(2, Ellipsis, numpy.arange(3000).reshape((1000, 3)))
+    array.update_cache()
+    numpy.testing.assert_array_equal(array.get_data(0)[10:20, 2], numpy.ones(10))
+    numpy.testing.assert_array_equal(array.get_data(1)[998:, 1], ["s998", "s999"])
+    nose.tools.assert_equal(array.get_statistics(2), {"min":0, "max":2999, "unique":3000})
+
+    # Appended arrays stay chunked along their only dimension.
+    array = arrayset.start_array(1, [dict(name="row", end=0)], [dict(name="a", type="float64")], resizable=True, storage="lzf")
+    array.append([numpy.arange(10.0)])
+    nose.tools.assert_equal(file["array/1/attribute/0"].compression, "lzf")
+    numpy.testing.assert_array_equal(array.get_data(0)[...], numpy.arange(10.0))
+    with nose.tools.assert_raises(ValueError):
+      arrayset.start_array(2, [dict(name="i", end=10)], [dict(name="a", type="float64")], storage={"b":"gzip"})
+
+def test_slycat_hdf5_dictionary_encoding():
+  with h5py.File(os.path.join(tempfile.mkdtemp(), "test.hdf5"), "w") as file:
+    array = slycat.hdf5.start_arrayset(file).start_array(0, [dict(name="i", end=6)], [dict(name="a", type="string"), dict(name="b", type="float64")], storage="dictionary")
+    nose.tools.assert_equal(file["array/0/attribute/0"].dtype, numpy.dtype("int32"))
+    nose.tools.assert_equal(array.get_encoding(1), None)
+    array.set_data(0, slice(0, 3), numpy.array(["b", "a", "b"]))
+    nose.tools.assert_equal(array.get_statistics(0), {"min":"", "max":"b", "unique":3})
+
+    # Adding strings keeps the dictionary sorted, and updates existing codes to match.
+    array.set_data(0, slice(3, 6), numpy.array(["c", "a", "aa"]))
+    codes, dictionary = array.get_encoding(0)
+    numpy.testing.assert_array_equal(dictionary, ["", "a", "aa", "b", "c"])
+    numpy.testing.assert_array_equal(codes[...], [3, 1, 3, 4, 1, 2])
+    numpy.testing.assert_array_equal(array.get_data(0)[...], ["b", "a", "b", "c", "a", "aa"])
+    numpy.testing.assert_array_equal(array.get_data(0)[[1, 5]], ["a", "aa"])
+    nose.tools.assert_equal(array.get_statistics(0), {"min":"a", "max":"c", "unique":4})
+    numpy.testing.assert_array_equal(array.get_unique(0, slice(None))["values"], ["a", "aa", "b", "c"])
+    array.update_cache()
+    numpy.testing.assert_array_equal(array.get_sort_index(0), [1, 4, 5, 0, 2, 3])
+    numpy.testing.assert_array_equal(array.get_sort_index(0, descending=True), [3, 0, 2, 5, 1, 4])
+
+def test_slycat_hdf5_lod():
+  with h5py.File(os.path.join(tempfile.mkdtemp(), "test.hdf5"), "w") as file:
+    array = slycat.hdf5.start_arrayset(file).start_array(0, [dict(name="i", end=8)], [dict(name="x", type="float64"), dict(name="y", type="float64"), dict(name="s", type="string")])
+    array.set_data(0, Ellipsis, numpy.array([0, 1, 2, 3, 4, 5, 6, numpy.nan]))
+    array.set_data(1, Ellipsis, numpy.array([0, 1, 4, 9, 16, 25, 36, 49]))
+    nose.tools.assert_raises(ValueError, array.get_lod, 0, 2)
+
+    # Few enough points are returned as-is, computing the pyramid on-the-fly.
+    summary = array.get_lod(0, 1, viewport=(1, 4, 0, 10))
+    nose.tools.assert_equal(summary["type"], "points")
+    nose.tools.assert_equal(summary["count"], 3)
+    numpy.testing.assert_array_equal(summary["rows"], [1, 2, 3])
+    numpy.testing.assert_array_equal(summary["y"], [1, 4, 9])
+
+    # Otherwise, points are binned at the resolution of the viewport.
+    nose.tools.assert_equal(array.has_lod(0, 1), False)
+    array.update_lod(0, 1)
+    nose.tools.assert_equal(array.has_lod(0, 1), True)
+    summary = array.get_lod(0, 1, resolution=(2, 2), limit=3)
+    nose.tools.assert_equal(summary["type"], "bins")
+    nose.tools.assert_equal(summary["count"], 7)
+    nose.tools.assert_equal(summary["level"], 1)
+    nose.tools.assert_equal((summary["bin-width"], summary["bin-height"]), (3, 18))
+    numpy.testing.assert_array_equal(summary["bins"]["x"], [0, 3, 3])
+    numpy.testing.assert_array_equal(summary["bins"]["y"], [0, 0, 18])
+    numpy.testing.assert_array_equal(summary["bins"]["counts"], [3, 2, 2])
+    numpy.testing.assert_array_equal(summary["bins"]["rows"], [0, 3, 5])
+    numpy.testing.assert_array_equal(summary["bins"]["y-values"], [0, 9, 25])
+
+    # Modifying either attribute discards the pyramid.
+    array.set_data(1, slice(0, 1), numpy.array([1]))
+    nose.tools.assert_equal(array.has_lod(0, 1), False)
+
+def test_slycat_hdf5_histogram():
+  with h5py.File(os.path.join(tempfile.mkdtemp(), "test.hdf5"), "w") as file:
+    array = slycat.hdf5.start_arrayset(file).start_array(0, [dict(name="i", end=8)], [dict(name="a", type="float64"), dict(name="b", type="string")])
+    version = array.version
+    array.set_data(0, Ellipsis, numpy.array([5, 1, numpy.nan, 3, 3, 8, 2, 9]))
+    nose.tools.assert_not_equal(array.version, version)
+    nose.tools.assert_raises(ValueError, array.get_histogram, 1)
+    nose.tools.assert_raises(ValueError, array.get_histogram, 0, 0)
+    nose.tools.assert_raises(ValueError, array.get_histogram, 0, [3, 1])
+
+    # Results are the same whether they're computed from the data or by searching the cached sort index.
+    for cached in [False, True]:
+      if cached:
+        array.update_cache()
+      histogram = array.get_histogram(0, 4)
+      numpy.testing.assert_array_equal(histogram["edges"], [1, 3, 5, 7, 9])
+      numpy.testing.assert_array_equal(histogram["counts"], [2, 2, 1, 2])
+      histogram = array.get_histogram(0, 2, quantiles=True)
+      numpy.testing.assert_array_equal(histogram["edges"], [1, 3, 9])
+      numpy.testing.assert_array_equal(histogram["counts"], [2, 5])
+      numpy.testing.assert_array_equal(array.get_histogram(0, [3, 3])["counts"], [2])
+      numpy.testing.assert_array_equal(array.get_histogram(0, [2, 5, 10])["counts"], [3, 3])
+
+def test_slycat_hdf5_bitmap_index():
+  with h5py.File(os.path.join(tempfile.mkdtemp(), "test.hdf5"), "w") as file:
+    array = slycat.hdf5.start_arrayset(file).start_array(0, [dict(name="i", end=1000)], [dict(name="a", type="float64"), dict(name="b", type="int32"), dict(name="c", type="string"), dict(name="d", type="float64")], storage={"a":"bitmap", "b":"bitmap", "c":"bitmap"})
+    numbers = numpy.random.RandomState(0).normal(size=1000)
+    numbers[::10] = numpy.nan
+    values = [numbers, numpy.arange(1000) % 7, numpy.array(["red", "green", "blue", "yellow"])[numpy.arange(1000) % 4], numbers]
+    for attribute in range(4):
+      array.set_data(attribute, Ellipsis, values[attribute])
+    nose.tools.assert_equal(array.get_bitmap(0, "<", 0), None)
+    array.update_cache()
+    nose.tools.assert_equal(array.get_bitmap(3, "<", 0), None)
+    nose.tools.assert_equal(array.get_bitmap(2, "<", "m"), None)
+    nose.tools.assert_equal(array.get_bitmap(1, "==", "x"), None)
+
+    # Bitmaps match numpy comparisons for binned and per-value indexes, including NaNs and constants outside the range of values.
+    operators = {"<": numpy.less, ">": numpy.greater, "<=": numpy.less_equal, ">=": numpy.greater_equal, "==": lambda a, b: a == b, "!=": lambda a, b: a != b, "in": numpy.in1d, "not in": lambda a, b: numpy.in1d(a, b, invert=True)}
+    comparisons = [(0, operator, constant) for operator in ["<", ">", "<=", ">=", "==", "!="] for constant in [0.5, -10, 10, float(numbers[1]), float(numpy.nanmax(numbers))]]
+    comparisons += [(0, "in", [float(numbers[1]), 0.3]), (0, "not in", [float(numbers[2])])]
+    comparisons += [(1, operator, constant) for operator in ["<", ">", "<=", ">=", "==", "!="] for constant in [-1, 0, 3, 6, 9]]
+    comparisons += [(1, "in", [1, 2]), (1, "not in", [1, 2, 3, 4, 5]), (2, "==", "red"), (2, "!=", "red"), (2, "in", ["red", "blue", "purple"]), (2, "not in", ["red"])]
+    with numpy.errstate(invalid="ignore"):
+      for attribute, operator, constant in comparisons:
+        bitmap = numpy.unpackbits(array.get_bitmap(attribute, operator, constant))[:1000].astype("bool")
+        numpy.testing.assert_array_equal(bitmap, operators[operator](values[attribute], constant))
+
+    # Modifying an attribute discards its index, until the cache is updated.
+    array.set_data(1, slice(0, 1), numpy.array([100]))
+    nose.tools.assert_equal(array.get_bitmap(1, "==", 100), None)
+    array.update_cache()
+    nose.tools.assert_equal(numpy.unpackbits(array.get_bitmap(1, "==", 100))[:1000].sum(), 1)
+
+def test_slycat_hdf5_link_arrayset():
+  directory = tempfile.mkdtemp()
+  with h5py.File(os.path.join(directory, "source.hdf5"), "w") as file:
+    array = slycat.hdf5.start_arrayset(file, "gzip").start_array(0, [dict(name="i", end=4)], [dict(name="a", type="float64"), dict(name="b", type="string")])
+    array.set_data(0, Ellipsis, numpy.array([3, 1, 2, 1]))
+    array.set_data(1, Ellipsis, numpy.array(["a", "b", "c", "d"]))
+    array.update_cache()
+
+  os.mkdir(os.path.join(directory, "copies"))
+  with h5py.File(os.path.join(directory, "source.hdf5"), "r") as source, h5py.File(os.path.join(directory, "copies", "copy.hdf5"), "w") as file:
+    slycat.hdf5.link_arrayset(source, file)
+    nose.tools.assert_is_instance(file.get("array/0/attribute/0", getlink=True), h5py.ExternalLink)
+    nose.tools.assert_equal(slycat.hdf5.ArraySet(file).storage, slycat.hdf5.storage_policies["gzip"])
+
+  # Writing to the copy only copies the modified attribute, and leaves the source alone, even while it's open elsewhere.
+  with h5py.File(os.path.join(directory, "source.hdf5"), "r") as source:
+    with h5py.File(os.path.join(directory, "copies", "copy.hdf5"), "r+") as file:
+      array = slycat.hdf5.ArraySet(file)[0]
+      numpy.testing.assert_array_equal(array.get_sort_index(0), [1, 3, 2, 0])
+      array.set_data(0, slice(0, 2), numpy.array([5, 6]))
+      array.update_cache()
+      nose.tools.assert_not_is_instance(file.get("array/0/attribute/0", getlink=True), h5py.ExternalLink)
+      nose.tools.assert_is_instance(file.get("array/0/attribute/1", getlink=True), h5py.ExternalLink)
+      nose.tools.assert_equal(array.get_statistics(0), {"min":1, "max":6, "unique":4})
+      slycat.hdf5.close_linked_files(file)
+    numpy.testing.assert_array_equal(slycat.hdf5.ArraySet(source)[0].get_data(0)[...], [3, 1, 2, 1])
+
+  # Copies of copies link directly to the file that holds the data.
+  with h5py.File(os.path.join(directory, "copies", "copy.hdf5"), "r") as source, h5py.File(os.path.join(directory, "second.hdf5"), "w") as file:
+    array = slycat.hdf5.link_arrayset(source, file)[0]
+    nose.tools.assert_equal(file.get("array/0/attribute/1", getlink=True).filename, "source.hdf5")
+    numpy.testing.assert_array_equal(array.get_data(0)[...], [5, 6, 2, 1])
+    numpy.testing.assert_array_equal(array.get_data(1)[...], ["a", "b", "c", "d"])
+    slycat.hdf5.close_linked_files(file)
+
+  # Unlinking replaces the links to one file with private copies.
+  with h5py.File(os.path.join(directory, "copies", "copy.hdf5"), "r") as source, h5py.File(os.path.join(directory, "second.hdf5"), "r+") as file:
+    slycat.hdf5.unlink_arrayset(source, file)
+    nose.tools.assert_not_is_instance(file.get("array/0/attribute/0", getlink=True), h5py.ExternalLink)
+    nose.tools.assert_is_instance(file.get("array/0/attribute/1", getlink=True), h5py.ExternalLink)
+    numpy.testing.assert_array_equal(slycat.hdf5.ArraySet(file)[0].get_data(0)[...], [5, 6, 2, 1])
+    slycat.hdf5.close_linked_files(file)
+
+def test_slycat_hdf5_array_read_only_cache():
+  path = os.path.join(tempfile.mkdtemp(), "test.hdf5")
+  with h5py.File(path, "w") as file:
+    arrayset = slycat.hdf5.start_arrayset(file)
+    array = arrayset.start_array(0, [dict(name="i", end=4)], [dict(name="a", type="float64"), dict(name="b", type="float64")])
+    array.set_data(0, slice(0, 4), numpy.array([3, 1, 2, 1]))
+    array.set_data(1, slice(0, 4), numpy.array([4, 3, 2, 1]))
+    array.update_cache(0)
+
+  with h5py.File(path, "r") as file:
+    array = slycat.hdf5.ArraySet(file)[0]
+    nose.tools.assert_equal(array.get_statistics(0), {"min":1, "max":3, "unique":3})
+    numpy.testing.assert_array_equal(array.get_unique(0, slice(None))["values"], [1, 2, 3])
+    numpy.testing.assert_array_equal(array.get_sort_index(0), [1, 3, 2, 0])
+    nose.tools.assert_in("index/0", file["array/0"])
+
+    # Uncached attributes are computed without modifying the file.
+    nose.tools.assert_equal(array.get_statistics(1), {"min":1, "max":4, "unique":4})
+    numpy.testing.assert_array_equal(array.get_unique(1, slice(1, 3))["values"], [2, 3])
+    numpy.testing.assert_array_equal(array.get_sort_index(1), [3, 2, 1, 0])
+    nose.tools.assert_not_in("index/1", file["array/0"])
 
 ########################################################################################################
 # slycat.table tests
@@ -222,3 +506,850 @@ def test_slycat_table_parse_cars():
     {"name":"Year", "type":"float64"},
     {"name":"Origin", "type":"float64"},
     ])
+
+def test_slycat_table_store():
+  import StringIO
+  rows = ["a,b,c,d"] + ["%s,%s,s%s,%s" % (i, i * 2, i, ["x", "y", "z"][i % 3]) for i in range(1000)] + ["1000,two thousand,s1000,new", "", "1001,2002,s1001,x"]
+  with h5py.File(os.path.join(tempfile.mkdtemp(), "test.hdf5"), "w") as file:
+    array = slycat.table.store(StringIO.StringIO("\r\n".join(rows)), slycat.hdf5.start_arrayset(file), 0, block_size=997, sample_size=100)
+    nose.tools.assert_equal(array.shape, (1002,))
+    nose.tools.assert_equal(array.attributes, [{"name":"a", "type":"float64"}, {"name":"b", "type":"string"}, {"name":"c", "type":"string"}, {"name":"d", "type":"string"}])
+    nose.tools.assert_equal([array.get_encoding(attribute) is not None for attribute in range(4)], [False, False, False, True])
+    numpy.testing.assert_array_equal(array.get_data(3)[997:], ["y", "z", "x", "new", "x"])
+    nose.tools.assert_equal(array.get_statistics(3), {"min": "new", "max": "z", "unique": 4})
+    numpy.testing.assert_array_equal(array.get_data(0)[...], numpy.arange(1002))
+    numpy.testing.assert_array_equal(array.get_data(1)[998:], ["1996", "1998", "two thousand", "2002"])
+    numpy.testing.assert_array_equal(array.get_data(2)[1000:], ["s1000", "s1001"])
+    nose.tools.assert_equal(array.get_statistics(0), {"min": 0, "max": 1001, "unique": 1002})
+    numpy.testing.assert_array_equal(array.get_sort_index(1)[:3], [0, 5, 50])
+
+  with nose.tools.assert_raises_regexp(ValueError, "consistent comma or tab field delimiters"):
+    with h5py.File(os.path.join(tempfile.mkdtemp(), "test.hdf5"), "w") as file:
+      slycat.table.store(StringIO.StringIO("a,b\n1,2\n3,4,5\n"), slycat.hdf5.start_arrayset(file), 0, block_size=4, sample_size=1)
+
+def test_slycat_table_store_new_categories():
+  import StringIO
+  values = ["c%s" % (i % 10) for i in range(100)] + ["u%s" % i for i in range(1500)]
+  with h5py.File(os.path.join(tempfile.mkdtemp(), "test.hdf5"), "w") as file:
+    array = slycat.table.store(StringIO.StringIO("\n".join(["a,b"] + ["%s,%s" % item for item in enumerate(values)])), slycat.hdf5.start_arrayset(file), 0, block_size=512, sample_size=100)
+    nose.tools.assert_equal(array.get_encoding(1), None)
+    numpy.testing.assert_array_equal(array.get_data(1)[...], values)
+    nose.tools.assert_equal(array.get_statistics(1), {"min": "c0", "max": "u999", "unique": 1510})
+    numpy.testing.assert_array_equal(array.get_sort_index(1)[:2], [0, 10])
+
+def test_slycat_table_store_remote_file():
+  import StringIO
+  class LocalSFTPFile(StringIO.StringIO):
+    def stat(self):
+      return os.stat_result((0, 0, 0, 0, 0, 0, self.len, 0, 0, 0))
+    def readv(self, chunks):
+      for offset, size in chunks:
+        self.seek(offset)
+        yield self.read(size)
+    def __enter__(self):
+      return self
+    def __exit__(self, *args):
+      self.close()
+  class LocalSFTP(object):
+    def file(self, path, mode="r"):
+      return LocalSFTPFile(content)
+
+  rows = ["a,b"] + ["%s,%s" % (i, i * 2) for i in range(1000)] + ["1000,two thousand"]
+  content = "\n".join(rows)
+  session = slycat.web.server.remote.Session(None, "user", "localhost", None, LocalSFTP())
+  progress = []
+  with slycat.web.server.remote.RemoteFile(session, "/table.csv", block_size=101, read_ahead=2, progress=lambda count, size: progress.append((count, size))) as remote_file:
+    nose.tools.assert_equal(remote_file.size, len(content))
+    with h5py.File(os.path.join(tempfile.mkdtemp(), "test.hdf5"), "w") as file:
+      array = slycat.table.store(remote_file, slycat.hdf5.start_arrayset(file), 0, block_size=997, sample_size=100)
+      nose.tools.assert_equal(array.shape, (1001,))
+      nose.tools.assert_equal(array.attributes, [{"name":"a", "type":"float64"}, {"name":"b", "type":"string"}])
+      numpy.testing.assert_array_equal(array.get_data(1)[999:], ["1998", "two thousand"])
+    nose.tools.assert_false(session._lock.locked())
+  nose.tools.assert_equal(progress[-1], (len(content), len(content)))
+
+########################################################################################################
+# slycat.web.server.hdf5 tests
+
+def test_slycat_web_server_hdf5_shared_locks():
+  locks = slycat.web.server.hdf5.LockManager()
+  acquired = threading.Event()
+  def reader():
+    with locks.shared("a"):
+      acquired.set()
+  with locks.shared("a"):
+    thread = threading.Thread(target=reader)
+    thread.start()
+    nose.tools.assert_true(acquired.wait(5))
+    thread.join()
+  nose.tools.assert_equal(len(locks), 0)
+
+def test_slycat_web_server_hdf5_exclusive_locks():
+  locks = slycat.web.server.hdf5.LockManager()
+  acquired = threading.Event()
+  def reader(array):
+    with locks.shared(array):
+      acquired.set()
+  with locks.exclusive("a"):
+    with locks.shared("a"):
+      pass
+    thread = threading.Thread(target=reader, args=("a",))
+    thread.start()
+    nose.tools.assert_false(acquired.wait(0.1))
+    other = threading.Thread(target=reader, args=("b",))
+    other.start()
+    other.join()
+    nose.tools.assert_true(acquired.is_set())
+    acquired.clear()
+  thread.join()
+  nose.tools.assert_true(acquired.is_set())
+  nose.tools.assert_equal(len(locks), 0)
+
+def test_slycat_web_server_hdf5_lock_upgrade():
+  locks = slycat.web.server.hdf5.LockManager()
+  with locks.shared("a"):
+    with nose.tools.assert_raises_regexp(RuntimeError, "Cannot upgrade a read lock to a write lock."):
+      with locks.exclusive("a"):
+        pass
+
+def test_slycat_web_server_hdf5_file_cache():
+  slycat.web.server.hdf5.path.root = tempfile.mkdtemp()
+  for array in ["aaaaaa", "bbbbbb"]:
+    with slycat.web.server.hdf5.create(array) as file:
+      slycat.hdf5.start_arrayset(file).start_array(0, [dict(name="i", end=4)], [dict(name="a", type="float64")])
+
+  files = slycat.web.server.hdf5.FileCache(capacity=1)
+  with files.open("aaaaaa") as file:
+    nose.tools.assert_equal(file.mode, "r")
+  with files.open("aaaaaa") as second:
+    nose.tools.assert_is(second, file)
+  nose.tools.assert_equal(len(files), 1)
+
+  # Evicting a handle that's still in use mustn't close it out from under its user.
+  with files.open("aaaaaa") as file:
+    with files.open("bbbbbb"):
+      nose.tools.assert_equal(files.evictions, 1)
+    nose.tools.assert_equal(slycat.hdf5.ArraySet(file)[0].shape, (4,))
+  nose.tools.assert_false(file.id.valid)
+
+  files.invalidate("aaaaaa")
+  files.invalidate("bbbbbb")
+  nose.tools.assert_equal(len(files), 0)
+  nose.tools.assert_equal(files.statistics(), {"size":0, "capacity":1, "hits":2, "misses":2, "evictions":1, "invalidations":1})
+
+def test_slycat_web_server_hdf5_open_invalidates_cache():
+  slycat.web.server.hdf5.path.root = tempfile.mkdtemp()
+  with slycat.web.server.hdf5.create("cccccc") as file:
+    slycat.hdf5.start_arrayset(file).start_array(0, [dict(name="i", end=4)], [dict(name="a", type="float64")])
+
+  with slycat.web.server.hdf5.open("cccccc") as file:
+    pass
+  nose.tools.assert_true(file.id.valid)
+  with slycat.web.server.hdf5.open("cccccc", "r+") as writer:
+    nose.tools.assert_false(file.id.valid)
+    slycat.hdf5.ArraySet(writer)[0].set_data(0, slice(0, 4), numpy.arange(4))
+  with slycat.web.server.hdf5.open("cccccc") as file:
+    numpy.testing.assert_array_equal(slycat.hdf5.ArraySet(file)[0].get_data(0)[...], [0, 1, 2, 3])
+  slycat.web.server.hdf5.delete("cccccc")
+  nose.tools.assert_false(file.id.valid)
+
+def test_slycat_web_server_hdf5_link():
+  slycat.web.server.hdf5.path.root = tempfile.mkdtemp()
+  with slycat.web.server.hdf5.create("dddddd") as file:
+    array = slycat.hdf5.start_arrayset(file).start_array(0, [dict(name="i", end=4)], [dict(name="a", type="float64"), dict(name="b", type="float64")])
+    array.set_data(0, Ellipsis, numpy.arange(4))
+    array.set_data(1, Ellipsis, numpy.arange(4))
+    array.update_cache()
+
+  nose.tools.assert_equal(slycat.web.server.hdf5.link("dddddd", "eeeeee"), ["dddddd"])
+  nose.tools.assert_equal(slycat.web.server.hdf5.link("eeeeee", "ffffff"), ["eeeeee", "dddddd"])
+  nose.tools.assert_less(os.path.getsize(slycat.web.server.hdf5.path("eeeeee")), os.path.getsize(slycat.web.server.hdf5.path("dddddd")))
+
+  # Opening a copy holds shared locks on the arrays it links to, and the source can stay open in the file cache.
+  with slycat.web.server.hdf5.open("dddddd") as source:
+    with slycat.web.server.hdf5.open("eeeeee", "r+") as file:
+      nose.tools.assert_in("dddddd", slycat.web.server.hdf5.locks._locks)
+      slycat.hdf5.ArraySet(file)[0].set_data(1, slice(0, 2), numpy.array([9, 9]))
+    numpy.testing.assert_array_equal(slycat.hdf5.ArraySet(source)[0].get_data(1)[...], [0, 1, 2, 3])
+  with slycat.web.server.hdf5.open("eeeeee") as file:
+    numpy.testing.assert_array_equal(slycat.hdf5.ArraySet(file)[0].get_data(1)[...], [9, 9, 2, 3])
+  with slycat.web.server.hdf5.open("ffffff") as file:
+    numpy.testing.assert_array_equal(slycat.hdf5.ArraySet(file)[0].get_data(0)[...], [0, 1, 2, 3])
+    numpy.testing.assert_array_equal(slycat.hdf5.ArraySet(file)[0].get_data(1)[...], [0, 1, 2, 3])
+
+  # Copies get their own versions, and open each shared file once.
+  with slycat.web.server.hdf5.open("dddddd") as source:
+    with slycat.web.server.hdf5.open("ffffff") as file:
+      nose.tools.assert_not_equal(slycat.hdf5.ArraySet(file).version, slycat.hdf5.ArraySet(source).version)
+  with slycat.web.server.hdf5.open("ffffff", "r+") as file:
+    array = slycat.hdf5.ArraySet(file)[0]
+    nose.tools.assert_equal(array._dataset("attribute/0").file.id, array._dataset("attribute/1").file.id)
+  nose.tools.assert_equal(slycat.hdf5._linked_files, {})
+
+  # Writing to the source gives the arrays that share its data private copies first.
+  with slycat.web.server.hdf5.open("dddddd", "r+") as file:
+    nose.tools.assert_equal(file.attrs.get("linked-by", []).tolist(), [])
+    array = slycat.hdf5.ArraySet(file)[0]
+    array.set_data(0, Ellipsis, numpy.array([5, 6, 7, 8]))
+    array.update_cache()
+  for copy in ["eeeeee", "ffffff"]:
+    with slycat.web.server.hdf5.open(copy) as file:
+      array = slycat.hdf5.ArraySet(file)[0]
+      numpy.testing.assert_array_equal(array.get_data(0)[...], [0, 1, 2, 3])
+      numpy.testing.assert_array_equal(array.get_sort_index(0), [0, 1, 2, 3])
+      nose.tools.assert_not_in("dddddd", file.attrs["linked-arrays"].tolist())
+
+  # Deleting a copy removes it from the arrays it shared data with.
+  slycat.web.server.hdf5.delete("ffffff")
+  with slycat.web.server.hdf5.open("eeeeee") as file:
+    nose.tools.assert_equal(file.attrs["linked-by"].tolist(), [])
+
+def test_slycat_web_server_arrayset_histograms():
+  slycat.web.server.hdf5.path.root = tempfile.mkdtemp()
+  with slycat.web.server.hdf5.create("hhhhhh") as file:
+    array = slycat.hdf5.start_arrayset(file).start_array(0, [dict(name="i", end=6)], [dict(name="a", type="float64"), dict(name="b", type="float64")])
+    array.set_data(0, Ellipsis, numpy.array([0, 1, 2, 3, 4, 5]))
+    array.set_data(1, Ellipsis, numpy.array([1, 1, 1, 0, 0, 0]))
+    array.update_cache()
+
+  model = {"artifact:data": "hhhhhh"}
+  results = slycat.web.server.get_model_arrayset_metadata(None, model, "data", histograms="0/0;0/0/3:;0/index(0)/1:", bins=2)
+  nose.tools.assert_equal([histogram["attribute"] for histogram in results["histograms"][:2]], [0, 0])
+  nose.tools.assert_not_in("attribute", results["histograms"][2])
+  numpy.testing.assert_array_equal(results["histograms"][0]["counts"], [3, 3])
+  numpy.testing.assert_array_equal(results["histograms"][1]["edges"], [3, 4, 5])
+  numpy.testing.assert_array_equal(results["histograms"][2]["edges"], [1, 3, 5])
+  numpy.testing.assert_array_equal(results["histograms"][2]["counts"], [2, 3])
+
+  # Cached histograms are used until the array is modified.
+  hits = slycat.web.server.histogram_cache.hits
+  slycat.web.server.get_model_arrayset_metadata(None, model, "data", histograms="0/0/3:", bins=2)
+  nose.tools.assert_equal(slycat.web.server.histogram_cache.hits, hits + 1)
+  with slycat.web.server.hdf5.open("hhhhhh", "r+") as file:
+    slycat.hdf5.ArraySet(file)[0].set_data(0, slice(3, 6), numpy.array([6, 6, 6]))
+  results = slycat.web.server.get_model_arrayset_metadata(None, model, "data", histograms="0/0/3:", bins=2)
+  nose.tools.assert_equal(slycat.web.server.histogram_cache.hits, hits + 1)
+  numpy.testing.assert_array_equal(results["histograms"][0]["counts"], [0, 3])
+
+def test_slycat_web_server_array_lod():
+  slycat.web.server.hdf5.path.root = tempfile.mkdtemp()
+  with slycat.web.server.hdf5.create("llllll") as file:
+    array = slycat.hdf5.start_arrayset(file).start_array(0, [dict(name="i", end=8)], [dict(name="x", type="float64"), dict(name="y", type="float64")])
+    array.set_data(0, Ellipsis, numpy.arange(8.0))
+    array.set_data(1, Ellipsis, numpy.arange(8.0) ** 2)
+
+  jobs = []
+  submit = slycat.web.server.scheduler.submit
+  slycat.web.server.scheduler.submit = lambda function, args, **kwargs: jobs.append((function, args))
+  try:
+    # The first request is answered without writing to the artifact, and queues a single job to store the pyramid.
+    model = {"_id": "model", "artifact:data": "llllll"}
+    for i in range(2):
+      summary = slycat.web.server.get_model_array_lod(None, model, "data", 0, 0, 1, resolution=(2, 2), limit=3)
+      nose.tools.assert_equal((summary["type"], summary["count"]), ("bins", 8))
+    nose.tools.assert_equal(len(jobs), 1)
+    with slycat.web.server.hdf5.open("llllll") as file:
+      nose.tools.assert_false(slycat.hdf5.ArraySet(file)[0].has_lod(0, 1))
+
+    function, args = jobs.pop()
+    function(*args)
+    with slycat.web.server.hdf5.open("llllll") as file:
+      nose.tools.assert_true(slycat.hdf5.ArraySet(file)[0].has_lod(0, 1))
+    stored = slycat.web.server.get_model_array_lod(None, model, "data", 0, 0, 1, resolution=(2, 2), limit=3)
+    numpy.testing.assert_array_equal(stored["bins"]["counts"], summary["bins"]["counts"])
+    nose.tools.assert_equal(jobs, [])
+  finally:
+    slycat.web.server.scheduler.submit = submit
+
+def test_slycat_web_server_arrayset_versions():
+  import cherrypy
+  slycat.web.server.hdf5.path.root = tempfile.mkdtemp()
+  with slycat.web.server.hdf5.create("vvvvvv") as file:
+    arrayset = slycat.hdf5.start_arrayset(file)
+    version = arrayset.version
+    array = arrayset.start_array(0, [dict(name="i", end=3)], [dict(name="a", type="float64")])
+    nose.tools.assert_not_equal(arrayset.version, version)
+    version = arrayset.version
+    array.set_data(0, Ellipsis, numpy.array([0, 1, 2]))
+    nose.tools.assert_not_equal(arrayset.version, version)
+    nose.tools.assert_equal(arrayset.version, array.version)
+    version = arrayset.version
+
+  # Versions are only cached for finished models.
+  versions = slycat.web.server.ArraysetVersions()
+  model = {"artifact:data": "vvvvvv", "state": "running"}
+  nose.tools.assert_equal(versions.get(None, model, "data"), version)
+  nose.tools.assert_equal(len(versions), 0)
+  model["state"] = "finished"
+  nose.tools.assert_equal(versions.get(None, model, "data"), version)
+  nose.tools.assert_equal(versions.get(None, model, "data"), version)
+  nose.tools.assert_equal(versions.statistics()["hits"], 1)
+  versions.discard("vvvvvv")
+  nose.tools.assert_equal(len(versions), 0)
+
+  def request(etag=None):
+    cherrypy.serving.request = cherrypy._cprequest.Request(cherrypy.lib.httputil.Host("127.0.0.1", 80), cherrypy.lib.httputil.Host("127.0.0.1", 8092))
+    cherrypy.serving.request.path_info = "/models/m/arraysets/data/data"
+    cherrypy.serving.request.query_string = "hyperchunks=0/0/..."
+    cherrypy.serving.request.headers = cherrypy.lib.httputil.HeaderMap()
+    if etag is not None:
+      cherrypy.serving.request.headers["If-None-Match"] = etag
+    cherrypy.serving.response = cherrypy._cprequest.Response()
+    slycat.web.server.handlers.check_artifact_etag(None, model, "data")
+    return cherrypy.serving.response.headers
+
+  headers = request()
+  nose.tools.assert_equal(headers["cache-control"], "private, no-cache")
+  with nose.tools.assert_raises(cherrypy.HTTPRedirect) as context:
+    request(headers["etag"])
+  nose.tools.assert_equal(context.exception.status, 304)
+
+  # Modifying the arrayset changes the tag.
+  with slycat.web.server.hdf5.open("vvvvvv", "r+") as file:
+    slycat.hdf5.ArraySet(file)[0].set_data(0, Ellipsis, numpy.array([3, 4, 5]))
+  slycat.web.server.arrayset_versions.discard("vvvvvv")
+  model["state"] = "running"
+  nose.tools.assert_not_equal(request(headers["etag"])["etag"], headers["etag"])
+
+########################################################################################################
+# slycat.web.server.database.couchdb tests
+
+def test_slycat_web_server_array_collector():
+  import collections
+  import slycat.web.server.cleanup
+  Row = collections.namedtuple("Row", ["id", "key", "value"])
+  class Database(object):
+    def __init__(self):
+      self.documents = {}
+      self.log = []
+      self.deletions = 0
+    def save(self, document):
+      document["_rev"] = "%s" % (len(self.log) + 1)
+      self.documents[document["_id"]] = document
+      self.log.append(document["_id"])
+    def info(self):
+      return {"update_seq": len(self.log)}
+    def changes(self, since, include_docs, limit):
+      results = [{"id": id, "seq": seq + 1, "doc": self.documents.get(id, {}), "deleted": id not in self.documents} for seq, id in enumerate(self.log) if seq >= since][:limit]
+      return {"results": results, "last_seq": results[-1]["seq"] if results else since}
+    def view(self, name, keys=None, reduce=True, group=False):
+      if name == "_all_docs":
+        return [Row(key, key, {"rev": self.documents[key]["_rev"]} if key in self.documents else None) for key in keys]
+      rows = []
+      for document in self.documents.values():
+        if document["type"] == "hdf5":
+          rows.append(Row(document["_id"], document["_id"], 0))
+          rows += [Row(document["_id"], link, 1) for link in document.get("links", [])]
+        elif document["type"] == "model":
+          rows += [Row(document["_id"], document["artifact:%s" % name], 1) for name, type in document["artifact-types"].items() if type == "hdf5"]
+      if reduce is False:
+        return rows
+      counts = {}
+      for row in rows:
+        counts[row.key] = counts.get(row.key, 0) + row.value
+      return [Row(None, key, counts[key]) for key in sorted(counts) if keys is None or key in keys]
+    def update(self, documents):
+      for document in documents:
+        nose.tools.assert_equal(document["_rev"], self.documents[document["_id"]]["_rev"])
+        del self.documents[document["_id"]]
+        self.log.append(document["_id"])
+        self.deletions += 1
+
+  slycat.web.server.hdf5.path.root = tempfile.mkdtemp()
+  database = Database()
+  for array in ["aaaaaa", "bbbbbb", "cccccc", "dddddd"]:
+    with slycat.web.server.hdf5.create(array) as file:
+      slycat.hdf5.start_arrayset(file).start_array(0, [dict(name="i", end=4)], [dict(name="a", type="float64")])
+    database.save({"_id": array, "type": "hdf5"})
+  database.save({"_id": "m1", "type": "model", "artifact-types": {"x": "hdf5", "y": "json"}, "artifact:x": "aaaaaa", "artifact:y": 5})
+  database.save({"_id": "m2", "type": "model", "artifact-types": {"x": "hdf5", "z": "hdf5"}, "artifact:x": "aaaaaa", "artifact:z": "bbbbbb"})
+  database.save({"_id": "m3", "type": "model", "artifact-types": {"x": "hdf5"}, "artifact:x": "cccccc"})
+
+  # The first run scans everything, and deletes the array that was never referenced.
+  collector = slycat.web.server.cleanup.ArrayCollector(batch_size=2, threads=2)
+  run = collector.collect(database)
+  nose.tools.assert_equal((run["mode"], run["checked"], run["arrays"]), ("scan", 1, 1))
+  nose.tools.assert_greater(run["bytes"], 0)
+  nose.tools.assert_false(os.path.exists(slycat.web.server.hdf5.path("dddddd")))
+  nose.tools.assert_not_in("dddddd", database.documents)
+
+  # Later runs only check arrays that lost a reference: one shared with another model, one no longer used, and one whose model was deleted.
+  del database.documents["m2"]
+  database.log.append("m2")
+  model = database.documents["m3"]
+  model["artifact:x"] = "bbbbbb"
+  database.save(model)
+  run = collector.collect(database)
+  nose.tools.assert_equal((run["mode"], run["checked"], run["arrays"]), ("update", 3, 1))
+  nose.tools.assert_equal(sorted(database.documents), ["aaaaaa", "bbbbbb", "m1", "m3"])
+  nose.tools.assert_false(os.path.exists(slycat.web.server.hdf5.path("cccccc")))
+  nose.tools.assert_true(os.path.exists(slycat.web.server.hdf5.path("aaaaaa")))
+
+  # A run with nothing to do doesn't touch the database.
+  run = collector.collect(database)
+  nose.tools.assert_equal((run["mode"], run["checked"], run["arrays"]), ("update", 0, 0))
+  nose.tools.assert_equal(database.deletions, 2)
+  nose.tools.assert_equal(collector.statistics()["arrays"], 2)
+  nose.tools.assert_equal(collector.statistics()["runs"], 3)
+
+  # Arrays that share data with a copy are kept until the copy is deleted.
+  database.save({"_id": "eeeeee", "type": "hdf5", "links": ["bbbbbb"]})
+  database.save({"_id": "m4", "type": "model", "artifact-types": {"x": "hdf5"}, "artifact:x": "eeeeee"})
+  del database.documents["m3"]
+  database.log.append("m3")
+  nose.tools.assert_equal(collector.collect(database)["arrays"], 0)
+  del database.documents["m4"]
+  database.log.append("m4")
+  nose.tools.assert_equal(collector.collect(database)["arrays"], 2)
+  nose.tools.assert_equal(collector.collect(database)["arrays"], 0)
+  nose.tools.assert_equal(sorted(database.documents), ["aaaaaa", "m1"])
+
+def test_slycat_web_server_couchdb_document_cache():
+  class Database(object):
+    def __init__(self):
+      self.documents = {"m1": {"_id": "m1", "_rev": "1-a", "type": "model", "name": "one"}}
+      self.loads = 0
+      self.changes_feed = []
+    def load(self, id):
+      self.loads += 1
+      return copy.deepcopy(self.documents[id])
+    def info(self):
+      return {"update_seq": 7}
+    def changes(self, **keywords):
+      nose.tools.assert_equal(keywords["since"], 7)
+      for change in self.changes_feed:
+        nose.tools.assert_equal(cache.get("m1", database.load)["name"], "one")
+        yield change
+
+  database = Database()
+  cache = slycat.web.server.database.couchdb.DocumentCache(ttl=60)
+
+  # Nothing is cached until the changes feed is being followed.
+  cache.get("m1", database.load)
+  nose.tools.assert_equal(len(cache), 0)
+
+  database.changes_feed = [
+    {"seq": 8, "id": "m2", "changes": [{"rev": "1-b"}]},
+    {"seq": 9, "id": "m1", "changes": [{"rev": "1-a"}]},
+    ]
+  cache.follow(database)
+  nose.tools.assert_equal(database.loads, 2)
+  nose.tools.assert_equal(cache.statistics()["hits"], 1)
+  nose.tools.assert_equal(cache.last_seq, 9)
+  nose.tools.assert_equal(len(cache), 0)
+
+  # Copies are returned, and a newer revision in the feed invalidates the cached document.
+  def changes(**keywords):
+    model = cache.get("m1", database.load)
+    model["name"] = "modified"
+    nose.tools.assert_equal(cache.get("m1", database.load)["name"], "one")
+    database.documents["m1"] = {"_id": "m1", "_rev": "2-c", "type": "model", "name": "two"}
+    yield {"seq": 10, "id": "m1", "changes": [{"rev": "2-c"}]}
+    nose.tools.assert_equal(cache.get("m1", database.load)["name"], "two")
+    yield {"last_seq": 10}
+  database.changes = changes
+  cache.follow(database)
+  nose.tools.assert_equal(cache.last_seq, 10)
+  nose.tools.assert_equal(cache.statistics()["invalidations"], 1)
+
+def test_slycat_web_server_couchdb_connection_pool():
+  class Connection(object):
+    def __init__(self):
+      self.closed = False
+    def close(self):
+      self.closed = True
+
+  pool = slycat.web.server.database.couchdb.ConnectionPool(size=1, timeout=0.1)
+  connection = Connection()
+  pool.release("http://localhost:5984/slycat", connection)
+  nose.tools.assert_is(pool.get("http://localhost:5984/slycat/mid"), connection)
+  pool.release("http://localhost:5984/slycat/mid", connection)
+  pool.clear()
+  nose.tools.assert_true(connection.closed)
+
+  errors = []
+  def request():
+    try:
+      with pool.reserve():
+        pass
+    except Exception as e:
+      errors.append(e)
+
+  with pool.reserve():
+    with pool.reserve():
+      nose.tools.assert_equal(pool.statistics()["active"], 1)
+    thread = threading.Thread(target=request)
+    thread.start()
+    thread.join()
+  nose.tools.assert_equal(len(errors), 1)
+  nose.tools.assert_equal(errors[0].code, 503)
+  request()
+  nose.tools.assert_equal(len(errors), 1)
+
+  statistics = pool.statistics()
+  nose.tools.assert_equal(statistics["requests"], 3)
+  nose.tools.assert_equal(statistics["waits"], 1)
+  nose.tools.assert_equal(statistics["reuses"], 1)
+  nose.tools.assert_equal(statistics["active"], 0)
+
+def test_slycat_web_server_couchdb_log_status():
+  class Database(object):
+    def info(self):
+      raise socket.error("Connection refused.")
+
+  database = slycat.web.server.database.couchdb._client.database
+  slycat.web.server.database.couchdb._client.database = Database()
+  slycat.web.server.database.couchdb.pool.healthy = False
+  try:
+    status = slycat.web.server.database.couchdb.log_status()
+    nose.tools.assert_false(status["healthy"])
+    nose.tools.assert_equal(status["pool"]["size"], slycat.web.server.database.couchdb.pool.size)
+    nose.tools.assert_in("hits", status["cache"])
+  finally:
+    slycat.web.server.database.couchdb._client.database = database
+    slycat.web.server.database.couchdb.pool.healthy = True
+
+########################################################################################################
+# slycat.web.server.scheduler tests
+
+def test_slycat_web_server_scheduler():
+  scheduler = slycat.web.server.scheduler.Scheduler(threads=1, processes=1)
+  order = []
+  started = threading.Event()
+  release = threading.Event()
+  def block():
+    started.set()
+    release.wait()
+  def work(name):
+    order.append(name)
+    return scheduler.compute(numpy.sum, numpy.arange(10))
+
+  blocker = scheduler.submit(block)
+  started.wait()
+  low = scheduler.submit(work, args=("low",), priority=-1)
+  high = scheduler.submit(work, args=("high",), priority=1)
+  normal = scheduler.submit(work, kwargs={"name": "normal"}, key="model")
+  nose.tools.assert_equal(scheduler.statistics()["queued"], 3)
+  nose.tools.assert_equal(scheduler.cancel("model"), 1)
+  release.set()
+  for job in [blocker, low, high, normal]:
+    nose.tools.assert_true(job.wait(10))
+
+  nose.tools.assert_equal(order, ["high", "low"])
+  nose.tools.assert_equal([job.result for job in [blocker, low, high, normal]], ["succeeded", "succeeded", "succeeded", "cancelled"])
+  nose.tools.assert_equal(high.status()["usage"]["processes"], 1)
+  nose.tools.assert_equal(scheduler.statistics()["cancelled"], 1)
+
+def test_slycat_web_server_scheduler_cancel_running():
+  scheduler = slycat.web.server.scheduler.Scheduler(threads=1, processes=1)
+  job = scheduler.submit(lambda: scheduler.compute(time.sleep, 30), key="model")
+  while scheduler.statistics()["active-processes"] == 0:
+    time.sleep(0.01)
+  scheduler.cancel("model")
+  nose.tools.assert_true(job.wait(10))
+  nose.tools.assert_equal(job.result, "cancelled")
+  nose.tools.assert_equal(scheduler.statistics()["active-processes"], 0)
+
+  failed = scheduler.submit(lambda: scheduler.compute(int, "not a number"))
+  nose.tools.assert_true(failed.wait(10))
+  nose.tools.assert_equal(failed.result, "failed")
+  nose.tools.assert_in("ValueError", failed.message)
+
+########################################################################################################
+# slycat.web.server tests
+
+def test_slycat_web_server_model_updates():
+  import couchdb.http
+  class Database(object):
+    def __init__(self, document):
+      self.document = document
+      self.saves = 0
+    def __getitem__(self, id):
+      return copy.deepcopy(self.document)
+    def save(self, document):
+      if document["_rev"] != self.document["_rev"]:
+        raise couchdb.http.ResourceConflict()
+      self.saves += 1
+      document["_rev"] += 1
+      self.document = copy.deepcopy(document)
+
+  database = Database({"_id": "m", "_rev": 1, "state": "running", "progress": 0.0, "artifact-types": {}, "input-artifacts": []})
+  updates = slycat.web.server.ModelUpdates(interval=60)
+  model = database["m"]
+  updates.update(database, model, {"progress": 0.1})
+  for progress in [0.2, 0.3, 0.4]:
+    updates.update(database, model, {"progress": progress, "message": "Working."})
+  nose.tools.assert_equal(database.saves, 1)
+  nose.tools.assert_equal(database.document["progress"], 0.1)
+  nose.tools.assert_equal(model["progress"], 0.4)
+  nose.tools.assert_equal(updates.statistics()["pending"], 1)
+
+  # Someone else changes the model, then a state transition saves immediately, along with buffered progress.
+  other = database["m"]
+  other["name"] = "renamed"
+  other["artifact-types"]["a"] = "json"
+  database.save(other)
+  model["artifact-types"]["b"] = "hdf5"
+  model["input-artifacts"] = ["b"]
+  updates.save(database, model, [("artifact-types", "b"), "input-artifacts"])
+  updates.update(database, model, {"state": "finished"})
+  nose.tools.assert_equal(database.document["name"], "renamed")
+  nose.tools.assert_equal(database.document["artifact-types"], {"a": "json", "b": "hdf5"})
+  nose.tools.assert_equal(database.document["input-artifacts"], ["b"])
+  nose.tools.assert_equal(database.document["progress"], 0.4)
+  nose.tools.assert_equal(database.document["state"], "finished")
+  nose.tools.assert_equal(model, database.document)
+  nose.tools.assert_equal(updates.statistics()["conflicts"], 1)
+  nose.tools.assert_equal(updates.statistics()["pending"], 0)
+
+  # Buffered updates are eventually saved in the background.
+  updates.interval = 0.05
+  time.sleep(0.05)
+  updates.update(database, model, {"progress": 1.0})
+  updates.update(database, model, {"message": "Done."})
+  nose.tools.assert_equal(database.document["message"], "Working.")
+  time.sleep(0.5)
+  nose.tools.assert_equal(database.document["message"], "Done.")
+
+def test_slycat_web_server_model_updates_background():
+  import couchdb.http
+  class Database(object):
+    def __init__(self, *documents):
+      self.documents = dict([(document["_id"], document) for document in documents])
+      self.gets = 0
+    def __getitem__(self, id):
+      self.gets += 1
+      return copy.deepcopy(self.documents[id])
+    def save(self, document):
+      if document["_rev"] != self.documents[document["_id"]]["_rev"]:
+        raise couchdb.http.ResourceConflict()
+      document["_rev"] += 1
+      self.documents[document["_id"]] = copy.deepcopy(document)
+  class ModelUpdates(slycat.web.server.ModelUpdates):
+    def _save(self, database, model, fields):
+      if model["_id"] == "b":
+        time.sleep(0.2)
+      slycat.web.server.ModelUpdates._save(self, database, model, fields)
+
+  database = Database({"_id": "a", "_rev": 1, "progress": 0.0}, {"_id": "b", "_rev": 1, "progress": 0.0})
+  updates = ModelUpdates(interval=0.3)
+  a = database["a"]
+  b = database["b"]
+  updates.update(database, a, {"progress": 0.1})
+  updates.update(database, a, {"progress": 0.2})
+
+  # A slow, immediate save of another model doesn't stop buffered updates from being saved.
+  worker = threading.Thread(target=updates.update, args=(database, b, {"state": "finished"}))
+  worker.start()
+  time.sleep(0.1)
+  updates.update(database, a, {"progress": 0.4})
+  worker.join()
+  time.sleep(0.5)
+  nose.tools.assert_equal(database.documents["a"]["progress"], 0.4)
+  nose.tools.assert_equal(database.documents["b"]["state"], "finished")
+
+  # Background saves only copy the new revision back to the caller's model, and don't fetch the model unless there's a conflict.
+  nose.tools.assert_equal(a["_rev"], database.documents["a"]["_rev"])
+  nose.tools.assert_equal(updates.statistics()["pending"], 0)
+  nose.tools.assert_equal(database.gets, 2)
+
+  updates.update(database, a, {"progress": 0.5})
+  other = database["a"]
+  other["name"] = "renamed"
+  database.save(other)
+  updates.update(database, a, {"progress": 0.6})
+  time.sleep(0.5)
+  nose.tools.assert_equal(database.documents["a"]["progress"], 0.6)
+  nose.tools.assert_equal(database.documents["a"]["name"], "renamed")
+  nose.tools.assert_equal(database.gets, 4)
+
+def test_slycat_web_server_hyperslice_indices():
+  for hyperslice in [(Ellipsis,), (slice(1, 3),), (1,), (Ellipsis, 2), (slice(None, None, -2), slice(1, 4)), (2, slice(0, 3), Ellipsis)]:
+    for dimension in range(2):
+      numpy.testing.assert_array_equal(slycat.web.server.hyperslice_indices((4, 5), dimension, hyperslice), numpy.indices((4, 5))[dimension][hyperslice])
+
+def test_slycat_web_server_binary_hyperslice_reader():
+  import io
+  import StringIO
+  with h5py.File(os.path.join(tempfile.mkdtemp(), "test.hdf5"), "w") as file:
+    array = slycat.hdf5.start_arrayset(file).start_array(0, [{"name":"i", "end":6}, {"name":"j", "end":5}], [{"name":"a", "type":"int32"}, {"name":"b", "type":"float64"}, {"name":"c", "type":"string"}])
+    expected = numpy.arange(30, dtype="int32").reshape((6, 5))
+    content = expected.astype(">i4").tostring() + expected[1:4, 1:5:2].astype(">f8").tostring() + expected[2, :].astype(">f8").tostring()
+    for data in [StringIO.StringIO(content), io.BytesIO(content)]:
+      reader = slycat.web.server.BinaryHypersliceReader(data, "big", block_size=24)
+      reader.store(array, 0, (Ellipsis,))
+      reader.store(array, 1, (slice(1, 4), slice(1, 5, 2)))
+      reader.store(array, 1, (2, Ellipsis))
+      nose.tools.assert_equal(reader.bytes, len(content))
+      numpy.testing.assert_array_equal(array.get_data(0)[...], expected)
+      numpy.testing.assert_array_equal(array.get_data(1)[1:4, 1:5:2], expected[1:4, 1:5:2])
+      numpy.testing.assert_array_equal(array.get_data(1)[2], expected[2])
+      with nose.tools.assert_raises_regexp(ValueError, "Expected 8 bytes"):
+        reader.store(array, 1, (0, 0))
+    with nose.tools.assert_raises_regexp(ValueError, "can't be stored"):
+      reader.store(array, 2, (Ellipsis,))
+
+def test_slycat_web_server_evaluator():
+  class Array(object):
+    ndim = 1
+    shape = (6,)
+    data = [numpy.array([5, 3, 8, 1, 9, 2]), numpy.array([0, 1, 0, 1, 0, 1])]
+    reads = []
+    def get_data(self, attribute):
+      array = self
+      class Storage(object):
+        def __getitem__(self, hyperslice):
+          array.reads.append((attribute, hyperslice))
+          return array.data[attribute][hyperslice]
+      return Storage()
+    def get_encoding(self, attribute):
+      return None
+    def get_bitmap(self, attribute, operator, value):
+      return None
+    def get_sort_index(self, attribute, descending=False):
+      self.reads.append(("sort", attribute))
+      return slycat.hdf5.argsort(self.data[attribute], descending)
+
+  def evaluate(evaluator, expression, hyperslice=None, order=None):
+    return evaluator.evaluate(Array(), 0, slycat.hyperchunks.parse("0/%s/..." % expression)[0].attributes[0], hyperslice, None if order is None else slycat.hyperchunks.parse("0/a0/order:%s/..." % order)[0].order)
+
+  evaluator = slycat.web.server.Evaluator()
+  numpy.testing.assert_array_equal(evaluate(evaluator, "a0 > 4 and a1 == 0"), [True, False, True, False, True, False])
+  numpy.testing.assert_array_equal(evaluate(evaluator, "index(0)", (slice(2, 4),)), [2, 3])
+  numpy.testing.assert_array_equal(evaluate(evaluator, "rank(a0, \"desc\")"), [4, 2, 0, 1, 5, 3])
+  nose.tools.assert_equal(Array.reads, [(0, Ellipsis), (1, Ellipsis), ("sort", 0)])
+
+  # Without an order, plain slices are pushed-down to the file ...
+  Array.reads = []
+  evaluator = slycat.web.server.Evaluator()
+  numpy.testing.assert_array_equal(evaluate(evaluator, "a0", (slice(1, 3),)), [3, 8])
+  numpy.testing.assert_array_equal(evaluate(evaluator, "a0 in [1, 3]", (slice(1, 4),)), [True, False, True])
+  nose.tools.assert_equal(Array.reads, [(0, (slice(1, 3),)), (0, (slice(1, 4),))])
+
+  # ... otherwise, attributes and sort indices are read once and reused for every hyperslice.
+  Array.reads = []
+  numpy.testing.assert_array_equal(evaluate(evaluator, "a1", (slice(0, 2),), "rank(a0, \"asc\")"), [1, 1])
+  numpy.testing.assert_array_equal(evaluate(evaluator, "a1", (slice(2, 4),), "rank(a0, \"asc\")"), [1, 0])
+  numpy.testing.assert_array_equal(evaluate(evaluator, "a0", (slice(2, 4),)), [8, 1])
+  nose.tools.assert_equal(Array.reads, [(1, Ellipsis), ("sort", 0), (0, (slice(2, 4),))])
+
+def test_slycat_web_server_evaluator_dictionary_encoding():
+  with h5py.File(os.path.join(tempfile.mkdtemp(), "test.hdf5"), "w") as file:
+    array = slycat.hdf5.start_arrayset(file).start_array(0, [dict(name="i", end=6)], [dict(name="a", type="string"), dict(name="b", type="string")], storage={"a":"dictionary"})
+    values = numpy.array(["red", "blue", "red", "green", "blue", "red"])
+    array.set_data(0, Ellipsis, values)
+    array.set_data(1, Ellipsis, values)
+    array.update_cache()
+
+    def evaluate(expression, hyperslice=None):
+      return slycat.web.server.Evaluator().evaluate(array, 0, slycat.hyperchunks.parse("0/%s/..." % expression)[0].attributes[0], hyperslice)
+
+    # Encoded and plain attributes give the same results.
+    for expression in ["%s in [\"blue\", \"green\", \"purple\"]", "%s not in [\"blue\"]", "%s in [\"red\"] or %s in [\"green\"]"]:
+      expected = evaluate(expression.replace("%s", "a1"))
+      numpy.testing.assert_array_equal(evaluate(expression.replace("%s", "a0")), expected)
+      numpy.testing.assert_array_equal(evaluate(expression.replace("%s", "a0"), (slice(2, 5),)), expected[2:5])
+    numpy.testing.assert_array_equal(evaluate("a0"), values)
+    numpy.testing.assert_array_equal(evaluate("rank(a0, \"asc\")"), evaluate("rank(a1, \"asc\")"))
+
+def test_slycat_web_server_evaluator_bitmap_index():
+  with h5py.File(os.path.join(tempfile.mkdtemp(), "test.hdf5"), "w") as file:
+    array = slycat.hdf5.start_arrayset(file).start_array(0, [dict(name="i", end=1000)], [dict(name="a", type="float64"), dict(name="b", type="string"), dict(name="c", type="float64"), dict(name="d", type="string")], storage={"a":"bitmap", "b":"bitmap"})
+    numbers = numpy.random.RandomState(0).normal(size=1000)
+    strings = numpy.array(["red", "green", "blue"])[numpy.arange(1000) % 3]
+    for attribute, values in enumerate([numbers, strings, numbers, strings]):
+      array.set_data(attribute, Ellipsis, values)
+    array.update_cache()
+
+    def evaluate(expression, hyperslice=None):
+      evaluator = slycat.web.server.Evaluator()
+      return evaluator.evaluate(array, 0, slycat.hyperchunks.parse("0/%s/..." % expression)[0].attributes[0], hyperslice), evaluator
+
+    # Indexed and plain attributes give the same results, using bitmaps whenever every attribute in a conjunction or disjunction is indexed.
+    for expression, bitmaps in [("a0 > 0.5 and a1 in [\"red\", \"blue\"]", 2), ("a0 < -1 or a0 >= 1 or a1 not in [\"red\"]", 3), ("a0 > 0.5 and a3 in [\"red\"]", 1)]:
+      expected, evaluator = evaluate(expression.replace("a0", "a2").replace("a1", "a3"))
+      nose.tools.assert_equal(set(evaluator._bitmaps.values()), set([None]))
+      result, evaluator = evaluate(expression)
+      numpy.testing.assert_array_equal(result, expected)
+      nose.tools.assert_equal(len([bitmap for bitmap in evaluator._bitmaps.values() if bitmap is not None]), bitmaps)
+      numpy.testing.assert_array_equal(evaluate(expression, (slice(10, 20),))[0], expected[10:20])
+
+def test_slycat_web_server_encode_table_chunk():
+  chunk = {
+    "rows": [3, 1, 2],
+    "columns": [0, 1, 2, 3],
+    "column-names": ["a", "b", "c", "Index"],
+    "sort": [(3, "descending")],
+    "data": [numpy.array([1.5, numpy.nan, -2.0]), numpy.array([7, 8, 9], dtype="int32"), numpy.array(["foo", "", u"\u00e9t\u00e9"], dtype="object"), numpy.array([3, 1, 2])],
+    }
+  for byteorder in ["little", "big"]:
+    content = slycat.web.server.handlers.encode_table_chunk(chunk, ["float64", "int32", "string", "int64"], byteorder)
+    header_length = numpy.fromstring(content[0:4], dtype="<u4" if byteorder == "little" else ">u4")[0]
+    header = json.loads(content[4 : 4 + header_length])
+    nose.tools.assert_equal(header["column-types"], ["float64", "int32", "string", "float64"])
+    nose.tools.assert_equal((4 + header_length) % 8, 0)
+    for buffers in header["buffers"]:
+      for buffer in buffers.values():
+        nose.tools.assert_true(buffer is None or buffer[0] % 8 == 0)
+    validity = header["buffers"][0]["validity"]
+    nose.tools.assert_equal(numpy.unpackbits(numpy.fromstring(content[4 + header_length + validity[0]:][:validity[1]], dtype="uint8"))[:3].tolist(), [1, 0, 1])
+    nose.tools.assert_equal(header["buffers"][1]["validity"], None)
+
+    result = slycat.web.client.decode_table_chunk(content, byteorder)
+    nose.tools.assert_equal(result["rows"], [3, 1, 2])
+    nose.tools.assert_equal(result["column-names"], ["a", "b", "c", "Index"])
+    nose.tools.assert_equal(result["sort"], [[3, "descending"]])
+    numpy.testing.assert_array_equal(result["data"][0], [1.5, numpy.nan, -2.0])
+    numpy.testing.assert_array_equal(result["data"][1], [7, 8, 9])
+    nose.tools.assert_equal(result["data"][2].tolist(), ["foo", "", u"\u00e9t\u00e9"])
+    numpy.testing.assert_array_equal(result["data"][3], [3, 1, 2])
+
+def test_slycat_web_client_encode_arrayset_data():
+  import cgi
+  import StringIO
+  chunks = [numpy.arange(10, dtype="float64"), numpy.arange(6, dtype="int32").reshape((2, 3))]
+  body = list(slycat.web.client.encode_multipart("boundary", [("hyperchunks", "0/0/...;0/1/...")], "data", slycat.web.client.encode_arrayset_data(iter(chunks), True, block_size=16)))
+  nose.tools.assert_true(max([len(block) for block in body[2:-1]]) <= 16)
+  form = cgi.FieldStorage(fp=StringIO.StringIO("".join(body)), environ={"REQUEST_METHOD":"POST", "CONTENT_TYPE":"multipart/form-data; boundary=boundary"})
+  nose.tools.assert_equal(form["hyperchunks"].value, "0/0/...;0/1/...")
+  nose.tools.assert_equal(form["data"].value, "".join([chunk.tostring() for chunk in chunks]))
+
+  body = slycat.web.client.StreamingBody(iter(["abc", "", "defgh", "ij"]), 10)
+  nose.tools.assert_equal(len(body), 10)
+  nose.tools.assert_equal([body.read(4), body.read(4), body.read(4), body.read(4)], ["abcd", "efgh", "ij", ""])
+
+  nose.tools.assert_equal(json.loads("".join(slycat.web.client.encode_arrayset_data(chunks, False))), [chunk.tolist() for chunk in chunks])
+  with nose.tools.assert_raises(ValueError):
+    list(slycat.web.client.encode_arrayset_data([numpy.array(["a"])], True))
+
+def test_slycat_web_server_get_model_arrayset_data_slow_consumer():
+  slycat.web.server.hdf5.path.root = tempfile.mkdtemp()
+  with slycat.web.server.hdf5.create("0123456789abcdef") as file:
+    arrayset = slycat.hdf5.start_arrayset(file)
+    array = arrayset.start_array(0, [dict(name="i", end=4)], [dict(name="a", type="float64"), dict(name="b", type="float64")])
+    array.set_data(0, slice(0, 4), numpy.arange(4))
+    array.set_data(1, slice(0, 4), numpy.arange(4, 8))
+  model = {"artifact:data" : "0123456789abcdef"}
+
+  buffer_size = slycat.web.server.get_model_arrayset_data.buffer_size
+  slycat.web.server.get_model_arrayset_data.buffer_size = 1
+  try:
+    # Start reading, then stall as if the client were slow to drain the socket ...
+    data = slycat.web.server.get_model_arrayset_data(None, model, "data", "0/0|1/...")
+    numpy.testing.assert_array_equal(next(data), [0, 1, 2, 3])
+
+    # ... concurrent readers and writers must not be blocked.
+    finished = threading.Event()
+    def writer():
+      with slycat.web.server.hdf5.open("0123456789abcdef", "r+") as file:
+        finished.set()
+    thread = threading.Thread(target=writer)
+    thread.start()
+    nose.tools.assert_true(finished.wait(5))
+    thread.join()
+    numpy.testing.assert_array_equal(next(slycat.web.server.get_model_arrayset_data(None, model, "data", "0/1/...")), [4, 5, 6, 7])
+
+    numpy.testing.assert_array_equal(next(data), [4, 5, 6, 7])
+    nose.tools.assert_equal(list(data), [])
+  finally:
+    slycat.web.server.get_model_arrayset_data.buffer_size = buffer_size
@@ -102,6 +102,59 @@ function cast_array_buffer(buffer, type, offset, count)
     console.error("Unknown array buffer type: " + type);
 }
 
+// Decode a UTF-8 encoded Uint8Array into a string.
+function decode_utf8(bytes)
+{
+  if(window.TextDecoder !== undefined)
+    return new TextDecoder("utf-8").decode(bytes);
+  var result = "";
+  for(var i = 0; i != bytes.length; ++i)
+    result += String.fromCharCode(bytes[i]);
+  return decodeURIComponent(escape(result));
+}
+
+// Decode a binary table chunk, retrieved from /models/(mid)/tables/(name)/arrays/(array)/chunk
+// using the byteorder query parameter.  Returns the same structure as the JSON representation,
+// except that numeric columns are typed arrays that share storage with the buffer, and missing
+// values are NaN rather than null.  Use table_chunk_is_valid() to test for missing values.
+function decode_table_chunk(buffer)
+{
+  var element_sizes = {"int8":1, "int16":2, "int32":4, "uint8":1, "uint16":2, "uint32":4, "float32":4, "float64":8};
+  var header_length = new DataView(buffer, 0, 4).getUint32(0, is_little_endian());
+  var header = JSON.parse(decode_utf8(new Uint8Array(buffer, 4, header_length)));
+  var base = 4 + header_length;
+
+  var result = {"rows":header.rows, "columns":header.columns, "column-names":header["column-names"], "sort":header.sort, "data":[], "validity":[]};
+  for(var i = 0; i != header.buffers.length; ++i)
+  {
+    var type = header["column-types"][i];
+    var buffers = header.buffers[i];
+    if(type == "string")
+    {
+      var offsets = new Uint32Array(buffer, base + buffers.offsets[0], buffers.offsets[1] / 4);
+      var characters = new Uint8Array(buffer, base + buffers.data[0], buffers.data[1]);
+      var values = [];
+      for(var j = 0; j + 1 < offsets.length; ++j)
+        values.push(decode_utf8(characters.subarray(offsets[j], offsets[j + 1])));
+      result.data.push(values);
+    }
+    else
+    {
+      result.data.push(cast_array_buffer(buffer, type, (base + buffers.data[0]) / element_sizes[type], buffers.data[1] / element_sizes[type]));
+    }
+    result.validity.push(buffers.validity ? new Uint8Array(buffer, base + buffers.validity[0], buffers.validity[1]) : null);
+  }
+  return result;
+}
+
+// Return true if a value in a decoded table chunk isn't missing.  Note that row is the position of
+// the value within the chunk, not the table.
+function table_chunk_is_valid(chunk, column, row)
+{
+  var validity = chunk.validity[column];
+  return validity === null || ((validity[row >> 3] >> (7 - (row & 7))) & 1) == 1;
+}
+
 // Retrieve an array attribute asynchronously, calling a callback when it's ready ...
 function get_model_array_attribute(parameters) {
   var dfd = $.Deferred();
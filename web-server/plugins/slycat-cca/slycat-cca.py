@@ -7,7 +7,7 @@ def register_slycat_plugin(context):
   import slycat.cca
   import slycat.web.server
   import slycat.web.server.database.couchdb
-  import threading
+  import slycat.web.server.scheduler
   import traceback
 
   def compute(mid):
@@ -47,7 +47,7 @@ def register_slycat_plugin(context):
 
       # Compute the CCA ...
       slycat.web.server.update_model(database, model, message="Computing CCA.")
-      x, y, x_loadings, y_loadings, r, wilks = slycat.cca.cca(X, Y, scale_inputs=scale_inputs)
+      x, y, x_loadings, y_loadings, r, wilks = slycat.web.server.scheduler.compute(slycat.cca.cca, X, Y, scale_inputs=scale_inputs)
       slycat.web.server.update_model(database, model, progress=0.75)
 
       slycat.web.server.update_model(database, model, message="Storing results.")
@@ -83,6 +83,9 @@ def register_slycat_plugin(context):
 
       slycat.web.server.update_model(database, model, state="finished", result="succeeded", finished=datetime.datetime.utcnow().isoformat(), progress=1.0, message="")
 
+    except slycat.web.server.scheduler.Cancelled:
+      cherrypy.log.error("CCA model %s cancelled." % mid)
+
     except:
       cherrypy.log.error("%s" % traceback.format_exc())
 
@@ -91,9 +94,8 @@ def register_slycat_plugin(context):
       slycat.web.server.update_model(database, model, state="finished", result="failed", finished=datetime.datetime.utcnow().isoformat(), message=traceback.format_exc())
 
   def finish(database, model):
-    """Called to finish the model.  This function must return immediately, so the actual work is done in a separate thread."""
-    thread = threading.Thread(name="Compute CCA Model", target=compute, kwargs={"mid" : model["_id"]})
-    thread.start()
+    """Called to finish the model.  This function must return immediately, so the actual work is done by the scheduler."""
+    slycat.web.server.scheduler.submit(compute, kwargs={"mid" : model["_id"]}, name="Compute CCA Model", key=model["_id"])
 
   def html(database, model):
     # At the moment, the CCA client UI is still hard-coded into the server.
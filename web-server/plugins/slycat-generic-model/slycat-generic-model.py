@@ -5,7 +5,7 @@ def register_slycat_plugin(context):
   import os
   import slycat.web.server.database.couchdb
   import slycat.web.server
-  import threading
+  import slycat.web.server.scheduler
   import traceback
 
   def compute(mid):
@@ -26,9 +26,8 @@ def register_slycat_plugin(context):
       slycat.web.server.update_model(database, model, state="finished", result="failed", finished=datetime.datetime.utcnow().isoformat(), message=traceback.format_exc())
 
   def finish(database, model):
-    """Called to finish the model.  This function must return immediately, so the actual work is done in a separate thread."""
-    thread = threading.Thread(name="Compute Generic Model", target=compute, kwargs={"mid" : model["_id"]})
-    thread.start()
+    """Called to finish the model.  This function must return immediately, so the actual work is done by the scheduler."""
+    slycat.web.server.scheduler.submit(compute, kwargs={"mid" : model["_id"]}, name="Compute Generic Model", key=model["_id"])
 
   def html(database, model):
     """Add the HTML representation of the model to the context object."""
@@ -53,10 +53,9 @@ def register_slycat_plugin(context):
       slycat.web.server.update_model(database, model, state="finished", result="failed", finished=datetime.datetime.utcnow().isoformat(), message=traceback.format_exc())
 
   def finish_model(database, model):
-    """Called to finish the model.  This function must return immediately, so the actual work is done in a separate thread."""
-    import threading
-    thread = threading.Thread(name="Compute Linear Regression Demo Model", target=compute, kwargs={"mid" : model["_id"]})
-    thread.start()
+    """Called to finish the model.  This function must return immediately, so the actual work is done by the scheduler."""
+    import slycat.web.server.scheduler
+    slycat.web.server.scheduler.submit(compute, kwargs={"mid" : model["_id"]}, name="Compute Linear Regression Demo Model", key=model["_id"])
 
   def model_html(database, model):
     return open(os.path.join(os.path.dirname(__file__), "ui.html"), "r").read()
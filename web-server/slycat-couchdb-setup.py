@@ -66,6 +66,14 @@ design = {
           if(doc["type"] == "hdf5")
           {
             emit(doc["_id"], 0);
+            links = doc["links"];
+            if(links)
+            {
+              for(var i = 0; i != links.length; ++i)
+              {
+                emit(links[i], 1);
+              }
+            }
           }
           else if(doc["type"] == "model")
           {